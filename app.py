@@ -21,22 +21,46 @@ import email
 import imaplib
 from email.header import decode_header
 import socket
+import threading
 
 # Import the invoice scanner
 from invoice_scanner import InvoiceScanner, InvoiceDatabase
 
 # Import utility modules
 from utils.database import (
-    get_db_connection, check_and_update_schema, initialize_shadow_table, 
-    initialize_tables, check_invoice_exists, save_to_pending, update_pending_invoice
+    get_db_connection, check_invoice_exists, save_to_pending, update_pending_invoice,
+    configure_db_pool, find_duplicate_invoice, get_pending_blobs, PENDING_BLOB_COLUMNS, PENDING_ALL_BLOB_COLUMNS,
+    PendingWriteBuffer
 )
+from utils.normalize import normalize_invoice_number, normalize_date_iso, typed_invoice_values
+from utils.backfill import start_backfill_thread
 from utils.file_utils import (
     sanitize_filename, allowed_file, cleanup_uploaded_files, 
     organize_file, cleanup_processed_files, check_for_duplicate_invoice,
-    _parse_amount
+    _parse_amount, FilePathStorage, compute_file_hash
 )
 from utils.ai_utils import select_ai_model
 from utils.processing.invoice_processor import process_invoice_file
+from utils.scheduler import extraction_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from utils.singleflight import extraction_flight
+from utils.retry_queue import RetryWorker, list_retries, list_dead_letters, redrive_dead_letters, delete_dead_letter
+from utils.hot_folder import HotFolderWatcher, record_result as record_hot_folder_result
+from utils.migrations import run_migrations
+from utils.finalize import finalize_validated_files
+from utils.archive_worker import ArchiveWorker
+from utils.name_resolver import name_resolver, get_or_create_supplier_id, get_or_create_company_id
+from utils.search import search_invoices
+from utils.pagination import ListQuery, PaginationError
+from utils.document_store import get_text_stats, index_invoice_texts
+from utils.compaction import CompactionWorker
+from utils.query_stats import query_stats, parse_bool
+from utils.backup import BackupScheduler, BackupError, list_snapshots
+from utils.worker_lock import try_worker_lock
+from utils.sharding import ShardRouter
+from utils.batches import (
+    create_batch as register_batch, record_batch_files, set_batch_status, get_batch, list_batches,
+    add_batch_queue_file
+)
 
 # Import email functions
 from utils.email_utils import (
@@ -84,6 +108,27 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'invoice-app-dev-key')
 app.config['EMAIL_SESSION_TIMEOUT'] = 3600  # 1 hour
 app.config['EMAIL_ATTACHMENTS_FOLDER'] = email_attachments_dir
 app.config['LEXOFFICE_FOLDER'] = lexoffice_dir
+app.config['EXTRACTION_WORKERS'] = int(os.environ.get('EXTRACTION_WORKERS', 2))
+app.config['BULK_MIN_SHARE'] = float(os.environ.get('BULK_MIN_SHARE', 0.2))
+app.config['HOT_FOLDERS'] = [d for d in os.environ.get('HOT_FOLDERS', '').split(os.pathsep) if d]
+app.config['RETRY_MAX_ATTEMPTS'] = int(os.environ.get('RETRY_MAX_ATTEMPTS', 5))  # 0 disables the retry queue
+app.config['RETRY_BASE_DELAY'] = int(os.environ.get('RETRY_BASE_DELAY', 30))  # seconds, doubled per attempt
+app.config['RETRY_MAX_DELAY'] = int(os.environ.get('RETRY_MAX_DELAY', 1800))
+app.config['COMPACTION_INTERVAL'] = int(os.environ.get('COMPACTION_INTERVAL', 6 * 3600))  # seconds, 0 disables
+app.config['COMPACTION_FINALIZED_AGE_DAYS'] = int(os.environ.get('COMPACTION_FINALIZED_AGE_DAYS', 1))
+app.config['COMPACTION_REJECTED_AGE_DAYS'] = int(os.environ.get('COMPACTION_REJECTED_AGE_DAYS', 30))
+app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR', os.path.join(app_root_dir, 'backups'))
+app.config['BACKUP_INTERVAL'] = int(os.environ.get('BACKUP_INTERVAL', 24 * 3600))  # seconds, 0 disables
+app.config['BACKUP_KEEP'] = int(os.environ.get('BACKUP_KEEP', 7))  # snapshots kept
+app.config['QUERY_STATS'] = os.environ.get('QUERY_STATS', '').lower() in ('1', 'true', 'yes')  # opt-in SQL timing
+app.config['QUERY_SLOW_MS'] = float(os.environ.get('QUERY_SLOW_MS', 100))  # statements slower than this get a plan
+app.config['SHARD_BY_COMPANY'] = os.environ.get('SHARD_BY_COMPANY', '').lower() in ('1', 'true', 'yes')
+app.config['SHARD_DIR'] = os.environ.get('SHARD_DIR', os.path.join(app_root_dir, 'shards'))  # one database per company
+app.config['SHARD_WORKERS'] = int(os.environ.get('SHARD_WORKERS', 8))  # threads for cross-company queries
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 8))
+app.config['DB_CACHE_SIZE_KB'] = int(os.environ.get('DB_CACHE_SIZE_KB', 20000))
+app.config['DB_MMAP_SIZE'] = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+app.config['DB_BUSY_TIMEOUT_MS'] = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
 
 # Add 'now' variable to all templates
 @app.context_processor
@@ -119,10 +164,61 @@ for directory in [
     os.makedirs(directory, exist_ok=True)
     log.info(f"Created directory: {directory}")
 
-# Initialize the database
-initialize_shadow_table(app.config['DATABASE'])
-check_and_update_schema(db_path=app.config['DATABASE'])
-initialize_tables(app.config['DATABASE'])
+# Configure the extraction scheduler shared by uploads and imports
+extraction_scheduler.configure(
+    workers=app.config['EXTRACTION_WORKERS'],
+    bulk_min_share=app.config['BULK_MIN_SHARE']
+)
+
+# Configure the pooled SQLite connections (WAL mode, tuned PRAGMAs)
+configure_db_pool(
+    pool_size=app.config['DB_POOL_SIZE'],
+    cache_size=-app.config['DB_CACHE_SIZE_KB'],
+    mmap_size=app.config['DB_MMAP_SIZE'],
+    busy_timeout=app.config['DB_BUSY_TIMEOUT_MS']
+)
+
+# Opt-in statement timing for /api/admin/query-stats
+query_stats.configure(enabled=app.config['QUERY_STATS'], slow_ms=app.config['QUERY_SLOW_MS'])
+
+# Create or upgrade the database schema (a no-op once up to date)
+run_migrations(app.config['DATABASE'])
+
+# Optional per-company invoice databases; the main database becomes the catalog
+shard_router = None
+if app.config['SHARD_BY_COMPANY']:
+    shard_router = ShardRouter(app.config['DATABASE'], app.config['SHARD_DIR'], max_workers=app.config['SHARD_WORKERS'])
+    shard_router.migrate()
+    log.info(f"Per-company shards enabled in {app.config['SHARD_DIR']}")
+
+def _invoice_db_path(invoice_id):
+    """Database holding a finalized invoice (None for an ID of an unknown shard)"""
+    return shard_router.path_for_invoice(invoice_id) if shard_router else app.config['DATABASE']
+
+def _invoice_page(conn, args, where=None, params=None):
+    """One page of INVOICE_LIST, merged across the company shards when enabled"""
+    if shard_router:
+        return INVOICE_LIST.page_merged(get_db_connection, shard_router.shard_paths(), args, where, params,
+                                        map_func=shard_router.map)
+    return INVOICE_LIST.page(conn, args, where, params)
+
+def _scan_invoice(file_path, store_in_db=False):
+    """Extract invoice data with a scanner whose database connection is returned afterwards"""
+    with InvoiceScanner(app.config['DATABASE'], app.config['ARCHIVE_DIR']) as scanner:
+        return scanner.extract_invoice_data(file_path, store_in_db=store_in_db)
+
+def _finalize_validated(conn, batch_id, validated_files):
+    """Finalize validated pending invoices and leave conn in a write transaction for the caller to commit
+
+    With shards the invoices are written to their companies' databases (and
+    committed) first; conn then only carries the caller's own updates.
+    """
+    if shard_router:
+        result = shard_router.finalize(batch_id, validated_files)
+        conn.execute('BEGIN IMMEDIATE')
+        return result
+    conn.execute('BEGIN IMMEDIATE')
+    return finalize_validated_files(conn, batch_id, validated_files)
 
 # Main routes start here
 @app.route('/')
@@ -225,8 +321,7 @@ def upload_file():
             skip_duplicate_check = True
             
             # We're going to extract the invoice data first to get the invoice number
-            scanner = InvoiceScanner(app.config['DATABASE'], app.config['ARCHIVE_DIR'])
-            extracted_data = scanner.extract_invoice_data(temp_file_path, store_in_db=False)
+            extracted_data = extraction_scheduler.run(PRIORITY_INTERACTIVE, _scan_invoice, temp_file_path)
             
             # Make a quick check for duplicates before proceeding
             invoice_number = None
@@ -237,7 +332,8 @@ def upload_file():
                 
             if invoice_number and invoice_number not in ['Unknown', 'Not found', 'Nicht gefunden', '']:
                 # Check if this invoice number exists
-                exists = check_invoice_exists(invoice_number, app.config['DATABASE'])
+                supplier_name = extracted_data.get('supplier_name') or extracted_data.get('Lieferantename')
+                exists = check_invoice_exists(invoice_number, app.config['DATABASE'], supplier_name)
                 if exists:
                     log.info(f"Duplicate invoice caught during final validation: {invoice_number}")
                     
@@ -289,8 +385,8 @@ def upload_file():
             # Only check for duplicates if not using pre-validated file
             lambda file_path: {} if skip_duplicate_check else check_for_duplicate_invoice(
                 file_path, 
-                lambda x: check_invoice_exists(x, app.config['DATABASE']),
-                lambda file_path, **kwargs: InvoiceScanner(app.config['DATABASE'], app.config['ARCHIVE_DIR']).extract_invoice_data(file_path, store_in_db=False)
+                lambda x, supplier_name=None: check_invoice_exists(x, app.config['DATABASE'], supplier_name),
+                lambda file_path, **kwargs: _scan_invoice(file_path)
             ), 
             select_ai_model,
             lambda data, batch_id=None, source_info=None: save_to_pending(data, batch_id, source_info, db_path=app.config['DATABASE']),
@@ -325,6 +421,17 @@ def upload_file():
                 response_data['extracted_data'] = result.get('form_data')
             
             return jsonify(response_data)
+        elif result.get('status') == 'queued_for_retry':
+            # Extraction failed transiently - it will be retried in the background
+            return jsonify({
+                'success': True,
+                'queued_for_retry': True,
+                'message': 'AI extraction is temporarily unavailable - the invoice will be processed automatically',
+                'retry_id': result.get('retry_id'),
+                'next_attempt_at': result.get('next_attempt_at'),
+                'file_path': result.get('file_path', ''),
+                'preview_path': result.get('preview_path', '')
+            }), 202
         else:
             # Handle duplicate check
             if result.get('is_duplicate', False):
@@ -367,38 +474,44 @@ def get_dashboard_stats():
     """Get dashboard statistics"""
     conn = get_db_connection(app.config['DATABASE'])
     try:
-        # Get total number of invoices
-        cursor = conn.execute('SELECT COUNT(*) AS total FROM invoices')
-        total_invoices = cursor.fetchone()['total']
-        
-        # Get total number of pending invoices
-        cursor = conn.execute('SELECT COUNT(*) AS total FROM pending_invoices')
-        total_pending = cursor.fetchone()['total']
-        
-        # Get total number of suppliers (using JOIN with suppliers table)
-        cursor = conn.execute('SELECT COUNT(DISTINCT supplier_id) AS total FROM invoices')
-        total_suppliers = cursor.fetchone()['total']
-        
-        # Get total number of companies (using JOIN with companies table)
-        cursor = conn.execute('SELECT COUNT(DISTINCT company_id) AS total FROM invoices')
-        total_companies = cursor.fetchone()['total']
-        
-        # Get total amount of all invoices
-        cursor = conn.execute('SELECT SUM(CAST(REPLACE(REPLACE(amount_original, ",", "."), "€", "") AS REAL)) AS total_amount FROM invoices')
-        total_amount = cursor.fetchone()['total_amount'] or 0
-        
-        # Get average amount
-        cursor = conn.execute('SELECT AVG(CAST(REPLACE(REPLACE(amount_original, ",", "."), "€", "") AS REAL)) AS avg_amount FROM invoices')
-        average_amount = cursor.fetchone()['avg_amount'] or 0
-        
-        # Get count of invoices needing manual input
-        cursor = conn.execute('SELECT COUNT(*) AS total FROM pending_invoices WHERE needs_manual_input = 1')
-        needs_manual = cursor.fetchone()['total']
-        
-        # Get recent uploads (processed today)
+        # Counters are maintained by triggers (see utils/migrations), so this is one row
         today = datetime.now().strftime('%Y-%m-%d')
-        cursor = conn.execute('SELECT COUNT(*) AS total FROM invoices WHERE processed_at LIKE ?', (f'{today}%',))
-        recent_uploads = cursor.fetchone()['total']
+        stats = conn.execute('''
+            SELECT s.*,
+                   (SELECT invoice_count FROM dashboard_daily_uploads WHERE day = ?) AS recent_uploads
+            FROM dashboard_stats s WHERE s.id = 1
+        ''', (today,)).fetchone()
+        
+        total_invoices = stats['invoice_count'] if stats else 0
+        total_pending = stats['pending_count'] if stats else 0
+        total_suppliers = stats['supplier_count'] if stats else 0
+        total_companies = stats['company_count'] if stats else 0
+        total_amount = (stats['amount_cents_sum'] if stats else 0) / 100
+        average_amount = round(stats['amount_cents_sum'] / stats['amount_count'] / 100, 2) if stats and stats['amount_count'] else 0
+        needs_manual = stats['needs_manual_count'] if stats else 0
+        recent_uploads = (stats['recent_uploads'] if stats else None) or 0
+        
+        # Optional upload histogram for the last N days
+        days = request.args.get('days', 0, type=int)
+        uploads_by_day = None
+        if shard_router:
+            # Pending counts live in the catalog; invoice counters are summed over the shards
+            since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d') if days > 0 else None
+            totals = shard_router.dashboard_totals(today, since)
+            total_invoices = totals['invoice_count']
+            total_suppliers = totals['supplier_count']
+            total_companies = totals['company_count']
+            total_amount = totals['amount_cents_sum'] / 100
+            average_amount = round(totals['amount_cents_sum'] / totals['amount_count'] / 100, 2) if totals['amount_count'] else 0
+            recent_uploads = totals['recent_uploads']
+            uploads_by_day = totals['uploads_by_day']
+        elif days > 0:
+            since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+            uploads_by_day = {
+                row['day']: row['invoice_count'] for row in conn.execute(
+                    'SELECT day, invoice_count FROM dashboard_daily_uploads WHERE day >= ? ORDER BY day', (since,)
+                ).fetchall()
+            }
         
         # Return stats
         return jsonify({
@@ -411,7 +524,8 @@ def get_dashboard_stats():
                 'total_amount': total_amount,
                 'average_amount': average_amount,
                 'needs_manual_input': needs_manual,
-                'recent_uploads': recent_uploads
+                'recent_uploads': recent_uploads,
+                **({'uploads_by_day': uploads_by_day} if uploads_by_day is not None else {})
             }
         })
     except Exception as e:
@@ -422,24 +536,13 @@ def get_dashboard_stats():
 
 @app.route('/api/files')
 def get_files():
-    """Get all files in the system"""
+    """Get the files of finalized invoices (paginated like /api/invoices)"""
     conn = get_db_connection(app.config['DATABASE'])
     try:
-        # Use JOIN to get supplier and company names from their respective tables
-        cursor = conn.execute('''
-            SELECT i.id, i.file_path, i.original_path, 
-                   s.name AS supplier_name,
-                   i.invoice_number, i.invoice_date, 
-                   i.amount_original, i.vat_amount_original,
-                   c.name AS company_name, 
-                   i.description, i.processed_at AS created_at, i.processed_at AS updated_at
-            FROM invoices i
-            LEFT JOIN suppliers s ON i.supplier_id = s.id
-            LEFT JOIN companies c ON i.company_id = c.id
-            ORDER BY i.processed_at DESC
-        ''')
-        files = [dict(row) for row in cursor.fetchall()]
-        return jsonify({'success': True, 'files': files})
+        page = _invoice_page(conn, request.args)
+        return _page_response('files', page)
+    except PaginationError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         log.error(f"Error getting files: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -474,9 +577,124 @@ def get_suppliers():
     finally:
         conn.close()
 
+@app.route('/api/invoices/search')
+def search_invoices_route():
+    """Ranked full-text search over invoice numbers, names, descriptions and document text"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'success': False, 'error': 'Missing search query (q)'}), 400
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        
+        if shard_router:
+            found = shard_router.search(query, limit, offset)
+        else:
+            found = search_invoices(app.config['DATABASE'], query, limit, offset)
+        return jsonify({
+            'success': True,
+            'query': query,
+            'total': found['total'],
+            'limit': limit,
+            'offset': offset,
+            'results': found['results']
+        })
+    except Exception as e:
+        log.error(f"Error searching invoices: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Finalized invoices as listed by /api/invoices and /api/files
+INVOICE_LIST = ListQuery(
+    from_clause='''
+        FROM invoices i
+        LEFT JOIN suppliers s ON i.supplier_id = s.id
+        LEFT JOIN companies c ON i.company_id = c.id
+    ''',
+    columns={
+        'id': 'i.id',
+        'file_path': 'i.file_path',
+        'original_path': 'i.original_path',
+        'supplier_name': 's.name',
+        'invoice_number': 'i.invoice_number',
+        'invoice_date': 'i.invoice_date',
+        'amount_original': 'i.amount_original',
+        'vat_amount_original': 'i.vat_amount_original',
+        'company_name': 'c.name',
+        'description': 'i.description',
+        'created_at': 'i.processed_at',
+        'updated_at': 'i.processed_at',
+        'amount_cents': 'i.amount_cents',
+        'currency': 'i.currency',
+        'invoice_date_iso': 'i.invoice_date_iso'
+    },
+    sort_keys={
+        'created_at': "COALESCE(i.processed_at, '')",
+        'invoice_date': "COALESCE(i.invoice_date_iso, '')",
+        'invoice_number': "COALESCE(i.invoice_number, '')",
+        'amount': "COALESCE(i.amount_cents, '')",
+        'id': 'i.id'
+    },
+    default_sort='created_at',
+    id_column='i.id',
+    default_fields=['id', 'file_path', 'original_path', 'supplier_name', 'invoice_number', 'invoice_date',
+                    'amount_original', 'vat_amount_original', 'company_name', 'description',
+                    'created_at', 'updated_at']
+)
+
+# Pending invoices as listed by /api/pending-invoices and /api/invoices?status=pending
+PENDING_LIST = ListQuery(
+    from_clause='FROM pending_invoices',
+    columns={
+        'id': 'id',
+        'batch_id': 'batch_id',
+        'file_path': 'file_path',
+        'original_path': 'original_path',
+        'preview_path': 'preview_path',
+        'supplier_name': 'supplier_name',
+        'invoice_number': 'invoice_number',
+        'invoice_date': 'invoice_date',
+        'amount_original': 'amount_original',
+        'vat_amount_original': 'vat_amount_original',
+        'company_name': 'company_name',
+        'description': 'description',
+        'needs_manual_input': 'needs_manual_input',
+        'validation_status': 'validation_status',
+        'is_finalized': 'is_finalized',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at'
+    },
+    sort_keys={
+        'created_at': "COALESCE(created_at, '')",
+        'invoice_date': "COALESCE(invoice_date, '')",
+        'invoice_number': "COALESCE(invoice_number, '')",
+        'id': 'id'
+    },
+    default_sort='created_at',
+    id_column='id',
+    default_fields=['id', 'batch_id', 'file_path', 'original_path', 'preview_path', 'supplier_name',
+                    'invoice_number', 'invoice_date', 'amount_original', 'vat_amount_original', 'company_name',
+                    'description', 'needs_manual_input', 'validation_status', 'created_at', 'updated_at']
+)
+
+def _page_response(key, page):
+    """JSON body for one page of a list endpoint"""
+    body = {
+        'success': True,
+        key: page['items'],
+        'next_cursor': page['next_cursor'],
+        'has_more': page['has_more']
+    }
+    if 'total' in page:
+        body['total'] = page['total']
+    return jsonify(body)
+
 @app.route('/api/invoices')
 def get_invoices():
-    """Get all invoices, with optional filtering"""
+    """Get invoices with optional filtering, sorting and keyset pagination
+    
+    Query parameters: limit, cursor (next_cursor of the previous page),
+    sort/order, fields (comma-separated) and count=true for a total.
+    """
     conn = get_db_connection(app.config['DATABASE'])
     try:
         # Get query parameters
@@ -488,78 +706,53 @@ def get_invoices():
         invoice_id = request.args.get('id', '')
         needs_manual = request.args.get('needs_manual', '').lower() == 'true'
         
-        # Build query
-        query = ''
+        where = []
         params = []
         
         if status == 'pending':
-            query = '''
-                SELECT id, file_path, original_path, supplier_name, invoice_number, invoice_date, 
-                      amount_original, vat_amount_original, company_name, description, created_at, updated_at, needs_manual_input
-                FROM pending_invoices 
-                WHERE 1=1
-            '''
-            
             # Add filters for pending invoices
             if supplier:
-                query += ' AND supplier_name LIKE ?'
+                where.append('supplier_name LIKE ?')
                 params.append(f'%{supplier}%')
             if company:
-                query += ' AND company_name LIKE ?'
+                where.append('company_name LIKE ?')
                 params.append(f'%{company}%')
             if date_from:
-                query += ' AND invoice_date >= ?'
+                where.append('invoice_date >= ?')
                 params.append(date_from)
             if date_to:
-                query += ' AND invoice_date <= ?'
+                where.append('invoice_date <= ?')
                 params.append(date_to)
             if needs_manual:
-                query += ' AND (needs_manual_input = 1 OR needs_manual_input = "true")'
+                where.append('(needs_manual_input = 1 OR needs_manual_input = "true")')
             if invoice_id:
-                query += ' AND id = ?'
+                where.append('id = ?')
                 params.append(invoice_id)
-                
-            # Add order by
-            query += ' ORDER BY created_at DESC'
-        else:
-            query = '''
-                SELECT i.id, i.file_path, i.original_path, 
-                       s.name AS supplier_name,
-                       i.invoice_number, i.invoice_date, 
-                       i.amount_original, i.vat_amount_original,
-                       c.name AS company_name, 
-                       i.description, i.processed_at AS created_at, i.processed_at AS updated_at
-                FROM invoices i
-                LEFT JOIN suppliers s ON i.supplier_id = s.id
-                LEFT JOIN companies c ON i.company_id = c.id
-                WHERE 1=1
-            '''
             
+            page = PENDING_LIST.page(conn, request.args, where, params)
+        else:
             # Add filters for regular invoices
             if supplier:
-                query += ' AND s.name LIKE ?'
+                where.append('s.name LIKE ?')
                 params.append(f'%{supplier}%')
             if company:
-                query += ' AND c.name LIKE ?'
+                where.append('c.name LIKE ?')
                 params.append(f'%{company}%')
             if date_from:
-                query += ' AND i.invoice_date >= ?'
-                params.append(date_from)
+                where.append('i.invoice_date_iso >= ?')
+                params.append(normalize_date_iso(date_from) or date_from)
             if date_to:
-                query += ' AND i.invoice_date <= ?'
-                params.append(date_to)
+                where.append('i.invoice_date_iso <= ?')
+                params.append(normalize_date_iso(date_to) or date_to)
             if invoice_id:
-                query += ' AND i.id = ?'
+                where.append('i.id = ?')
                 params.append(invoice_id)
-                
-            # Add order by
-            query += ' ORDER BY i.processed_at DESC'
-        
-        # Execute query
-        cursor = conn.execute(query, params)
-        invoices = [dict(row) for row in cursor.fetchall()]
+            
+            page = _invoice_page(conn, request.args, where, params)
         
-        return jsonify({'success': True, 'invoices': invoices})
+        return _page_response('invoices', page)
+    except PaginationError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         log.error(f"Error getting invoices: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -568,38 +761,31 @@ def get_invoices():
 
 @app.route('/api/pending-invoices')
 def get_pending_invoices():
-    """Get pending invoices with optional filtering"""
+    """Get pending invoices with optional filtering, sorting and keyset pagination"""
     conn = get_db_connection(app.config['DATABASE'])
     try:
         # Get query parameters
         batch_id = request.args.get('batch_id', '')
         needs_manual = request.args.get('needs_manual', '').lower() == 'true'
+        near_duplicates = request.args.get('near_duplicates', '').lower() == 'true'
         
-        # Build query
-        query = '''
-            SELECT id, batch_id, file_path, preview_path, supplier_name, invoice_number, 
-                   invoice_date, amount_original, vat_amount_original, company_name, description, needs_manual_input,
-                   validation_status, created_at, updated_at
-            FROM pending_invoices 
-            WHERE 1=1
-        '''
+        where = []
         params = []
         
         if batch_id:
-            query += ' AND batch_id = ?'
+            where.append('batch_id = ?')
             params.append(batch_id)
         
         if needs_manual:
-            query += ' AND (needs_manual_input = 1 OR needs_manual_input = "true")'
-            
-        # Add order by
-        query += ' ORDER BY created_at DESC'
+            where.append('(needs_manual_input = 1 OR needs_manual_input = "true")')
         
-        # Execute query
-        cursor = conn.execute(query, params)
-        pending = [dict(row) for row in cursor.fetchall()]
+        if near_duplicates:
+            where.append('duplicate_score IS NOT NULL')
         
-        return jsonify({'success': True, 'pending_invoices': pending})
+        page = PENDING_LIST.page(conn, request.args, where, params)
+        return _page_response('pending_invoices', page)
+    except PaginationError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         log.error(f"Error getting pending invoices: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -608,16 +794,37 @@ def get_pending_invoices():
 
 @app.route('/api/pending/<int:pending_id>', methods=['GET'])
 def get_pending_invoice(pending_id):
-    """Get a specific pending invoice"""
+    """Get a specific pending invoice
+
+    The raw text, OCR text and extraction JSON are only returned when asked
+    for with include=raw_text,ocr_text,extracted_data (or include=all).
+    """
+    include = [name.strip() for name in request.args.get('include', '').split(',') if name.strip()]
+    if 'all' in include:
+        include = list(PENDING_BLOB_COLUMNS)
+    unknown = [name for name in include if name not in PENDING_BLOB_COLUMNS]
+    if unknown:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown include: {', '.join(unknown)} (allowed: {', '.join(PENDING_BLOB_COLUMNS)}, all)"
+        }), 400
+    
     conn = get_db_connection(app.config['DATABASE'])
     try:
-        cursor = conn.execute('SELECT * FROM pending_invoices WHERE id = ?', (pending_id,))
+        # Compacted rows stay readable (is_archived = 1) for audit
+        cursor = conn.execute('SELECT * FROM pending_invoices_all WHERE id = ?', (pending_id,))
         invoice = cursor.fetchone()
         
         if not invoice:
             return jsonify({'success': False, 'error': 'Invoice not found'}), 404
+        
+        invoice = {key: value for key, value in dict(invoice).items() if key not in PENDING_ALL_BLOB_COLUMNS}
+        if invoice.get('duplicate_candidates'):
+            invoice['duplicate_candidates'] = json.loads(invoice['duplicate_candidates'])
+        if include:
+            invoice.update(get_pending_blobs(conn, pending_id, include))
             
-        return jsonify({'success': True, 'invoice': dict(invoice)})
+        return jsonify({'success': True, 'invoice': invoice})
     except Exception as e:
         log.error(f"Error getting pending invoice: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -651,6 +858,27 @@ def validate_invoice(pending_id):
         if not data:
             return jsonify({'success': False, 'error': 'No data provided'}), 400
         
+        if shard_router:
+            # The invoice goes to its company's database; the reviewer's values are applied there
+            result = shard_router.finalize(None, [dict(data, pending_id=pending_id)])
+            if result['errors']:
+                error = result['errors'][0]
+                status = 409 if error.get('is_duplicate') else 404 if 'not found' in error['error'] else 400
+                return jsonify({
+                    'success': False,
+                    'error': error['error'],
+                    'is_duplicate': error.get('is_duplicate', False),
+                    'invoice_number': error.get('invoice_number')
+                }), status
+            finalized = result['finalized'][0]
+            if data.get('organize_file', True):
+                archive_worker.submit(finalized['invoice_id'], finalized['file_path'])
+            return jsonify({
+                'success': True,
+                'message': 'Invoice validated and finalized',
+                'invoice_id': finalized['invoice_id']
+            })
+        
         # First update the pending invoice with validation data
         update_data = {
             'supplier_name': data.get('supplier_name', ''),
@@ -678,40 +906,21 @@ def validate_invoice(pending_id):
         if not pending:
             return jsonify({'success': False, 'error': 'Invoice not found after update'}), 404
         
-        # Check for duplicate invoice number BEFORE database insertion
+        # Check for duplicate invoice number (for the same supplier) BEFORE database insertion
         invoice_number = data.get('invoice_number') or pending['invoice_number']
-        if invoice_number:
-            cursor = conn.execute('SELECT id FROM invoices WHERE invoice_number = ?', (invoice_number,))
-            existing = cursor.fetchone()
-            
-            if existing:
-                return jsonify({
-                    'success': False,
-                    'error': f'Invoice number {invoice_number} already exists in database',
-                    'is_duplicate': True,
-                    'invoice_number': invoice_number
-                }), 409
-        
-        # Get or create supplier and company
-        supplier_id = None
         supplier_name = data.get('supplier_name') or pending['supplier_name']
-        cursor = conn.execute('SELECT id FROM suppliers WHERE name = ?', (supplier_name,))
-        supplier = cursor.fetchone()
-        if supplier:
-            supplier_id = supplier['id']
-        else:
-            cursor.execute('INSERT INTO suppliers (name) VALUES (?)', (supplier_name,))
-            supplier_id = cursor.lastrowid
+        if invoice_number and find_duplicate_invoice(conn, invoice_number, supplier_name) is not None:
+            return jsonify({
+                'success': False,
+                'error': f'Invoice number {invoice_number} already exists in database',
+                'is_duplicate': True,
+                'invoice_number': invoice_number
+            }), 409
         
-        company_id = None
+        # Get or create supplier and company
+        supplier_id = get_or_create_supplier_id(conn, supplier_name)
         company_name = data.get('company_name') or pending['company_name']
-        cursor = conn.execute('SELECT id FROM companies WHERE name = ?', (company_name,))
-        company = cursor.fetchone()
-        if company:
-            company_id = company['id']
-        else:
-            cursor.execute('INSERT INTO companies (name) VALUES (?)', (company_name,))
-            company_id = cursor.lastrowid
+        company_id = get_or_create_company_id(conn, company_name)
         
         # Store raw extracted values only, no normalization or conversion
         amount_extracted_raw = data.get('amount_original') or pending['amount_original']
@@ -731,37 +940,62 @@ def validate_invoice(pending_id):
         if file_path and app.config['TEMP_FOLDER'] in file_path:
             temp_file_to_clean = file_path
         
+        # Typed copies of the amounts and date for aggregation and range filters
+        invoice_date = data.get('invoice_date') or pending['invoice_date']
+        typed = typed_invoice_values(amount_str, vat_amount_str, invoice_date)
+        texts = conn.execute(
+            'SELECT raw_text_hash, ocr_text_hash FROM pending_invoice_blobs WHERE pending_id = ?', (pending_id,)
+        ).fetchone()
+        
         # Now insert into invoices table
-        cursor.execute('''
-            INSERT INTO invoices (
-                file_path, original_path, invoice_number, invoice_date, due_date, normalized_date,
-                amount_original, vat_amount_original, description, supplier_id, company_id,
-                confidence, ocr_text, raw_text, processed_at, source_info,
-                amount_extracted_raw, vat_amount_extracted_raw
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            file_path,
-            original_path,
-            invoice_number,
-            data.get('invoice_date') or pending['invoice_date'],
-            data.get('due_date') or pending['due_date'],
-            data.get('normalized_date') or pending['normalized_date'],
-            amount_str,
-            vat_amount_str,
-            data.get('description') or pending['description'],
-            supplier_id,
-            company_id,
-            None,  # confidence
-            None,  # ocr_text
-            None,  # raw_text
-            datetime.now().isoformat(),
-            'Validated by human',
-            amount_extracted_raw,
-            vat_amount_extracted_raw
-        ))
+        try:
+            cursor.execute('''
+                INSERT INTO invoices (
+                    file_path, original_path, invoice_number, invoice_number_key, invoice_date, due_date, normalized_date,
+                    amount_original, vat_amount_original, description, supplier_id, company_id,
+                    confidence, ocr_text_hash, raw_text_hash, processed_at, source_info,
+                    amount_extracted_raw, vat_amount_extracted_raw,
+                    amount_cents, vat_cents, currency, invoice_date_iso, file_hash
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                file_path,
+                original_path,
+                invoice_number,
+                normalize_invoice_number(invoice_number),
+                invoice_date,
+                data.get('due_date') or pending['due_date'],
+                data.get('normalized_date') or pending['normalized_date'],
+                amount_str,
+                vat_amount_str,
+                data.get('description') or pending['description'],
+                supplier_id,
+                company_id,
+                None,  # confidence
+                texts['ocr_text_hash'] if texts else None,
+                texts['raw_text_hash'] if texts else None,
+                datetime.now().isoformat(),
+                'Validated by human',
+                amount_extracted_raw,
+                vat_amount_extracted_raw,
+                typed['amount_cents'],
+                typed['vat_cents'],
+                typed['currency'],
+                typed['invoice_date_iso'],
+                pending['file_hash']
+            ))
+        except sqlite3.IntegrityError:
+            # Another request finalized the same invoice number for this supplier first
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': f'Invoice number {invoice_number} already exists in database',
+                'is_duplicate': True,
+                'invoice_number': invoice_number
+            }), 409
         
         # Get the ID of the new invoice
         invoice_id = cursor.lastrowid
+        index_invoice_texts(conn, [invoice_id])
         
         # Mark pending as finalized
         cursor.execute('''
@@ -837,9 +1071,15 @@ def validate_invoice(pending_id):
 @app.route('/api/batch/create', methods=['POST'])
 def create_batch():
     """Create a new batch for multiple uploads"""
+    conn = get_db_connection(app.config['DATABASE'])
     try:
         # Generate a unique batch ID
         batch_id = str(uuid.uuid4())
+        data = request.get_json(silent=True) or {}
+        
+        # File counts grow as files are uploaded to the batch
+        register_batch(conn, batch_id, name=data.get('name'))
+        conn.commit()
         
         return jsonify({
             'success': True,
@@ -849,6 +1089,39 @@ def create_batch():
     except Exception as e:
         log.error(f"Error creating batch: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/batches', methods=['GET'])
+def get_batches():
+    """List recent batches with their counters"""
+    conn = get_db_connection(app.config['DATABASE'])
+    try:
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        return jsonify({
+            'success': True,
+            'batches': list_batches(conn, limit, request.args.get('status'))
+        })
+    except Exception as e:
+        log.error(f"Error listing batches: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/batch/<batch_id>', methods=['GET'])
+def get_batch_status(batch_id):
+    """Get a batch's status and counters"""
+    conn = get_db_connection(app.config['DATABASE'])
+    try:
+        batch = get_batch(conn, batch_id)
+        if not batch:
+            return jsonify({'success': False, 'error': f'Batch {batch_id} not found'}), 404
+        return jsonify({'success': True, 'batch': batch})
+    except Exception as e:
+        log.error(f"Error getting batch {batch_id}: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        conn.close()
 
 @app.route('/api/batch/<batch_id>/upload', methods=['POST'])
 def batch_upload_file(batch_id):
@@ -877,8 +1150,8 @@ def batch_upload_file(batch_id):
             lambda: conn,
             lambda file_path: check_for_duplicate_invoice(
                 file_path, 
-                lambda x: check_invoice_exists(x, app.config['DATABASE']),
-                lambda file_path, **kwargs: InvoiceScanner(app.config['DATABASE'], app.config['ARCHIVE_DIR']).extract_invoice_data(file_path)
+                lambda x, supplier_name=None: check_invoice_exists(x, app.config['DATABASE'], supplier_name),
+                lambda file_path, **kwargs: _scan_invoice(file_path, store_in_db=True)
             ),
             select_ai_model,
             lambda data, batch=None, source=None: save_to_pending(data, batch, source, db_path=app.config['DATABASE']),
@@ -887,9 +1160,14 @@ def batch_upload_file(batch_id):
             source='batch_upload'
         )
         
+        is_duplicate = result.get('is_duplicate', False)
+        failed = not result['success'] and not is_duplicate and result.get('status') != 'queued_for_retry'
+        record_batch_files(conn, batch_id, files=1, failed=int(failed), duplicates=int(is_duplicate))
+        
+        queue_id = None
         if result['success']:
             # Add to batch queue
-            cursor = conn.execute('''
+            queue_id = conn.execute('''
                 INSERT INTO batch_queue (
                     batch_id, file_path, preview_path, filename, status, pending_id, position
                 ) VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -901,11 +1179,10 @@ def batch_upload_file(batch_id):
                 'pending',
                 result['pending_id'],
                 position
-            ))
-            conn.commit()
-            
-            queue_id = cursor.lastrowid
-            
+            )).lastrowid
+        conn.commit()
+        
+        if result['success']:
             return jsonify({
                 'success': True,
                 'message': 'File uploaded to batch successfully',
@@ -917,6 +1194,16 @@ def batch_upload_file(batch_id):
                 'filename': file.filename,
                 'position': position
             })
+        elif result.get('status') == 'queued_for_retry':
+            return jsonify({
+                'success': True,
+                'queued_for_retry': True,
+                'message': 'AI extraction is temporarily unavailable - the invoice will be processed automatically',
+                'batch_id': batch_id,
+                'retry_id': result.get('retry_id'),
+                'next_attempt_at': result.get('next_attempt_at'),
+                'filename': file.filename
+            }), 202
         else:
             # Check for duplicate
             if result.get('is_duplicate', False):
@@ -944,22 +1231,33 @@ def batch_upload_file(batch_id):
     finally:
         conn.close()
 
+# Pending invoice fields shown with each file of a batch
+BATCH_FILE_PENDING_COLUMNS = ['supplier_name', 'invoice_number', 'invoice_date', 'amount_original', 'vat_amount_original']
+
 @app.route('/api/batch/<batch_id>/files', methods=['GET'])
 def get_batch_files(batch_id):
     """Get all files in a batch"""
     conn = get_db_connection(app.config['DATABASE'])
     try:
-        cursor = conn.execute('''
-            SELECT batch_queue.*, pending_invoices.supplier_name, pending_invoices.invoice_number,
-                   pending_invoices.invoice_date, pending_invoices.amount_original, pending_invoices.vat_amount_original
-            FROM batch_queue 
-            LEFT JOIN pending_invoices ON batch_queue.pending_id = pending_invoices.id
-            WHERE batch_queue.batch_id = ?
-            ORDER BY batch_queue.position ASC
-        ''', (batch_id,))
-        
+        cursor = conn.execute(
+            'SELECT * FROM batch_queue WHERE batch_id = ? ORDER BY position ASC', (batch_id,)
+        )
         files = [dict(row) for row in cursor.fetchall()]
         
+        # Finalized rows of older batches may have been compacted into the archive. The
+        # view is read by ID: joined, SQLite would materialise all of it.
+        pending_ids = list({f['pending_id'] for f in files if f['pending_id'] is not None})
+        pending = {}
+        for start in range(0, len(pending_ids), 500):
+            chunk = pending_ids[start:start + 500]
+            pending.update((row['id'], row) for row in conn.execute(f'''
+                SELECT id, {', '.join(BATCH_FILE_PENDING_COLUMNS)} FROM pending_invoices_all
+                WHERE id IN ({', '.join('?' * len(chunk))})
+            ''', chunk).fetchall())
+        for f in files:
+            row = pending.get(f['pending_id'])
+            f.update({column: row[column] if row else None for column in BATCH_FILE_PENDING_COLUMNS})
+        
         return jsonify({'success': True, 'files': files})
     except Exception as e:
         log.error(f"Error getting batch files: {str(e)}")
@@ -1817,65 +2115,59 @@ def process_email_attachments():
         batch_id = str(uuid.uuid4())
         log.info(f"Processing email batch {batch_id} with {len(attachment_paths)} attachments")
         
-        # Process files one by one
+        # Process files one by one; pending rows are written in groups as they accumulate
         results = []
-        
-        for idx, file_path in enumerate(attachment_paths):
-            if not os.path.exists(file_path):
-                results.append({
-                    'file_path': file_path,
-                    'success': False,
-                    'error': 'File not found'
-                })
-                continue
+        with PendingWriteBuffer(app.config['DATABASE']) as pending_buffer:
+            for idx, file_path in enumerate(attachment_paths):
+                if not os.path.exists(file_path):
+                    results.append({
+                        'file_path': file_path,
+                        'success': False,
+                        'error': 'File not found'
+                    })
+                    continue
+                    
+                if not allowed_file(file_path):
+                    results.append({
+                        'file_path': file_path,
+                        'success': False,
+                        'error': 'Invalid file type. Only PDF files are supported.'
+                    })
+                    continue
                 
-            if not allowed_file(file_path):
-                results.append({
-                    'file_path': file_path,
-                    'success': False,
-                    'error': 'Invalid file type. Only PDF files are supported.'
-                })
-                continue
-            
-            # Create source info from email data
-            source_info = {
-                'source': 'email',
-                'from_email': from_emails[idx] if idx < len(from_emails) else None,
-                'email_id': email_ids[idx] if idx < len(email_ids) else None
-            }
-            
-            # Create a file storage-like object for the existing file
-            class FilePathStorage:
-                def __init__(self, path):
-                    self.path = path
-                    self.filename = os.path.basename(path)
+                # Create source info from email data
+                source_info = {
+                    'source': 'email',
+                    'from_email': from_emails[idx] if idx < len(from_emails) else None,
+                    'email_id': email_ids[idx] if idx < len(email_ids) else None
+                }
                 
-                def save(self, target_path):
-                    shutil.copy2(self.path, target_path)
-            
-            file_storage = FilePathStorage(file_path)
-            
-            # Process the file using the same processing logic as uploads
-            # This ensures the same validation workflow
-            result = process_invoice_file(
-                file_storage,
-                app.config, 
-                lambda: get_db_connection(app.config['DATABASE']),
-                lambda file_path: check_for_duplicate_invoice(
-                    file_path, 
-                    lambda x: check_invoice_exists(x, app.config['DATABASE']),
-                    lambda file_path, **kwargs: InvoiceScanner(app.config['DATABASE'], app.config['ARCHIVE_DIR']).extract_invoice_data(file_path, store_in_db=False)
-                ), 
-                select_ai_model,
-                lambda data, batch=None, source=None: save_to_pending(data, batch, source, db_path=app.config['DATABASE']),
-                InvoiceScanner,
-                batch_id=batch_id,
-                source='email_import',
-                source_info=source_info
-            )
-            
-            # Add the result
-            results.append(result)
+                # Create a file storage-like object for the existing file
+                file_storage = FilePathStorage(file_path)
+                
+                # Process the file using the same processing logic as uploads
+                # This ensures the same validation workflow
+                result = process_invoice_file(
+                    file_storage,
+                    app.config, 
+                    lambda: get_db_connection(app.config['DATABASE']),
+                    lambda file_path: check_for_duplicate_invoice(
+                        file_path, 
+                        lambda x, supplier_name=None: check_invoice_exists(x, app.config['DATABASE'], supplier_name),
+                        lambda file_path, **kwargs: _scan_invoice(file_path)
+                    ), 
+                    select_ai_model,
+                    pending_buffer.save,
+                    InvoiceScanner,
+                    batch_id=batch_id,
+                    source='email_import',
+                    source_info=source_info
+                )
+                
+                # Add the result
+                results.append(result)
+        
+        results = pending_buffer.resolve(results)
         
         # Create a mapping of which email IDs had successful processing
         email_success_map = {}
@@ -1883,7 +2175,8 @@ def process_email_attachments():
             if idx < len(email_ids):
                 email_id = email_ids[idx]
                 if email_id not in email_success_map:
-                    email_success_map[email_id] = result.get('success', False)
+                    # Attachments queued for retry are accepted - they will be processed later
+                    email_success_map[email_id] = result.get('success', False) or result.get('status') == 'queued_for_retry'
         
         return jsonify({
             'success': True,
@@ -2157,10 +2450,168 @@ def get_system_status():
         if conn:
             conn.close()
 
+@app.route('/api/scheduler-stats')
+def get_scheduler_stats():
+    """Get extraction queue depth and per-priority queue latency"""
+    try:
+        return jsonify({
+            'success': True,
+            'scheduler': extraction_scheduler.get_stats(),
+            'single_flight': extraction_flight.get_stats(),
+            'name_cache': name_resolver.get_stats()
+        })
+    except Exception as e:
+        log.error(f"Error getting scheduler stats: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/document-text-stats')
+def get_document_text_stats():
+    """Get stored document text volume and compression ratio"""
+    conn = get_db_connection(app.config['DATABASE'])
+    try:
+        return jsonify({'success': True, 'document_texts': get_text_stats(conn)})
+    except Exception as e:
+        log.error(f"Error getting document text stats: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/admin/shards', methods=['GET'])
+def get_shards():
+    """Company to database routing with invoice counts per shard"""
+    if not shard_router:
+        return jsonify({'success': True, 'enabled': False, 'shards': []})
+    try:
+        return jsonify({'success': True, 'enabled': True, 'shards': shard_router.list_shards()})
+    except Exception as e:
+        log.error(f"Error listing shards: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/query-stats', methods=['GET'])
+def get_query_stats():
+    """SQL statement timings by fingerprint, with query plans of slow statements"""
+    try:
+        return jsonify({
+            'success': True,
+            **query_stats.report(
+                sort=request.args.get('sort', 'total'),
+                limit=request.args.get('limit', 50, type=int)
+            )
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/admin/query-stats', methods=['POST'])
+def configure_query_stats():
+    """Enable/disable statement timing, change the slow threshold or reset the statistics"""
+    data = request.get_json(silent=True) or {}
+    try:
+        reset = parse_bool(data.get('reset', False))
+        query_stats.configure(enabled=data.get('enabled'), slow_ms=data.get('slow_ms'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid setting: {str(e)}'}), 400
+    if reset:
+        query_stats.reset()
+    return jsonify({'success': True, 'enabled': query_stats.enabled, 'slow_ms': query_stats.slow_ms})
+
+@app.route('/api/backups', methods=['GET'])
+def get_backups():
+    """List database snapshots (with shards, one per snapshot set) and the backup schedule status"""
+    try:
+        return jsonify({
+            'success': True,
+            'snapshots': list_snapshots(app.config['DATABASE'], app.config['BACKUP_DIR']),
+            'schedule': backup_scheduler.get_status()
+        })
+    except Exception as e:
+        log.error(f"Error listing backups: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/backups', methods=['POST'])
+def create_backup():
+    """Snapshot the database and its shards now (writers are not blocked while it runs)"""
+    try:
+        return jsonify({'success': True, 'snapshot': backup_scheduler.run_now()})
+    except BackupError as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    except Exception as e:
+        log.error(f"Error creating backup: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/extraction-retries')
+def get_extraction_retries():
+    """List extractions waiting for another attempt"""
+    try:
+        limit = request.args.get('limit', 100, type=int)
+        return jsonify({
+            'success': True,
+            'retries': list_retries(app.config['DATABASE'], limit)
+        })
+    except Exception as e:
+        log.error(f"Error listing extraction retries: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/dead-letters')
+def get_dead_letters():
+    """List extractions that failed permanently or ran out of retries"""
+    try:
+        limit = request.args.get('limit', 100, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        dead_letters, total = list_dead_letters(app.config['DATABASE'], limit, offset)
+        return jsonify({
+            'success': True,
+            'dead_letters': dead_letters,
+            'total': total
+        })
+    except Exception as e:
+        log.error(f"Error listing dead letters: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/dead-letters/redrive', methods=['POST'])
+@app.route('/api/dead-letters/<int:dead_letter_id>/redrive', methods=['POST'])
+def redrive_dead_letter(dead_letter_id=None):
+    """Send dead letters back to the retry queue (one, a list of ids, or all)"""
+    try:
+        if dead_letter_id is not None:
+            ids = [dead_letter_id]
+        else:
+            data = request.get_json(silent=True) or {}
+            ids = data.get('ids')
+        
+        retry_ids = redrive_dead_letters(app.config['DATABASE'], ids)
+        if dead_letter_id is not None and not retry_ids:
+            return jsonify({'success': False, 'error': 'Dead letter not found'}), 404
+        
+        if retry_worker:
+            retry_worker.wake()
+        return jsonify({
+            'success': True,
+            'retry_ids': retry_ids,
+            'message': f'{len(retry_ids)} extraction(s) queued for retry'
+        })
+    except Exception as e:
+        log.error(f"Error redriving dead letters: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/dead-letters/<int:dead_letter_id>', methods=['DELETE'])
+def discard_dead_letter(dead_letter_id):
+    """Discard a dead letter"""
+    try:
+        if not delete_dead_letter(app.config['DATABASE'], dead_letter_id):
+            return jsonify({'success': False, 'error': 'Dead letter not found'}), 404
+        return jsonify({'success': True})
+    except Exception as e:
+        log.error(f"Error deleting dead letter: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/invoice/<int:invoice_id>', methods=['PUT'])
 def update_invoice(invoice_id):
     """Update invoice information"""
-    conn = get_db_connection(app.config['DATABASE'])
+    db_path = _invoice_db_path(invoice_id)
+    if db_path is None:
+        return jsonify({'success': False, 'error': 'Invoice not found'}), 404
+    conn = get_db_connection(db_path)
+    in_shard = db_path != app.config['DATABASE']
     try:
         data = request.json
         if not data:
@@ -2176,34 +2627,50 @@ def update_invoice(invoice_id):
         if not invoice:
             return jsonify({'success': False, 'error': 'Invoice not found'}), 404
         
-        # Update supplier if needed
+        # Update supplier if needed (shards use the catalog's supplier IDs)
         supplier_id = invoice['supplier_id']
         if 'supplier_name' in data and data['supplier_name']:
-            cursor = conn.execute('SELECT id FROM suppliers WHERE name = ?', (data['supplier_name'],))
-            supplier = cursor.fetchone()
-            if supplier:
-                supplier_id = supplier['id']
+            if in_shard:
+                supplier_id = shard_router.resolve_name(conn, 'suppliers', data['supplier_name'])
             else:
-                # Create new supplier
-                cursor.execute('INSERT INTO suppliers (name) VALUES (?)', (data['supplier_name'],))
-                supplier_id = cursor.lastrowid
+                supplier_id = get_or_create_supplier_id(conn, data['supplier_name'])
         
         # Update company if needed
         company_id = invoice['company_id']
         if 'company_name' in data and data['company_name']:
-            cursor = conn.execute('SELECT id FROM companies WHERE name = ?', (data['company_name'],))
-            company = cursor.fetchone()
-            if company:
-                company_id = company['id']
+            if in_shard:
+                company_id = shard_router.resolve_name(conn, 'companies', data['company_name'])
+                if company_id != invoice['company_id']:
+                    conn.rollback()
+                    return jsonify({
+                        'success': False,
+                        'error': 'Invoices cannot be moved to another company while per-company databases are enabled'
+                    }), 400
             else:
-                # Create new company
-                cursor.execute('INSERT INTO companies (name) VALUES (?)', (data['company_name'],))
-                company_id = cursor.lastrowid
+                company_id = get_or_create_company_id(conn, data['company_name'])
         
         # Prepare update data
         update_fields = []
         params = []
         
+        # Keep the normalised key in sync (the supplier may have changed too)
+        invoice_number = data['invoice_number'] if 'invoice_number' in data else invoice['invoice_number']
+        invoice_number_key = normalize_invoice_number(invoice_number)
+        if invoice_number_key and conn.execute(
+            'SELECT 1 FROM invoices WHERE invoice_number_key = ? AND supplier_id IS ? AND id != ?',
+            (invoice_number_key, supplier_id, invoice_id)
+        ).fetchone() or (
+            shard_router and not shard_router.register_invoice(invoice_id, invoice_number_key, supplier_id, conn)
+        ):
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': f'Invoice number {invoice_number} already exists for this supplier',
+                'is_duplicate': True
+            }), 409
+        update_fields.append('invoice_number_key = ?')
+        params.append(invoice_number_key)
+        
         if 'invoice_number' in data:
             update_fields.append('invoice_number = ?')
             params.append(data['invoice_number'])
@@ -2223,6 +2690,17 @@ def update_invoice(invoice_id):
         if 'description' in data:
             update_fields.append('description = ?')
             params.append(data['description'])
+        
+        # Recompute the typed columns when the amounts or date change
+        if any(field in data for field in ('amount_original', 'vat_amount_original', 'invoice_date')):
+            typed = typed_invoice_values(
+                data.get('amount_original', invoice['amount_original']),
+                data.get('vat_amount_original', invoice['vat_amount_original']),
+                data.get('invoice_date', invoice['invoice_date'])
+            )
+            for column, value in typed.items():
+                update_fields.append(f'{column} = ?')
+                params.append(value)
             
         # Always update the supplier_id and company_id
         update_fields.append('supplier_id = ?')
@@ -2257,7 +2735,10 @@ def update_invoice(invoice_id):
 @app.route('/api/invoice/<int:invoice_id>', methods=['DELETE'])
 def delete_invoice(invoice_id):
     """Delete an invoice and its associated file"""
-    conn = get_db_connection(app.config['DATABASE'])
+    db_path = _invoice_db_path(invoice_id)
+    if db_path is None:
+        return jsonify({'success': False, 'error': 'Invoice not found'}), 404
+    conn = get_db_connection(db_path)
     try:
         # First get the file path from the invoice
         cursor = conn.execute('SELECT file_path FROM invoices WHERE id = ?', (invoice_id,))
@@ -2270,6 +2751,8 @@ def delete_invoice(invoice_id):
         
         # Delete from database
         conn.execute('DELETE FROM invoices WHERE id = ?', (invoice_id,))
+        if shard_router:
+            shard_router.forget_invoice(invoice_id, conn)
         conn.commit()
         
         # Delete file from filesystem if it exists
@@ -2319,70 +2802,83 @@ def batch_process_simple():
     batch_id = str(uuid.uuid4())
     log.info(f"Processing batch {batch_id} with {len(files)} files")
     
-    # Process files one by one
+    # Process files one by one; pending rows are written in groups as they accumulate
     processed_files = []
     duplicate_count = 0
     
     try:
-        for idx, file in enumerate(files):
-            if not allowed_file(file.filename):
-                processed_files.append({
-                    'filename': file.filename,
-                    'status': 'error',
-                    'error': 'Invalid file type. Only PDF files are supported.',
-                    'data': {}
-                })
-                continue
+        with PendingWriteBuffer(app.config['DATABASE']) as pending_buffer:
+            for idx, file in enumerate(files):
+                if not allowed_file(file.filename):
+                    processed_files.append({
+                        'filename': file.filename,
+                        'status': 'error',
+                        'error': 'Invalid file type. Only PDF files are supported.',
+                        'data': {}
+                    })
+                    continue
+                    
+                # Process the file using the centralized invoice processor
+                result = process_invoice_file(
+                    file, 
+                    app.config, 
+                    lambda: get_db_connection(app.config['DATABASE']),
+                    lambda file_path: check_for_duplicate_invoice(
+                        file_path, 
+                        lambda x, supplier_name=None: check_invoice_exists(x, app.config['DATABASE'], supplier_name),
+                        lambda file_path, **kwargs: _scan_invoice(file_path)
+                    ), 
+                    select_ai_model,
+                    pending_buffer.save,
+                    InvoiceScanner,
+                    batch_id=batch_id,
+                    source='batch_upload'
+                )
                 
-            # Process the file using the centralized invoice processor
-            result = process_invoice_file(
-                file, 
-                app.config, 
-                lambda: get_db_connection(app.config['DATABASE']),
-                lambda file_path: check_for_duplicate_invoice(
-                    file_path, 
-                    lambda x: check_invoice_exists(x, app.config['DATABASE']),
-                    lambda file_path, **kwargs: InvoiceScanner(app.config['DATABASE'], app.config['ARCHIVE_DIR']).extract_invoice_data(file_path, store_in_db=False)
-                ), 
-                select_ai_model,
-                lambda data, batch=None, source=None: save_to_pending(data, batch, source, db_path=app.config['DATABASE']),
-                InvoiceScanner,
-                batch_id=batch_id,
-                source='batch_upload'
-            )
-            
-            if result['success']:
-                # Format response for frontend consumption
-                processed_files.append({
-                    'filename': file.filename,
-                    'status': 'processed',
-                    'file_path': result['file_path'],
-                    'preview_path': result.get('preview_path', ''),
-                    'data': result['extracted_data'],
-                    'pending_id': result['pending_id']
-                })
-            elif result.get('is_duplicate', False):
-                # Handle duplicate
-                duplicate_count += 1
-                processed_files.append({
-                    'filename': file.filename,
-                    'status': 'duplicate',
-                    'is_duplicate': True,
-                    'duplicate_message': result.get('error', 'This invoice appears to be a duplicate'),
-                    'file_path': result.get('file_path', ''),
-                    'preview_path': result.get('preview_path', ''),
-                    'data': {}
-                })
-            else:
-                # Handle other errors
-                processed_files.append({
-                    'filename': file.filename,
-                    'status': 'error',
-                    'error': result.get('error', 'Error processing file'),
-                    'file_path': result.get('file_path', ''),
-                    'preview_path': result.get('preview_path', ''),
-                    'data': {}
-                })
+                if result['success']:
+                    # Format response for frontend consumption
+                    processed_files.append({
+                        'filename': file.filename,
+                        'status': 'processed',
+                        'file_path': result['file_path'],
+                        'preview_path': result.get('preview_path', ''),
+                        'data': result['extracted_data'],
+                        'pending_id': result['pending_id']
+                    })
+                elif result.get('is_duplicate', False):
+                    # Handle duplicate
+                    duplicate_count += 1
+                    processed_files.append({
+                        'filename': file.filename,
+                        'status': 'duplicate',
+                        'is_duplicate': True,
+                        'duplicate_message': result.get('error', 'This invoice appears to be a duplicate'),
+                        'file_path': result.get('file_path', ''),
+                        'preview_path': result.get('preview_path', ''),
+                        'data': {}
+                    })
+                elif result.get('status') == 'queued_for_retry':
+                    processed_files.append({
+                        'filename': file.filename,
+                        'status': 'queued_for_retry',
+                        'retry_id': result.get('retry_id'),
+                        'next_attempt_at': result.get('next_attempt_at'),
+                        'file_path': result.get('file_path', ''),
+                        'preview_path': result.get('preview_path', ''),
+                        'data': {}
+                    })
+                else:
+                    # Handle other errors
+                    processed_files.append({
+                        'filename': file.filename,
+                        'status': 'error',
+                        'error': result.get('error', 'Error processing file'),
+                        'file_path': result.get('file_path', ''),
+                        'preview_path': result.get('preview_path', ''),
+                        'data': {}
+                    })
+        
+        processed_files = pending_buffer.resolve(processed_files)
         
         # Return all processed files info
         log.info(f"Batch {batch_id} processing completed. {len(processed_files)} files processed, {duplicate_count} duplicates")
@@ -2420,75 +2916,37 @@ def save_validated_invoices():
                 'error': 'No invoices to save'
             }), 400
         
-        success_count = 0
-        failed_count = 0
+        # Validate all invoices in one transaction on this connection
+        result = _finalize_validated(conn, None, invoices)
+        conn.commit()
         
-        for invoice in invoices:
-            pending_id = invoice.get('pending_id')
-            if not pending_id:
-                failed_count += 1
-                continue
-                
-            try:
-                # First update the pending invoice with validated data
-                update_data = {
-                    'supplier_name': invoice.get('supplier_name', ''),
-                    'company_name': invoice.get('company_name', ''),
-                    'invoice_number': invoice.get('invoice_number', ''),
-                    'invoice_date': invoice.get('invoice_date', ''),
-                    'amount_original': invoice.get('amount_original', ''),
-                    'vat_amount_original': invoice.get('vat_amount_original', ''),
-                    'description': invoice.get('description', ''),
-                    'is_validated': True,
-                    'validated_at': datetime.now().isoformat(),
-                    'validation_status': 'validated'
-                }
-                
-                update_result = update_pending_invoice(pending_id, update_data, app.config['DATABASE'])
-                
-                if not update_result:
-                    failed_count += 1
-                    continue
-                    
-                # Then validate the invoice to move it to the main table
-                try:
-                    # Create a new request context for the validation route
-                    with app.test_request_context(
-                        f'/api/validate/{pending_id}',
-                        method='POST',
-                        data=json.dumps(update_data),
-                        content_type='application/json'
-                    ):
-                        # Call the validation route function directly
-                        validation_response = validate_invoice(pending_id)
-                        
-                        # Check if validation was successful
-                        if isinstance(validation_response, tuple):
-                            validation_data = validation_response[0]
-                            if isinstance(validation_data, dict) and validation_data.get('success'):
-                                success_count += 1
-                            else:
-                                failed_count += 1
-                        elif hasattr(validation_response, 'json'):
-                            validation_data = validation_response.json
-                            if validation_data.get('success'):
-                                success_count += 1
-                            else:
-                                failed_count += 1
-                        else:
-                            failed_count += 1
-                except Exception as val_error:
-                    log.error(f"Error validating invoice {pending_id}: {str(val_error)}")
-                    failed_count += 1
-            except Exception as e:
-                log.error(f"Error saving validated invoice {pending_id}: {str(e)}")
-                failed_count += 1
-                
+        # Archiving copies files around, so it runs after the response on the archive worker
+        if data.get('organize_file', True):
+            archive_worker.submit_many([(item['invoice_id'], item['file_path']) for item in result['finalized']])
+        
+        # Per-item results in request order
+        results = [
+            (item['index'], {'pending_id': item['pending_id'], 'success': True, 'invoice_id': item['invoice_id']})
+            for item in result['finalized']
+        ] + [
+            (error['index'], {
+                'pending_id': error['pending_id'],
+                'success': False,
+                'error': error['error'],
+                'is_duplicate': error.get('is_duplicate', False)
+            })
+            for error in result['errors']
+        ]
+        results = [entry for _, entry in sorted(results, key=lambda pair: pair[0])]
+        
+        success_count = len(result['finalized'])
+        failed_count = len(result['errors'])
         return jsonify({
             'success': True,
             'message': f'Saved {success_count} invoices, {failed_count} failed',
             'success_count': success_count,
-            'failed_count': failed_count
+            'failed_count': failed_count,
+            'results': results
         })
                 
     except Exception as e:
@@ -2554,8 +3012,7 @@ def validate_upload():
         extracted_data = None
         try:
             # Extract data from invoice to get the invoice number
-            scanner = InvoiceScanner(app.config['DATABASE'], app.config['ARCHIVE_DIR'])
-            extracted_data = scanner.extract_invoice_data(temp_file_path, store_in_db=False)
+            extracted_data = extraction_scheduler.run(PRIORITY_INTERACTIVE, _scan_invoice, temp_file_path)
             
             # Make sure we have all the necessary fields in a consistent format
             if extracted_data:
@@ -2583,7 +3040,8 @@ def validate_upload():
                 
             if invoice_number and invoice_number not in ['Unknown', 'Not found', 'Nicht gefunden', '']:
                 # Check if this invoice number exists
-                exists = check_invoice_exists(invoice_number, app.config['DATABASE'])
+                supplier_name = extracted_data.get('supplier_name') or extracted_data.get('Lieferantename')
+                exists = check_invoice_exists(invoice_number, app.config['DATABASE'], supplier_name)
                 if exists:
                     log.info(f"Duplicate invoice detected during validation: {invoice_number}")
                     # Clean up the temp file
@@ -2702,17 +3160,7 @@ def batch_upload_sequential():
     
     try:
         # Create batch entry
-        cursor = conn.execute('''
-            INSERT INTO batches (
-                id, name, file_count, status, created_at
-            ) VALUES (?, ?, ?, ?, ?)
-        ''', (
-            batch_id,
-            f"Batch {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-            len(files),
-            'processing',
-            datetime.now().isoformat()
-        ))
+        register_batch(conn, batch_id, file_count=len(files))
         conn.commit()
         
         # Process files in the batch for AI extraction only
@@ -2753,11 +3201,8 @@ def batch_upload_sequential():
                     lambda: conn,
                     lambda file_path: {} if skip_duplicate_check else check_for_duplicate_invoice(
                         file_path, 
-                        lambda x: check_invoice_exists(x, app.config['DATABASE']),
-                        lambda file_path, **kwargs: InvoiceScanner(
-                            app.config['DATABASE'], 
-                            app.config['ARCHIVE_DIR']
-                        ).extract_invoice_data(file_path, store_in_db=False)
+                        lambda x, supplier_name=None: check_invoice_exists(x, app.config['DATABASE'], supplier_name),
+                        lambda file_path, **kwargs: _scan_invoice(file_path)
                     ),
                     select_ai_model,
                     lambda data, batch=None, source=None: save_to_pending(
@@ -2803,9 +3248,14 @@ def batch_upload_sequential():
                         'filename': original_filename,
                         'error': result.get('error', 'Unknown error'),
                         'success': False,
-                        'is_duplicate': result.get('is_duplicate', False)
+                        'is_duplicate': result.get('is_duplicate', False),
+                        'queued_for_retry': result.get('status') == 'queued_for_retry'
                     })
                     log.warning(f"Failed to process file {original_filename} in batch: {result.get('error')}")
+                    if result.get('status') != 'queued_for_retry':
+                        is_duplicate = result.get('is_duplicate', False)
+                        record_batch_files(conn, batch_id, failed=int(not is_duplicate), duplicates=int(is_duplicate))
+                        conn.commit()
             except Exception as e:
                 log.error(f"Error processing batch file {file.filename}: {str(e)}")
                 batch_files.append({
@@ -2813,11 +3263,12 @@ def batch_upload_sequential():
                     'error': str(e),
                     'success': False
                 })
+                conn.rollback()
+                record_batch_files(conn, batch_id, failed=1)
+                conn.commit()
         
         # Update batch status to ready for validation
-        conn.execute('''
-            UPDATE batches SET status = ?, updated_at = ? WHERE id = ?
-        ''', ('ready_for_validation', datetime.now().isoformat(), batch_id))
+        set_batch_status(conn, batch_id, 'ready_for_validation')
         conn.commit()
         
         # Determine if we should redirect to sequential validation or return files for in-page validation
@@ -2877,8 +3328,7 @@ def finalize_batch():
         conn = get_db_connection(app.config['DATABASE'])
         
         # Check if the batch exists
-        cursor = conn.execute('SELECT id, status FROM batches WHERE id = ?', (batch_id,))
-        batch = cursor.fetchone()
+        batch = get_batch(conn, batch_id)
         
         if not batch:
             conn.close()
@@ -2887,176 +3337,18 @@ def finalize_batch():
                 'error': f'Batch {batch_id} not found'
             }), 404
         
-        # Process each validated file
-        success_count = 0
-        error_count = 0
-        error_details = []
-        temp_files_to_clean = []
+        # Finalize all validated files set-wise in a single transaction
+        result = _finalize_validated(conn, batch_id, validated_files)
         
-        for file_data in validated_files:
-            try:
-                pending_id = file_data.get('pending_id')
-                if not pending_id:
-                    error_count += 1
-                    error_details.append({
-                        'file': file_data.get('file_path', 'Unknown file'),
-                        'error': 'Missing pending_id'
-                    })
-                    continue
-                
-                # Get the pending invoice data from database
-                cursor = conn.execute('SELECT * FROM pending_invoices WHERE id = ?', (pending_id,))
-                pending = cursor.fetchone()
-                
-                if not pending:
-                    error_count += 1
-                    error_details.append({
-                        'file': file_data.get('file_path', 'Unknown file'),
-                        'error': f'Pending invoice with ID {pending_id} not found'
-                    })
-                    continue
-                
-                # First, check for duplicates with the validated invoice number
-                invoice_number = file_data.get('invoice_number')
-                if invoice_number:
-                    cursor = conn.execute(
-                        'SELECT id FROM invoices WHERE invoice_number = ?', 
-                        (invoice_number,)
-                    )
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        error_count += 1
-                        error_details.append({
-                            'file': pending['file_path'],
-                            'error': f'Invoice number {invoice_number} already exists in database',
-                            'is_duplicate': True,
-                            'invoice_number': invoice_number
-                        })
-                        continue
-                
-                # Update the pending invoice with validated data
-                update_fields = []
-                params = []
-                
-                for field in ['supplier_name', 'company_name', 'invoice_number', 
-                              'invoice_date', 'amount_original', 'vat_amount_original', 'description']:
-                    if field in file_data:
-                        update_fields.append(f"{field} = ?")
-                        params.append(file_data[field])
-                
-                update_fields.append("is_validated = ?")
-                params.append(1)
-                update_fields.append("validated_at = ?")
-                params.append(datetime.now().isoformat())
-                update_fields.append("validation_status = ?")
-                params.append('human_validated')
-                
-                params.append(pending_id)
-                
-                query = f"UPDATE pending_invoices SET {', '.join(update_fields)} WHERE id = ?"
-                conn.execute(query, params)
-                
-                # Now process the validated invoice into the main table
-                
-                # Get or create supplier
-                supplier_id = None
-                supplier_name = file_data.get('supplier_name') or pending['supplier_name']
-                
-                if supplier_name:
-                    cursor = conn.execute('SELECT id FROM suppliers WHERE name = ?', (supplier_name,))
-                    supplier = cursor.fetchone()
-                    
-                    if supplier:
-                        supplier_id = supplier['id']
-                    else:
-                        cursor.execute('INSERT INTO suppliers (name) VALUES (?)', (supplier_name,))
-                        supplier_id = cursor.lastrowid
-                
-                # Get or create company
-                company_id = None
-                company_name = file_data.get('company_name') or pending['company_name']
-                
-                if company_name:
-                    cursor = conn.execute('SELECT id FROM companies WHERE name = ?', (company_name,))
-                    company = cursor.fetchone()
-                    
-                    if company:
-                        company_id = company['id']
-                    else:
-                        cursor.execute('INSERT INTO companies (name) VALUES (?)', (company_name,))
-                        company_id = cursor.lastrowid
-                
-                # Parse amounts
-                amount_extracted_raw = file_data.get('amount_original') or pending['amount_original']
-                vat_amount_extracted_raw = file_data.get('vat_amount_original') or pending['vat_amount_original']
-                amount_original = amount_extracted_raw
-                vat_amount_original = vat_amount_extracted_raw
-                # Debug logging
-                log.info(f"[BATCH FINALIZE-RAW] amount_extracted_raw: '{amount_extracted_raw}' (stored as amount_original)")
-                log.info(f"[BATCH FINALIZE-RAW] vat_amount_extracted_raw: '{vat_amount_extracted_raw}' (stored as vat_amount_original)")
-                
-                # Get the original file path
-                file_path = pending['file_path']
-                original_path = pending['original_path']
-                
-                # Add temp file path to cleanup list if in temp folder
-                if file_path and app.config['TEMP_FOLDER'] in file_path:
-                    temp_files_to_clean.append(file_path)
-                
-                # Insert into the main invoices table
-                cursor.execute('''
-                    INSERT INTO invoices (
-                        file_path, original_path, invoice_number, invoice_date, due_date, normalized_date,
-                        amount_original, vat_amount_original, description, supplier_id, company_id,
-                        confidence, ocr_text, raw_text, processed_at, source_info,
-                        amount_extracted_raw, vat_amount_extracted_raw
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    file_path,
-                    original_path,
-                    file_data.get('invoice_number') or pending['invoice_number'],
-                    file_data.get('invoice_date') or pending['invoice_date'],
-                    file_data.get('due_date') or pending['due_date'],
-                    file_data.get('normalized_date') or pending['normalized_date'],
-                    amount_original,
-                    vat_amount_original,
-                    file_data.get('description') or pending['description'],
-                    supplier_id,
-                    company_id,
-                    None,  # confidence
-                    None,  # ocr_text
-                    None,  # raw_text
-                    datetime.now().isoformat(),
-                    f"From batch {batch_id}, validated by human",
-                    amount_extracted_raw,
-                    vat_amount_extracted_raw
-                ))
-                
-                # Mark the pending invoice as finalized
-                conn.execute('''
-                    UPDATE pending_invoices 
-                    SET is_finalized = 1, finalized_at = ? 
-                    WHERE id = ?
-                ''', (datetime.now().isoformat(), pending_id))
-                
-                # Update the batch queue item status
-                conn.execute('''
-                    UPDATE batch_queue 
-                    SET status = 'processed' 
-                    WHERE batch_id = ? AND pending_id = ?
-                ''', (batch_id, pending_id))
-                
-                success_count += 1
-                log.info(f"Invoice {file_data.get('invoice_number') or pending['invoice_number']} validated and saved successfully")
-                
-            except Exception as e:
-                log.error(f"Error finalizing invoice: {str(e)}", exc_info=True)
-                error_count += 1
-                error_details.append({
-                    'file': file_data.get('file_path', 'Unknown file'),
-                    'error': str(e)
-                })
+        success_count = len(result['finalized'])
+        error_details = result['errors']
+        error_count = len(error_details)
+        
+        # Temp copies of finalized files are removed after the commit
+        temp_files_to_clean = [
+            item['file_path'] for item in result['finalized']
+            if item['file_path'] and app.config['TEMP_FOLDER'] in item['file_path']
+        ]
         
         # Update batch status based on results
         if success_count > 0:
@@ -3067,11 +3359,7 @@ def finalize_batch():
         else:
             batch_status = 'failed'
         
-        conn.execute('''
-            UPDATE batches 
-            SET status = ?, success_count = ?, error_count = ?, updated_at = ? 
-            WHERE id = ?
-        ''', (batch_status, success_count, error_count, datetime.now().isoformat(), batch_id))
+        set_batch_status(conn, batch_id, batch_status, success_count=success_count, error_count=error_count)
         
         # Commit all changes
         conn.commit()
@@ -3175,5 +3463,184 @@ def clean_amount(value):
     except Exception:
         return ''
 
+def process_hot_folder_file(file_path):
+    """Process a file dropped into a hot folder through the standard upload pipeline"""
+    return process_invoice_file(
+        FilePathStorage(file_path),
+        app.config,
+        lambda: get_db_connection(app.config['DATABASE']),
+        lambda file_path: check_for_duplicate_invoice(
+            file_path, 
+            lambda x, supplier_name=None: check_invoice_exists(x, app.config['DATABASE'], supplier_name),
+            lambda file_path, **kwargs: _scan_invoice(file_path)
+        ),
+        select_ai_model,
+        lambda data, batch=None, source=None: save_to_pending(data, batch, source, db_path=app.config['DATABASE']),
+        InvoiceScanner,
+        source='hot_folder'
+    )
+
+hot_folder_watcher = None
+
+def start_hot_folder_watcher():
+    """Start the inotify hot folder watcher if hot folders are configured"""
+    global hot_folder_watcher
+    if hot_folder_watcher or not app.config['HOT_FOLDERS']:
+        return hot_folder_watcher
+    try:
+        hot_folder_watcher = HotFolderWatcher(
+            app.config['HOT_FOLDERS'],
+            process_hot_folder_file,
+            app.config['DATABASE'],
+            workers=app.config['EXTRACTION_WORKERS']
+        ).start()
+    except OSError as e:
+        log.error(f"Could not start hot folder watcher: {str(e)}")
+    return hot_folder_watcher
+
+# batch_queue status a successful upload starts in, per batch upload source
+BATCH_QUEUE_STATUS = {'batch_upload': 'pending', 'batch_upload_sequential': 'pending_validation'}
+
+def process_retry_item(item):
+    """Re-run a failed extraction from the retry queue
+
+    A retried batch upload is settled in its batch like a first attempt
+    would have been: queued for validation on success, counted as failed
+    (or duplicate) once it stops being retried. A retried hot folder file
+    gets its final hot folder status.
+    """
+    result = process_invoice_file(
+        FilePathStorage(item['file_path'], item['filename']),
+        app.config,
+        lambda: get_db_connection(app.config['DATABASE']),
+        lambda file_path: check_for_duplicate_invoice(
+            file_path, 
+            lambda x, supplier_name=None: check_invoice_exists(x, app.config['DATABASE'], supplier_name),
+            lambda file_path, **kwargs: _scan_invoice(file_path)
+        ),
+        select_ai_model,
+        lambda data, batch=None, source=None: save_to_pending(data, batch, source, db_path=app.config['DATABASE']),
+        InvoiceScanner,
+        batch_id=item['batch_id'],
+        source=item['source'] or 'retry',
+        priority=PRIORITY_BULK,
+        source_info=json.loads(item['source_info']) if item['source_info'] else None,
+        retry_id=item['id']
+    )
+    if item['batch_id'] and item['source'] in BATCH_QUEUE_STATUS and result.get('status') != 'queued_for_retry':
+        conn = get_db_connection(app.config['DATABASE'])
+        try:
+            if result['success']:
+                add_batch_queue_file(
+                    conn, item['batch_id'], result['file_path'], result.get('preview_path'),
+                    item['filename'], BATCH_QUEUE_STATUS[item['source']], result['pending_id']
+                )
+            else:
+                is_duplicate = result.get('is_duplicate', False)
+                record_batch_files(conn, item['batch_id'], failed=int(not is_duplicate), duplicates=int(is_duplicate))
+            conn.commit()
+        finally:
+            conn.close()
+    if item['source'] == 'hot_folder' and result.get('status') != 'queued_for_retry':
+        try:
+            record_hot_folder_result(app.config['DATABASE'], compute_file_hash(item['file_path']), result)
+        except OSError as e:
+            log.warning(f"Could not update hot folder status for {item['file_path']}: {str(e)}")
+    return result
+
+retry_worker = None
+
+def start_retry_worker():
+    """Start the background worker that re-runs failed extractions"""
+    global retry_worker
+    if retry_worker or not app.config['RETRY_MAX_ATTEMPTS']:
+        return retry_worker
+    retry_worker = RetryWorker(
+        app.config['DATABASE'],
+        process_retry_item,
+        max_attempts=app.config['RETRY_MAX_ATTEMPTS'],
+        base_delay=app.config['RETRY_BASE_DELAY'],
+        max_delay=app.config['RETRY_MAX_DELAY']
+    ).start()
+    return retry_worker
+
+archive_worker = ArchiveWorker(
+    app.config['DATABASE'],
+    app.config['ARCHIVE_DIR'],
+    upload_folder=app.config['UPLOAD_FOLDER'],
+    preview_folder=app.config['PREVIEW_FOLDER'],
+    temp_folder=app.config['TEMP_FOLDER'],
+    route=_invoice_db_path if shard_router else None,
+    databases=shard_router.shard_paths if shard_router else None
+)
+
+compaction_worker = None
+
+def start_compaction_worker():
+    """Start the background job that archives finalized pending invoices and vacuums the database"""
+    global compaction_worker
+    if compaction_worker or not app.config['COMPACTION_INTERVAL']:
+        return compaction_worker
+    compaction_worker = CompactionWorker(
+        app.config['DATABASE'],
+        interval=app.config['COMPACTION_INTERVAL'],
+        databases=shard_router.shard_paths if shard_router else None,
+        finalized_age_days=app.config['COMPACTION_FINALIZED_AGE_DAYS'],
+        rejected_age_days=app.config['COMPACTION_REJECTED_AGE_DAYS']
+    ).start()
+    return compaction_worker
+
+backup_scheduler = BackupScheduler(
+    app.config['DATABASE'],
+    app.config['BACKUP_DIR'],
+    interval=app.config['BACKUP_INTERVAL'],
+    keep=app.config['BACKUP_KEEP'],
+    shard_dir=app.config['SHARD_DIR'] if shard_router else None
+)
+
+# Held (and kept open) for the life of the process running the deployment-wide jobs
+worker_lock_file = None
+
+background_started = False
+background_lock = threading.Lock()
+
+def start_background_workers():
+    """Start this process's background jobs (once per process)
+
+    Every server process archives the files its own requests finalize. The
+    backfill, hot folder watcher, retry worker, compaction and backups run
+    once per deployment: only in the process holding the worker lock file,
+    which also picks up archive jobs an earlier process left unfinished.
+    Nothing starts at import, so cli.py and tooling can import the app; the
+    server entry points (__main__ below, gunicorn.conf.py) start them.
+    """
+    global background_started, worker_lock_file
+    with background_lock:
+        if background_started:
+            return
+        background_started = True
+        worker_lock_file = try_worker_lock(app.config['DATABASE'])
+        singleton = worker_lock_file is not None
+        archive_worker.start(recover=singleton)
+        if not singleton:
+            log.info("Background jobs run in another process; only the archive worker started here")
+            return
+        # Fill new derived columns for existing rows without blocking startup
+        start_backfill_thread(app.config['DATABASE'])
+        start_hot_folder_watcher()
+        start_retry_worker()
+        start_compaction_worker()
+        if app.config['BACKUP_INTERVAL']:
+            backup_scheduler.start()
+
+@app.before_request
+def ensure_background_workers():
+    """Start the background jobs for servers launched without an entry point that starts them"""
+    if not background_started:
+        start_background_workers()
+
 if __name__ == '__main__':
+    # The reloader's parent process only watches files; the child serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
     app.run(debug=True)
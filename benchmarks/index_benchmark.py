@@ -0,0 +1,145 @@
+"""Benchmark invoice list and lookup queries before and after the index migration
+
+Builds a synthetic database, times the hot queries without secondary
+indexes, applies the migrations and times them again.
+
+Usage:
+    python benchmarks/index_benchmark.py --rows 100000
+    python benchmarks/index_benchmark.py --rows 1000000 --repeat 20
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.database import get_db_connection, close_db_pool
+from utils.migrations import run_migrations
+
+QUERIES = {
+    'duplicate check (invoice_number)': (
+        'SELECT id FROM invoices WHERE invoice_number = ?',
+        lambda rows: [f"RE-{random.randrange(rows):07d}"]
+    ),
+    '/api/invoices first page': (
+        '''SELECT i.id, s.name, i.invoice_number, c.name FROM invoices i
+           LEFT JOIN suppliers s ON i.supplier_id = s.id
+           LEFT JOIN companies c ON i.company_id = c.id
+           ORDER BY i.processed_at DESC LIMIT 50''',
+        lambda rows: []
+    ),
+    'invoices by date range': (
+        'SELECT COUNT(*) FROM invoices WHERE invoice_date BETWEEN ? AND ?',
+        lambda rows: ['2024-03-01', '2024-03-31']
+    ),
+    'invoices for one supplier': (
+        'SELECT id FROM invoices WHERE supplier_id = ? ORDER BY processed_at DESC LIMIT 50',
+        lambda rows: [random.randrange(1, 501)]
+    ),
+    '/api/pending-invoices by batch': (
+        'SELECT id FROM pending_invoices WHERE batch_id = ? ORDER BY created_at DESC',
+        lambda rows: [f"batch-{random.randrange(max(1, rows // 100))}"]
+    ),
+    '/api/pending-invoices needs_manual': (
+        'SELECT id FROM pending_invoices WHERE needs_manual_input = 1 ORDER BY created_at DESC LIMIT 50',
+        lambda rows: []
+    ),
+    'batch_queue by pending_id': (
+        'SELECT id FROM batch_queue WHERE pending_id = ?',
+        lambda rows: [random.randrange(1, rows + 1)]
+    ),
+}
+
+def populate(db_path, rows, chunk_size=50000):
+    """Fill the database with synthetic invoices, pending rows and batch entries"""
+    # Baseline schema only, so the "before" timings run without the indexes
+    run_migrations(db_path, target_version=0)
+    conn = get_db_connection(db_path)
+    try:
+        conn.executemany('INSERT INTO suppliers (name) VALUES (?)', [(f"Supplier {i}",) for i in range(500)])
+        conn.executemany('INSERT INTO companies (name) VALUES (?)', [(f"Company {i}",) for i in range(50)])
+        start = datetime(2022, 1, 1)
+        for offset in range(0, rows, chunk_size):
+            count = min(chunk_size, rows - offset)
+            invoices = []
+            pending = []
+            queue = []
+            for n in range(offset, offset + count):
+                date = (start + timedelta(days=random.randrange(1200))).strftime('%Y-%m-%d')
+                processed = (start + timedelta(minutes=n)).isoformat()
+                invoices.append((f"RE-{n:07d}", date, f"{random.randrange(10, 99999)},00 EUR",
+                                 random.randrange(1, 501), random.randrange(1, 51), processed))
+                batch_id = f"batch-{n // 100}"
+                pending.append((batch_id, f"RE-{n:07d}", date, 1 if n % 20 == 0 else 0, processed))
+                queue.append((batch_id, f"/tmp/{n}.pdf", n + 1, n % 100))
+            conn.executemany('''
+                INSERT INTO invoices (invoice_number, invoice_date, amount_original, supplier_id, company_id, processed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', invoices)
+            conn.executemany('''
+                INSERT INTO pending_invoices (batch_id, invoice_number, invoice_date, needs_manual_input, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', pending)
+            conn.executemany('''
+                INSERT INTO batch_queue (batch_id, file_path, pending_id, position) VALUES (?, ?, ?, ?)
+            ''', queue)
+            conn.commit()
+            print(f"  inserted {offset + count}/{rows} rows", file=sys.stderr)
+    finally:
+        conn.close()
+
+def time_queries(db_path, rows, repeat):
+    """Return the median latency in milliseconds for each query"""
+    conn = get_db_connection(db_path)
+    results = {}
+    try:
+        for name, (sql, make_params) in QUERIES.items():
+            timings = []
+            for _ in range(repeat):
+                params = make_params(rows)
+                started = time.perf_counter()
+                conn.execute(sql, params).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            results[name] = timings[len(timings) // 2]
+    finally:
+        conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the index migration')
+    parser.add_argument('--rows', type=int, default=100000, help='Number of invoices to generate')
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per query (median is reported)')
+    parser.add_argument('--db', help='Database file to use (default: a temporary file)')
+    args = parser.parse_args()
+
+    random.seed(42)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='invoice-bench-'), 'bench.db')
+    print(f"Building {args.rows} rows in {db_path}", file=sys.stderr)
+    populate(db_path, args.rows)
+
+    before = time_queries(db_path, args.rows, args.repeat)
+    started = time.perf_counter()
+    run_migrations(db_path)
+    migration_time = time.perf_counter() - started
+    after = time_queries(db_path, args.rows, args.repeat)
+
+    print(f"\n{args.rows} invoices, median of {args.repeat} runs, migration took {migration_time:.2f}s\n")
+    print(f"{'query':<40}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in QUERIES:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(f"{name:<40}{before[name]:>12.3f}{after[name]:>12.3f}{speedup:>9.1f}x")
+
+    close_db_pool()
+    if not args.db:
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(db_path + suffix)
+            except OSError:
+                pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+"""Command line interface for headless invoice processing
+
+Heavy dependencies (PyMuPDF, LangChain, Flask) are imported inside the
+commands that need them, so `list` and `inspect` start almost instantly.
+
+Exit codes:
+    0  every file was processed, skipped or recognised as a duplicate
+    1  at least one file failed
+    2  usage error or no matching input files
+    130  interrupted
+"""
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import shutil
+import tempfile
+import threading
+
+from utils.metrics import percentile
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+STAGES = ('extract_text', 'model', 'organize', 'store')
+
+log = logging.getLogger('cli')
+
+def collect_files(paths, recursive=False):
+    """Expand files, directories and glob patterns into a sorted list of PDF paths"""
+    found = []
+    seen = set()
+
+    def add(path):
+        path = os.path.abspath(path)
+        if path not in seen and os.path.isfile(path) and path.lower().endswith('.pdf'):
+            seen.add(path)
+            found.append(path)
+
+    for path in paths:
+        if os.path.isdir(path):
+            pattern = os.path.join(path, '**', '*') if recursive else os.path.join(path, '*')
+            for match in sorted(glob.glob(pattern, recursive=recursive)):
+                add(match)
+        elif glob.has_magic(path):
+            for match in sorted(glob.glob(path, recursive=True)):
+                if os.path.isdir(match):
+                    for sub in sorted(glob.glob(os.path.join(match, '*'))):
+                        add(sub)
+                else:
+                    add(match)
+        else:
+            add(path)
+    return found
+
+def cmd_list(args):
+    """Print the PDF files a process run would pick up"""
+    files = collect_files(args.paths, args.recursive)
+    for path in files:
+        print(path)
+    if not files:
+        print("No PDF files found", file=sys.stderr)
+        return EXIT_USAGE
+    return EXIT_OK
+
+def cmd_inspect(args):
+    """Print basic metadata for each PDF without running extraction"""
+    files = collect_files(args.paths, args.recursive)
+    if not files:
+        print("No PDF files found", file=sys.stderr)
+        return EXIT_USAGE
+
+    from utils.file_utils import compute_file_hash
+
+    for path in files:
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            header = f.read(8)
+        info = {
+            'file': path,
+            'size': stat.st_size,
+            'modified': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(stat.st_mtime)),
+            'sha256': compute_file_hash(path),
+            'is_pdf': header.startswith(b'%PDF-')
+        }
+        if args.pages:
+            try:
+                import PyPDF2
+                info['pages'] = len(PyPDF2.PdfReader(path).pages)
+            except Exception as e:
+                info['pages'] = None
+                info['error'] = str(e)
+        print(json.dumps(info, ensure_ascii=False))
+    return EXIT_OK
+
+def cmd_process(args):
+    """Run InvoiceScanner over the given files with a worker pool"""
+    files = collect_files(args.paths, args.recursive)
+    if not files:
+        print("No PDF files found", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.dry_run:
+        for path in files:
+            print(path)
+        print(f"Dry run: {len(files)} file(s) would be processed", file=sys.stderr)
+        return EXIT_OK
+
+    # Heavy imports only once we know there is work to do
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from invoice_scanner import InvoiceScanner
+
+    from utils.migrations import run_migrations
+
+    store_in_db = not args.no_db
+    # Without --db the scanners still need a schema (duplicate checks); a
+    # scratch file works across the per-thread pooled connections, ':memory:' would not
+    scratch_dir = None if store_in_db else tempfile.mkdtemp(prefix='invoice-cli-')
+    db_path = args.db if store_in_db else os.path.join(scratch_dir, 'scratch.db')
+    run_migrations(db_path)
+    local = threading.local()
+    scanners = []
+    scanners_lock = threading.Lock()
+
+    def get_scanner():
+        # One scanner (and database connection) per worker thread
+        scanner = getattr(local, 'scanner', None)
+        if scanner is None:
+            scanner = InvoiceScanner(db_path, args.archive_dir)
+            local.scanner = scanner
+            with scanners_lock:
+                scanners.append(scanner)
+        return scanner
+
+    def run_one(path):
+        timings = {}
+        started = time.perf_counter()
+        try:
+            result = get_scanner().process_invoice(
+                path, model_name=args.model, store_in_db=store_in_db, timings=timings
+            )
+        except Exception as e:
+            result = {'status': 'error', 'success': False, 'error': str(e)}
+        timings['total'] = time.perf_counter() - started
+        return path, result, timings
+
+    out = sys.stdout
+    close_out = False
+    if args.jsonl and args.jsonl != '-':
+        out = open(args.jsonl, 'w', encoding='utf-8')
+        close_out = True
+
+    counts = {}
+    stage_times = {stage: [] for stage in STAGES + ('total',)}
+    wall_start = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(run_one, path) for path in files]
+            for future in as_completed(futures):
+                path, result, timings = future.result()
+                status = result.get('status', 'error')
+                counts[status] = counts.get(status, 0) + 1
+                for stage, seconds in timings.items():
+                    stage_times.setdefault(stage, []).append(seconds)
+
+                record = {
+                    'file': path,
+                    'status': status,
+                    'success': result.get('success', False),
+                    'error': result.get('error'),
+                    'model': result.get('model_used'),
+                    'organized_path': result.get('organized_path'),
+                    'data': result.get('invoice_data'),
+                    'timings': {stage: round(seconds, 4) for stage, seconds in timings.items()}
+                }
+                if args.jsonl:
+                    out.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                    out.flush()
+                else:
+                    print(f"{status:>9}  {path}" + (f"  ({record['error']})" if record['error'] else ''))
+    finally:
+        if close_out:
+            out.close()
+        for scanner in scanners:
+            try:
+                scanner.close()
+            except Exception:
+                pass
+        if scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    wall_time = time.perf_counter() - wall_start
+    _print_summary(len(files), counts, stage_times, wall_time, args.workers)
+    return EXIT_FAILURES if counts.get('error', 0) else EXIT_OK
+
+def _print_summary(total, counts, stage_times, wall_time, workers):
+    """Print status counts and per-stage timings to stderr"""
+    err = sys.stderr
+    print(f"\nProcessed {total} file(s) in {wall_time:.2f}s with {workers} worker(s) "
+          f"({total / wall_time if wall_time else 0:.2f} files/s)", file=err)
+    print("  " + ", ".join(f"{status}: {count}" for status, count in sorted(counts.items())), file=err)
+    print(f"  {'stage':<14}{'count':>7}{'total s':>10}{'avg s':>9}{'p95 s':>9}{'max s':>9}", file=err)
+    for stage, values in stage_times.items():
+        if not values:
+            continue
+        print(f"  {stage:<14}{len(values):>7}{sum(values):>10.2f}{sum(values) / len(values):>9.3f}"
+              f"{percentile(values, 95):>9.3f}{max(values):>9.3f}", file=err)
+
+def cmd_watch(args):
+    """Run the inotify hot folder watcher in the foreground"""
+    os.environ['HOT_FOLDERS'] = os.pathsep.join(os.path.abspath(d) for d in args.directories)
+    from app import start_hot_folder_watcher
+
+    watcher = start_hot_folder_watcher()
+    if watcher is None:
+        print("Could not start hot folder watcher", file=sys.stderr)
+        return EXIT_FAILURES
+    try:
+        threading.Event().wait()
+    finally:
+        watcher.stop()
+    return EXIT_OK
+
+def cmd_compact(args):
+    """Archive finalized pending invoices, prune unused texts, vacuum and optimize"""
+    if not os.path.exists(args.db):
+        print(f"Database not found: {args.db}", file=sys.stderr)
+        return EXIT_USAGE
+
+    from utils.migrations import run_migrations
+    from utils.compaction import compact_database
+    from utils.sharding import shard_database_paths
+
+    run_migrations(args.db)
+    try:
+        shard_paths = shard_database_paths(args.db, args.shard_dir)
+    except ValueError as e:
+        print(f"{e} (--shard-dir)", file=sys.stderr)
+        return EXIT_USAGE
+    for path in shard_paths:
+        run_migrations(path)
+    result = compact_database(
+        args.db,
+        chunk_size=args.chunk_size,
+        finalized_age_days=args.finalized_age_days,
+        rejected_age_days=args.rejected_age_days,
+        full_vacuum=args.full_vacuum,
+        shard_paths=shard_paths
+    )
+    print(json.dumps(result))
+    return EXIT_OK
+
+def cmd_backup(args):
+    """Take a verified online snapshot of the database (and its shards) and apply retention"""
+    if not os.path.exists(args.db):
+        print(f"Database not found: {args.db}", file=sys.stderr)
+        return EXIT_USAGE
+
+    from utils.backup import create_snapshot_set, prune_snapshot_sets, BackupError
+
+    try:
+        result = create_snapshot_set(args.db, args.dir, args.shard_dir, verify=not args.no_verify)
+        if args.keep is not None:
+            result['pruned'] = prune_snapshot_sets(args.db, args.dir, args.keep, args.shard_dir)
+    except BackupError as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_FAILURES
+    print(json.dumps(result))
+    return EXIT_OK
+
+def cmd_restore(args):
+    """Restore the database from a snapshot"""
+    from utils.backup import restore_snapshot, BackupError
+
+    if not args.yes:
+        print(f"This replaces the contents of {args.db} with {args.snapshot}; stop the app, "
+              f"then re-run with --yes to confirm", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        result = restore_snapshot(args.snapshot, args.db, backup_dir=None if args.no_pre_snapshot else args.dir,
+                                  shard_dir=args.shard_dir)
+    except BackupError as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_FAILURES
+    print(json.dumps(result))
+    return EXIT_OK
+
+def build_parser():
+    """Create the argument parser"""
+    parser = argparse.ArgumentParser(prog='cli.py', description='Headless invoice processing')
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='More log output (repeatable)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_paths(sub):
+        sub.add_argument('paths', nargs='+', help='PDF files, directories or glob patterns')
+        sub.add_argument('-r', '--recursive', action='store_true', help='Recurse into directories')
+
+    list_parser = subparsers.add_parser('list', help='List the PDF files that would be processed')
+    add_paths(list_parser)
+    list_parser.set_defaults(func=cmd_list)
+
+    inspect_parser = subparsers.add_parser('inspect', help='Show file metadata without extraction')
+    add_paths(inspect_parser)
+    inspect_parser.add_argument('--pages', action='store_true', help='Also count pages (loads PyPDF2)')
+    inspect_parser.set_defaults(func=cmd_inspect)
+
+    process_parser = subparsers.add_parser('process', help='Extract, organize and store invoices')
+    add_paths(process_parser)
+    process_parser.add_argument('-w', '--workers', type=int, default=2, help='Number of parallel workers')
+    process_parser.add_argument('--db', default='invoices.db', help='SQLite database path')
+    process_parser.add_argument('--archive-dir', default='organized_invoices', help='Archive directory')
+    process_parser.add_argument('--model', default=None, help='Ollama model name')
+    process_parser.add_argument('--no-db', action='store_true',
+                                help='Extract only; do not organize files or write to the database')
+    process_parser.add_argument('--dry-run', action='store_true', help='Only list the files that would be processed')
+    process_parser.add_argument('--jsonl', metavar='FILE', help="Write one JSON record per file ('-' for stdout)")
+    process_parser.set_defaults(func=cmd_process)
+
+    watch_parser = subparsers.add_parser('watch', help='Ingest PDFs dropped into hot folders')
+    watch_parser.add_argument('directories', nargs='+', help='Directories to watch')
+    watch_parser.set_defaults(func=cmd_watch)
+
+    compact_parser = subparsers.add_parser('compact', help='Archive finalized pending invoices and vacuum the database')
+    compact_parser.add_argument('--db', default='invoices.db', help='SQLite database path')
+    compact_parser.add_argument('--chunk-size', type=int, default=500, help='Rows moved per transaction')
+    compact_parser.add_argument('--finalized-age-days', type=int, default=1,
+                                help='Archive finalized rows older than this many days')
+    compact_parser.add_argument('--rejected-age-days', type=int, default=30,
+                                help='Archive rejected rows older than this many days')
+    compact_parser.add_argument('--full-vacuum', action='store_true',
+                                help='Rewrite the file with VACUUM (switches on incremental auto_vacuum)')
+    compact_parser.add_argument('--shard-dir', default=None, help='Per-company shard directory (with SHARD_BY_COMPANY)')
+    compact_parser.set_defaults(func=cmd_compact)
+
+    backup_parser = subparsers.add_parser('backup', help='Snapshot the database without stopping the app')
+    backup_parser.add_argument('--db', default='invoices.db', help='SQLite database path')
+    backup_parser.add_argument('--dir', default='backups', help='Snapshot directory')
+    backup_parser.add_argument('--keep', type=int, default=None, help='Keep only the newest N snapshots')
+    backup_parser.add_argument('--no-verify', action='store_true', help='Skip the integrity check')
+    backup_parser.add_argument('--shard-dir', default=None, help='Per-company shard directory (with SHARD_BY_COMPANY)')
+    backup_parser.set_defaults(func=cmd_backup)
+
+    restore_parser = subparsers.add_parser('restore', help='Restore the database from a snapshot')
+    restore_parser.add_argument('snapshot', help='Snapshot file')
+    restore_parser.add_argument('--db', default='invoices.db', help='SQLite database path')
+    restore_parser.add_argument('--dir', default='backups', help='Where to snapshot the current database first')
+    restore_parser.add_argument('--no-pre-snapshot', action='store_true',
+                                help='Do not snapshot the current database before restoring')
+    restore_parser.add_argument('--shard-dir', default=None, help='Per-company shard directory (with SHARD_BY_COMPANY)')
+    restore_parser.add_argument('--yes', action='store_true', help='Confirm overwriting the database')
+    restore_parser.set_defaults(func=cmd_restore)
+
+    return parser
+
+def main(argv=None):
+    """CLI entry point"""
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        return EXIT_USAGE if e.code else EXIT_OK
+
+    level = logging.WARNING - 10 * min(args.verbose, 2)
+    logging.basicConfig(format="%(asctime)s | %(levelname)s | %(name)s | %(message)s", level=level, stream=sys.stderr)
+
+    if getattr(args, 'workers', 1) < 1:
+        print("--workers must be at least 1", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        return EXIT_INTERRUPTED
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,13 @@
+"""Gunicorn settings, loaded automatically when gunicorn is started from this directory
+
+    gunicorn app:app
+"""
+
+def post_worker_init(worker):
+    """Start the background jobs as soon as a worker has loaded the app
+
+    Without this they would wait for the worker's first request, leaving the
+    hot folder unwatched after a deploy or restart until someone opens the UI.
+    """
+    from app import start_background_workers
+    start_background_workers()
@@ -19,6 +19,9 @@ import sys
 import threading
 from langchain_core.output_parsers import JsonOutputParser
 from parser import InvoiceFields
+from utils.database import get_db_connection
+from utils.normalize import normalize_invoice_number, typed_invoice_values
+from utils.name_resolver import get_or_create_supplier_id, get_or_create_company_id
 
 # Configure module logger
 log = logging.getLogger(__name__)
@@ -38,93 +41,24 @@ class InvoiceDatabase:
     
     def __init__(self, db_path="invoices.db"):
         self.db_path = db_path
-        self.conn = None
-        self.cursor = None
         self.logger = logging.getLogger(f"{__name__}.InvoiceDatabase")
-        self.initialize_db()
-        
-    def initialize_db(self):
-        """Create the database and tables if they don't exist"""
-        self.logger.info(f"Initializing database at {self.db_path}")
-        self.conn = sqlite3.connect(self.db_path)
+        # The schema is created and upgraded by utils.migrations.run_migrations
+        self.conn = get_db_connection(self.db_path)
         self.cursor = self.conn.cursor()
-        
-        # Create tables
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS suppliers (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS companies (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS invoices (
-            id INTEGER PRIMARY KEY,
-            file_path TEXT UNIQUE,
-            original_path TEXT,
-            invoice_number TEXT,
-            invoice_date TEXT,
-            normalized_date TEXT,
-            amount_original TEXT,
-            vat_amount_original TEXT,
-            description TEXT,
-            supplier_id INTEGER,
-            company_id INTEGER,
-            processed_at TIMESTAMP,
-            FOREIGN KEY (supplier_id) REFERENCES suppliers (id),
-            FOREIGN KEY (company_id) REFERENCES companies (id)
-        )
-        ''')
-        
-        self.conn.commit()
-        self.logger.debug("Database tables created successfully")
     
     def get_or_create_supplier(self, supplier_name):
-        """Get supplier ID or create if it doesn't exist"""
+        """Get supplier ID or create if it doesn't exist (committed with the invoice)"""
         if not supplier_name or supplier_name == "Nicht gefunden":
             self.logger.debug("No valid supplier name provided")
             return None
-            
-        self.cursor.execute("SELECT id FROM suppliers WHERE name = ?", (supplier_name,))
-        result = self.cursor.fetchone()
-        
-        if result:
-            self.logger.debug(f"Found existing supplier: {supplier_name} (ID: {result[0]})")
-            return result[0]
-        else:
-            self.cursor.execute("INSERT INTO suppliers (name) VALUES (?)", (supplier_name,))
-            self.conn.commit()
-            supplier_id = self.cursor.lastrowid
-            self.logger.info(f"Created new supplier: {supplier_name} (ID: {supplier_id})")
-            return supplier_id
+        return get_or_create_supplier_id(self.conn, supplier_name)
     
     def get_or_create_company(self, company_name):
-        """Get company ID or create if it doesn't exist"""
+        """Get company ID or create if it doesn't exist (committed with the invoice)"""
         if not company_name or company_name == "Nicht gefunden":
             company_name = "Unknown"
             self.logger.debug("Using 'Unknown' as company name")
-            
-        self.cursor.execute("SELECT id FROM companies WHERE name = ?", (company_name,))
-        result = self.cursor.fetchone()
-        
-        if result:
-            self.logger.debug(f"Found existing company: {company_name} (ID: {result[0]})")
-            return result[0]
-        else:
-            self.cursor.execute("INSERT INTO companies (name) VALUES (?)", (company_name,))
-            self.conn.commit()
-            company_id = self.cursor.lastrowid
-            self.logger.info(f"Created new company: {company_name} (ID: {company_id})")
-            return company_id
+        return get_or_create_company_id(self.conn, company_name)
     
     def store_invoice(self, invoice_data, file_path, original_path):
         """Store invoice information in the database"""
@@ -145,19 +79,22 @@ class InvoiceDatabase:
         # Parse and normalize the date
         date_original = invoice_data.get('Rechnungsdatum', None)
         normalized_date = self.normalize_date(date_original) if date_original else None
+        typed = typed_invoice_values(amount_original, vat_original, date_original)
         
         # Insert into database
         try:
             self.cursor.execute('''
             INSERT INTO invoices (
-                file_path, original_path, invoice_number, invoice_date, normalized_date,
+                file_path, original_path, invoice_number, invoice_number_key, invoice_date, normalized_date,
                 amount_original, vat_amount_original, description,
-                supplier_id, company_id, processed_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                supplier_id, company_id, processed_at,
+                amount_cents, vat_cents, currency, invoice_date_iso
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 file_path,
                 original_path,
                 invoice_data.get('Rechnungsnummer', 'Unknown'),
+                normalize_invoice_number(invoice_data.get('Rechnungsnummer')),
                 date_original,
                 normalized_date,
                 amount_original,
@@ -165,15 +102,18 @@ class InvoiceDatabase:
                 invoice_data.get('Leistungsbeschreibung', ''),
                 supplier_id,
                 company_id,
-                datetime.now().isoformat()
-
-
+                datetime.now().isoformat(),
+                typed['amount_cents'],
+                typed['vat_cents'],
+                typed['currency'],
+                typed['invoice_date_iso']
             ))
             self.conn.commit()
             self.logger.info(f"Invoice {invoice_data.get('Rechnungsnummer', 'Unknown')} successfully saved to database")
             return True
         except sqlite3.IntegrityError:
-            # File path already exists in database
+            # File path, or invoice number for this supplier, already exists in database
+            self.conn.rollback()
             self.logger.warning(f"Invoice already exists in database: {file_path}")
             return False
     
@@ -223,6 +163,8 @@ class InvoiceDatabase:
         """Close the database connection"""
         if self.conn:
             self.conn.close()
+            self.conn = None
+            self.cursor = None
 
 
 class InvoiceScanner:
@@ -247,6 +189,9 @@ class InvoiceScanner:
         # Set up skipped invoices tracking
         self.skipped_invoices = []
         
+        # Error from the last text extraction (OCR crash, unreadable PDF)
+        self.last_extraction_error = None
+        
         # Define the system prompt template for invoice extraction
         self.invoice_template = """
 Du bist ein spezialisierter KI-Assistent für die Extraktion von Daten aus deutschen Geschäftsrechnungen.
@@ -276,6 +221,7 @@ Bemerkungen:
         self.logger.info(f"Extracting text from {file_path}")
         text = ""
         ocr_text = ""
+        self.last_extraction_error = None
         
         # Check if file exists
         if not os.path.exists(file_path):
@@ -308,9 +254,14 @@ Bemerkungen:
                         text = ocr_text
                 except Exception as e:
                     self.logger.error(f"OCR failed: {str(e)}")
+                    self.last_extraction_error = f"OCR failed: {str(e)}"
             
             doc.close()
             
+            # OCR crashed on a scanned document - report the failure instead of skipping it
+            if self.last_extraction_error and not text.strip():
+                return "", ocr_text
+            
             # Check if this is a document containing "Rechnung"
             combined_text = (text + " " + ocr_text).lower()
             if "rechnung" not in combined_text and "invoice" not in combined_text and "faktura" not in combined_text:
@@ -325,6 +276,7 @@ Bemerkungen:
             return text, ocr_text
         except Exception as e:
             self.logger.error(f"Error extracting text from PDF: {str(e)}")
+            self.last_extraction_error = f"Error extracting text from PDF: {str(e)}"
             return "", ""
     
     def process_with_model(self, text, model_name=None):
@@ -421,7 +373,8 @@ Bemerkungen:
                     "Mehrwertsteuerbetrag": "0",
                     "Leistungsbeschreibung": "AI processing timed out. Please input data manually.",
                     "success": False,
-                    "error": f"Model processing timed out after {timeout} seconds"
+                    "error": f"Model processing timed out after {timeout} seconds",
+                    "error_type": "timeout"
                 }
             
             # If there was an error in the thread, return structured error data
@@ -436,7 +389,8 @@ Bemerkungen:
                     "Mehrwertsteuerbetrag": "0",
                     "Leistungsbeschreibung": "AI processing error. Please input data manually.",
                     "success": False,
-                    "error": f"Error during model processing: {str(error)}"
+                    "error": f"Error during model processing: {str(error)}",
+                    "error_type": "model_error"
                 }
             
             if not result:
@@ -450,7 +404,8 @@ Bemerkungen:
                     "Mehrwertsteuerbetrag": "0",
                     "Leistungsbeschreibung": "AI returned no result. Please input data manually.",
                     "success": False,
-                    "error": "No result returned from model"
+                    "error": "No result returned from model",
+                    "error_type": "no_result"
                 }
             
             # Parse the JSON response manually with error handling
@@ -486,7 +441,8 @@ Bemerkungen:
                     "Mehrwertsteuerbetrag": "0",
                     "Leistungsbeschreibung": "Error parsing AI result. Please input data manually.",
                     "success": False,
-                    "error": f"Failed to parse JSON: {str(e)}"
+                    "error": f"Failed to parse JSON: {str(e)}",
+                    "error_type": "parse_error"
                 }
                 
         except Exception as e:
@@ -502,7 +458,8 @@ Bemerkungen:
                 "Mehrwertsteuerbetrag": "0",
                 "Leistungsbeschreibung": "Error processing invoice. Please input data manually.",
                 "success": False,
-                "error": str(e)
+                "error": str(e),
+                "error_type": "processing_error"
             }
     
     def organize_file(self, file_path, data):
@@ -593,16 +550,24 @@ Bemerkungen:
             self.logger.error(f"Error organizing file: {e}")
             return None
 
-    def process_invoice(self, file_path, model_name=None, store_in_db=True):
-        """Process a single invoice file"""
+    def process_invoice(self, file_path, model_name=None, store_in_db=True, timings=None):
+        """Process a single invoice file
+        
+        If a `timings` dict is passed, the seconds spent in each stage
+        (extract_text, model, organize, store) are recorded in it.
+        """
         self.logger.info(f"Processing invoice: {file_path}")
         
         # Use specified model or default
         model_to_use = model_name or self.model_name
+        if timings is None:
+            timings = {}
         
         try:
             # Extract text from PDF
+            stage_start = time.perf_counter()
             text, ocr_text = self.extract_text_from_pdf(file_path)
+            timings['extract_text'] = time.perf_counter() - stage_start
             
             # Check if this file should be skipped
             if text == "SKIP_PROCESSING":
@@ -622,7 +587,9 @@ Bemerkungen:
                 return {"status": "error", "error": "No text could be extracted from PDF", "success": False}
             
             # Extract data using LLM
+            stage_start = time.perf_counter()
             invoice_data = self.process_with_model(text, model_to_use)
+            timings['model'] = time.perf_counter() - stage_start
             
             if not invoice_data:
                 self.logger.warning(f"Failed to extract invoice data from {file_path}")
@@ -644,12 +611,27 @@ Bemerkungen:
                 if value:  # Only add non-empty values
                     invoice_data[key] = value
             
+            # Without database storage the file is left where it is
+            if not store_in_db:
+                return {
+                    "status": "success" if invoice_data.get('success', False) else "error",
+                    "success": invoice_data.get('success', False),
+                    "error": invoice_data.get('error'),
+                    "invoice_data": invoice_data,
+                    "original_path": file_path,
+                    "model_used": model_to_use
+                }
+            
             # Organize the file
+            stage_start = time.perf_counter()
             organized_path = self.organize_file(file_path, invoice_data)
+            timings['organize'] = time.perf_counter() - stage_start
             
             # Store in database
-            if store_in_db and organized_path:
+            if organized_path:
+                stage_start = time.perf_counter()
                 success = self.db.store_invoice(invoice_data, organized_path, file_path)
+                timings['store'] = time.perf_counter() - stage_start
                 if success:
                     self.logger.info(f"Invoice {invoice_data.get('Rechnungsnummer', 'Unknown')} processed and stored")
                     return {
@@ -737,6 +719,13 @@ Bemerkungen:
         self.logger.debug("Closing database connection")
         self.db.close()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
     def extract_invoice_data(self, file_path, model_name=None, store_in_db=True):
         """Extract invoice data from a PDF file"""
         try:
@@ -0,0 +1,80 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.database import close_db_pool
+from utils.migrations import run_migrations
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A fresh database migrated to the latest schema"""
+    path = str(tmp_path / 'invoices.db')
+    run_migrations(path)
+    yield path
+    close_db_pool()
+
+
+# Tables as created by releases before versioned migrations, with
+# pending_invoices from the old shadow-table initialiser (no AUTOINCREMENT)
+LEGACY_SCHEMA = '''
+    CREATE TABLE invoices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT, original_path TEXT, invoice_number TEXT, invoice_date TEXT,
+        due_date TEXT, normalized_date TEXT, amount_original TEXT, vat_amount_original TEXT,
+        description TEXT, supplier_id INTEGER, company_id INTEGER, confidence REAL,
+        ocr_text TEXT, raw_text TEXT, processed_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE suppliers (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE);
+    CREATE TABLE companies (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE);
+    CREATE TABLE pending_invoices (
+        id INTEGER PRIMARY KEY,
+        batch_id TEXT, file_path TEXT, original_path TEXT, preview_path TEXT,
+        invoice_number TEXT, invoice_date TEXT, due_date TEXT, normalized_date TEXT,
+        amount_original TEXT, vat_amount_original TEXT, description TEXT,
+        supplier_name TEXT, company_name TEXT, processed_at TEXT,
+        is_viewed INTEGER DEFAULT 0, needs_manual_input INTEGER DEFAULT 0,
+        is_finalized INTEGER DEFAULT 0, finalized_at TEXT, source TEXT, source_info TEXT,
+        raw_text TEXT, ocr_text TEXT, extracted_data TEXT,
+        validation_status TEXT, validation_notes TEXT, created_at TEXT, updated_at TEXT
+    );
+    CREATE TABLE batch_queue (
+        id INTEGER PRIMARY KEY, batch_id TEXT NOT NULL, file_path TEXT NOT NULL,
+        preview_path TEXT, filename TEXT, status TEXT DEFAULT 'pending', processed_at TEXT,
+        pending_id INTEGER, position INTEGER, created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+
+@pytest.fixture
+def legacy_db_path(tmp_path):
+    """A database as an old release left it, with a few rows and no migrations run"""
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany(
+        'INSERT INTO suppliers (name) VALUES (?)', [('ACME GmbH',), ('Globex',)]
+    )
+    conn.executemany('''
+        INSERT INTO invoices (file_path, invoice_number, invoice_date, amount_original, supplier_id, raw_text)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [
+        ('/data/a.pdf', 'RE-2023/001', '15.01.2023', '1.234,56 €', 1, 'Rechnung RE-2023/001 ACME'),
+        ('/data/b.pdf', 'INV 77', '2023-02-01', '$99.00', 2, 'Invoice INV 77 Globex'),
+    ])
+    conn.executemany('''
+        INSERT INTO pending_invoices (batch_id, file_path, invoice_number, supplier_name, is_finalized,
+                                      finalized_at, raw_text, extracted_data, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        ('b1', '/tmp/a.pdf', 'RE-2023/001', 'ACME GmbH', 1, '2023-01-20T10:00:00', 'Rechnung', '{}', '2023-01-16'),
+        ('b1', '/tmp/c.pdf', 'C-3', 'ACME GmbH', 0, None, 'Text C', None, '2023-01-16'),
+    ])
+    conn.commit()
+    conn.close()
+    yield path
+    close_db_pool()
@@ -0,0 +1,54 @@
+import os
+
+from utils.archive_worker import ArchiveWorker
+from utils.database import get_db_connection
+
+
+def add_invoice(db_path, file_path):
+    conn = get_db_connection(db_path)
+    try:
+        invoice_id = conn.execute(
+            'INSERT INTO invoices (file_path, invoice_number) VALUES (?, ?)', (file_path, 'A-1')
+        ).lastrowid
+        conn.commit()
+        return invoice_id
+    finally:
+        conn.close()
+
+
+def invoice_row(db_path, invoice_id):
+    conn = get_db_connection(db_path)
+    try:
+        return conn.execute('SELECT file_path, archive_pending FROM invoices WHERE id = ?', (invoice_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_unfinished_jobs_are_archived_after_a_restart(db_path, tmp_path):
+    upload = tmp_path / 'upload.pdf'
+    upload.write_bytes(b'%PDF-1.4')
+    invoice_id = add_invoice(db_path, str(upload))
+    archive_dir = str(tmp_path / 'archive')
+
+    # Queued but never processed: the process went away before the thread ran
+    ArchiveWorker(db_path, archive_dir).submit(invoice_id, str(upload))
+    assert invoice_row(db_path, invoice_id)['archive_pending'] == 1
+
+    worker = ArchiveWorker(db_path, archive_dir).start()
+    worker.stop()
+
+    row = invoice_row(db_path, invoice_id)
+    assert row['archive_pending'] == 0
+    assert row['file_path'].startswith(archive_dir) and os.path.exists(row['file_path'])
+    assert not upload.exists()
+
+
+def test_job_for_a_missing_file_is_dropped(db_path, tmp_path):
+    missing = str(tmp_path / 'gone.pdf')
+    invoice_id = add_invoice(db_path, missing)
+
+    worker = ArchiveWorker(db_path, str(tmp_path / 'archive')).start()
+    worker.submit(invoice_id, missing)
+    worker.stop()
+
+    assert tuple(invoice_row(db_path, invoice_id)) == (missing, 0)
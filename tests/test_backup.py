@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from utils.backup import BackupError, create_snapshot, create_snapshot_set, restore_snapshot
+from utils.database import get_db_connection, save_many_to_pending
+from utils.name_resolver import name_resolver, get_or_create_supplier_id
+from utils.sharding import ShardRouter
+from utils.worker_lock import try_worker_lock
+
+
+def test_restore_is_refused_while_the_app_holds_the_worker_lock(db_path, tmp_path):
+    snapshot = create_snapshot(db_path, str(tmp_path / 'backups'))['path']
+    app_lock = try_worker_lock(db_path)
+    try:
+        with pytest.raises(BackupError, match='stop it'):
+            restore_snapshot(snapshot, db_path)
+    finally:
+        app_lock.close()
+
+
+def test_restore_drops_cached_names(db_path, tmp_path):
+    snapshot = create_snapshot(db_path, str(tmp_path / 'backups'))['path']
+    conn = get_db_connection(db_path)
+    try:
+        get_or_create_supplier_id(conn, 'Added after the snapshot')
+        conn.commit()
+        get_or_create_supplier_id(conn, 'Added after the snapshot')
+        assert name_resolver.get_stats()['size'] > 0
+    finally:
+        conn.close()
+
+    restore_snapshot(snapshot, db_path)
+
+    assert name_resolver.get_stats()['size'] == 0
+    conn = get_db_connection(db_path)
+    try:
+        assert conn.execute('SELECT COUNT(*) FROM suppliers').fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def invoice_count(path):
+    conn = get_db_connection(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM invoices').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_sharded_snapshot_set_restores_catalog_and_shards(db_path, tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    router = ShardRouter(db_path, shard_dir, max_workers=2)
+    try:
+        ids = save_many_to_pending([{'invoice_number': 'S-1', 'supplier_name': 'ACME', 'company_name': 'North'}],
+                                   db_path=db_path)
+        assert router.finalize(None, [{'pending_id': ids[0]}])['errors'] == []
+        shard = router.shard_paths()[1]
+
+        snapshot = create_snapshot_set(db_path, str(tmp_path / 'backups'), shard_dir)
+        assert [os.path.basename(item['path']).rsplit('-', 3)[1:] for item in snapshot['shards']] == \
+            [os.path.basename(snapshot['path']).rsplit('-', 3)[1:]]
+
+        ids = save_many_to_pending([{'invoice_number': 'S-2', 'supplier_name': 'ACME', 'company_name': 'North'},
+                                    {'invoice_number': 'S-3', 'supplier_name': 'ACME', 'company_name': 'South'}],
+                                   db_path=db_path)
+        assert router.finalize(None, [{'pending_id': pending_id} for pending_id in ids])['errors'] == []
+        added_shard = router.shard_paths()[2]
+    finally:
+        router.shutdown()
+
+    with pytest.raises(BackupError, match='shards'):
+        restore_snapshot(snapshot['path'], db_path)
+    result = restore_snapshot(snapshot['path'], db_path, shard_dir=shard_dir)
+
+    assert result['moved_aside'] == [added_shard]
+    assert invoice_count(shard) == 1
+    assert not os.path.exists(added_shard)
@@ -0,0 +1,83 @@
+from utils.database import get_db_connection, get_pending_blobs, save_to_pending
+from utils.document_store import store_text
+from utils.migrations import run_migrations
+from utils.compaction import archive_pending_invoices, compact_database
+
+
+def finalize_all(db_path):
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute("UPDATE pending_invoices SET is_finalized = 1, finalized_at = '2020-01-01T00:00:00'")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def pending_all_ids(db_path):
+    conn = get_db_connection(db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT id FROM pending_invoices_all ORDER BY id, is_archived')]
+    finally:
+        conn.close()
+
+
+def test_archived_rows_stay_readable(db_path):
+    first = save_to_pending({'invoice_number': 'A-1', 'raw_text': 'text one'}, db_path=db_path)
+    open_id = save_to_pending({'invoice_number': 'A-2'}, db_path=db_path)
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute("UPDATE pending_invoices SET is_finalized = 1, finalized_at = '2020-01-01T00:00:00' WHERE id = ?",
+                     (first,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert archive_pending_invoices(db_path, chunk_size=1) == 1
+
+    conn = get_db_connection(db_path)
+    try:
+        assert [row[0] for row in conn.execute('SELECT id FROM pending_invoices')] == [open_id]
+        archived = conn.execute('SELECT * FROM pending_invoices_all WHERE id = ?', (first,)).fetchone()
+        assert archived['is_archived'] == 1 and archived['invoice_number'] == 'A-1'
+        assert archived['raw_text_hash'] is not None
+        assert get_pending_blobs(conn, first, ['raw_text']) == {'raw_text': 'text one'}
+    finally:
+        conn.close()
+
+
+def test_ids_are_not_reused_after_archiving(legacy_db_path):
+    run_migrations(legacy_db_path)
+    finalize_all(legacy_db_path)
+    assert archive_pending_invoices(legacy_db_path) == 2
+
+    new_id = save_to_pending({'invoice_number': 'N-1'}, db_path=legacy_db_path)
+    assert new_id == 3
+
+    finalize_all(legacy_db_path)
+    assert archive_pending_invoices(legacy_db_path) == 1
+    assert pending_all_ids(legacy_db_path) == [1, 2, 3]
+
+
+def test_compaction_prunes_texts_of_archived_rows_only(db_path):
+    save_to_pending({'invoice_number': 'T-1', 'raw_text': 'kept while archived'}, db_path=db_path)
+    finalize_all(db_path)
+    result = compact_database(db_path)
+
+    assert result['archived'] == 1
+    assert result['texts_pruned'] == 0
+
+
+def test_shards_are_pruned_and_optimized(db_path, tmp_path):
+    shard = str(tmp_path / 'company-1.db')
+    run_migrations(shard)
+    conn = get_db_connection(shard)
+    try:
+        store_text(conn, 'text of an invoice deleted from the shard')
+        conn.commit()
+    finally:
+        conn.close()
+
+    result = compact_database(db_path, shard_paths=[shard])
+
+    assert result['shards'][shard]['texts_pruned'] == 1
+    assert 'freelist_after' in result['shards'][shard]['optimize']
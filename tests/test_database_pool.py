@@ -0,0 +1,45 @@
+from utils.database import get_db_connection, save_to_pending
+
+
+def test_nested_checkouts_get_their_own_connection(db_path):
+    outer = get_db_connection(db_path)
+    try:
+        inner = get_db_connection(db_path)
+        assert inner is not outer
+        inner.close()
+        inner.close()
+
+        # The released connection is reused, the outer one stays checked out
+        again = get_db_connection(db_path)
+        assert again is inner
+        again.close()
+    finally:
+        outer.close()
+
+
+def test_helper_commit_does_not_commit_callers_transaction(db_path):
+    conn = get_db_connection(db_path)
+    try:
+        pending_id = save_to_pending({'invoice_number': 'N-1'}, 'batch', db_path=db_path)
+
+        conn.execute('BEGIN')
+        conn.execute("UPDATE pending_invoices SET invoice_number = 'changed' WHERE id = ?", (pending_id,))
+        conn.rollback()
+
+        row = conn.execute('SELECT invoice_number FROM pending_invoices WHERE id = ?', (pending_id,)).fetchone()
+        assert row['invoice_number'] == 'N-1'
+    finally:
+        conn.close()
+
+
+def test_released_connection_drops_uncommitted_work(db_path):
+    conn = get_db_connection(db_path)
+    conn.execute('BEGIN')
+    conn.execute("INSERT INTO suppliers (name) VALUES ('Left open')")
+    conn.close()
+
+    conn = get_db_connection(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM suppliers WHERE name = 'Left open'").fetchone()[0] == 0
+    finally:
+        conn.close()
@@ -0,0 +1,69 @@
+from utils.database import get_db_connection, save_many_to_pending
+from utils.finalize import finalize_validated_files
+from utils.search import search_invoices
+
+
+def finalize(db_path, validated_files, batch_id=None):
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        result = finalize_validated_files(conn, batch_id, validated_files)
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+
+def test_document_text_is_searchable_after_finalize(db_path):
+    ids = save_many_to_pending([
+        {'invoice_number': 'D-1', 'supplier_name': 'ACME', 'raw_text': 'Wartungsvertrag Heizung', 'ocr_text': 'Seite 2'},
+    ], db_path=db_path)
+    result = finalize(db_path, [{'pending_id': ids[0], 'description': 'maintenance'}])
+
+    assert result['errors'] == []
+    found = search_invoices(db_path, 'heizung')
+    assert [row['id'] for row in found['results']] == [result['finalized'][0]['invoice_id']]
+
+    # Editing indexed columns keeps the document text in the index
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute("UPDATE invoices SET description = 'service' WHERE id = ?", (result['finalized'][0]['invoice_id'],))
+        conn.commit()
+    finally:
+        conn.close()
+    assert search_invoices(db_path, 'heizung')['total'] == 1
+    assert search_invoices(db_path, 'service')['total'] == 1
+
+
+def test_bad_rows_are_reported_without_failing_the_others(db_path):
+    ids = save_many_to_pending([
+        {'invoice_number': 'G-1', 'supplier_name': 'ACME', 'amount': '10,00 €'},
+        {'invoice_number': 'G-2', 'supplier_name': 'ACME'},
+        {'invoice_number': 'G-3', 'supplier_name': 'ACME'},
+    ], db_path=db_path)
+    result = finalize(db_path, [
+        {'pending_id': ids[0]},
+        {'pending_id': ids[1], 'amount_original': '9' * 20},
+        {'pending_id': ids[2], 'description': {'not': 'text'}},
+        {'pending_id': 999999},
+    ])
+
+    assert [row['pending_id'] for row in result['finalized']] == [ids[0]]
+    assert [(error['index'], error['pending_id']) for error in result['errors']] == [
+        (1, ids[1]), (2, ids[2]), (3, 999999)
+    ]
+    assert 'out of range' in result['errors'][0]['error']
+    assert 'Invalid description' in result['errors'][1]['error']
+    assert 'not found' in result['errors'][2]['error']
+
+
+def test_search_returns_the_weighted_rank_it_orders_by(db_path):
+    ids = save_many_to_pending([
+        {'invoice_number': 'W-1', 'supplier_name': 'Heizung Meier', 'raw_text': 'Rechnung'},
+        {'invoice_number': 'W-2', 'supplier_name': 'ACME', 'raw_text': 'Heizung Heizung Heizung Wartung'},
+    ], db_path=db_path)
+    assert finalize(db_path, [{'pending_id': pending_id} for pending_id in ids])['errors'] == []
+
+    results = search_invoices(db_path, 'heizung')['results']
+    assert [row['invoice_number'] for row in results] == ['W-1', 'W-2']
+    assert [row['rank'] for row in results] == sorted(row['rank'] for row in results)
@@ -0,0 +1,29 @@
+from utils.database import get_db_connection
+from utils.hot_folder import claim_file, record_result
+
+
+def hot_folder_status(db_path, content_hash):
+    conn = get_db_connection(db_path)
+    try:
+        row = conn.execute('SELECT status FROM hot_folder_files WHERE content_hash = ?', (content_hash,)).fetchone()
+        return row['status'] if row else None
+    finally:
+        conn.close()
+
+
+def test_retried_and_dead_lettered_files_keep_their_own_status(db_path):
+    for status in ('queued_for_retry', 'dead_lettered'):
+        claim_file(db_path, status, f'/hot/{status}.pdf')
+        record_result(db_path, status, {'success': False, 'status': status, 'error': 'Ollama down'})
+        assert hot_folder_status(db_path, status) == status
+
+
+def test_failed_file_can_be_ingested_again(db_path):
+    claim_file(db_path, 'abc', '/hot/a.pdf')
+    record_result(db_path, 'abc', {'success': False, 'status': 'error', 'error': 'Database error'})
+    assert hot_folder_status(db_path, 'abc') is None
+    assert claim_file(db_path, 'abc', '/hot/a.pdf')
+
+    record_result(db_path, 'abc', {'success': True, 'pending_id': 7})
+    assert hot_folder_status(db_path, 'abc') == 'processed'
+    assert not claim_file(db_path, 'abc', '/hot/a.pdf')
@@ -0,0 +1,109 @@
+import os
+import time
+import threading
+
+import pytest
+
+from utils.database import get_db_connection, save_to_pending
+from utils.processing import invoice_processor
+
+
+class Upload:
+    """Minimal FileStorage stand-in"""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.data = data
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+
+@pytest.fixture
+def app_config(db_path, tmp_path):
+    return {
+        'DATABASE': db_path,
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'PREVIEW_FOLDER': str(tmp_path / 'previews'),
+        'ALLOWED_EXTENSIONS': {'pdf'},
+    }
+
+
+@pytest.fixture
+def slow_extraction(monkeypatch):
+    """Extraction that blocks until released and counts its runs"""
+    release = threading.Event()
+    runs = []
+
+    def extract(file_path, filename, selected_model, app_config, scanner_class):
+        runs.append(file_path)
+        release.wait(5)
+        return {'invoice_number': 'SF-1', 'supplier_name': 'ACME', 'amount': '10,00'}, True, 'text', ''
+
+    monkeypatch.setattr(invoice_processor, '_extract_invoice_data', extract)
+    monkeypatch.setattr(invoice_processor, 'create_preview', lambda file_path, preview_dir: None)
+    return release, runs
+
+
+def process(app_config, upload, batch_id):
+    return invoice_processor.process_invoice_file(
+        upload, app_config, None,
+        lambda file_path: {'is_duplicate': False},
+        lambda file_path, size: 'test-model',
+        lambda data, batch_id, source_info: save_to_pending(data, batch_id, source_info, app_config['DATABASE']),
+        None, batch_id=batch_id, source='batch_upload'
+    )
+
+
+def run_concurrently(app_config, uploads, slow_extraction):
+    """Start the first upload, let the others join its flight, then release the extraction"""
+    release, runs = slow_extraction
+    results = [None] * len(uploads)
+
+    def run(index, upload, batch_id):
+        results[index] = process(app_config, upload, batch_id)
+
+    threads = [threading.Thread(target=run, args=(index, upload, batch_id))
+               for index, (upload, batch_id) in enumerate(uploads)]
+    threads[0].start()
+    while not runs:
+        time.sleep(0.01)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def pending_rows(db_path):
+    conn = get_db_connection(db_path)
+    try:
+        return [dict(row) for row in conn.execute('SELECT id, batch_id, file_path FROM pending_invoices').fetchall()]
+    finally:
+        conn.close()
+
+
+def test_identical_uploads_share_one_pending_row(app_config, slow_extraction):
+    leader, follower = run_concurrently(app_config, [(Upload('a.pdf', b'%PDF same'), 'batch-a'),
+                                                     (Upload('b.pdf', b'%PDF same'), 'batch-b')], slow_extraction)
+
+    assert len(slow_extraction[1]) == 1
+    assert follower['success'] and follower.get('shared_result') is True
+    assert follower['pending_id'] == leader['pending_id']
+    assert follower['file_path'] == leader['file_path']
+    assert pending_rows(app_config['DATABASE']) == [
+        {'id': leader['pending_id'], 'batch_id': 'batch-a', 'file_path': leader['file_path']}
+    ]
+    assert not os.path.exists(os.path.join(app_config['UPLOAD_FOLDER'], 'b.pdf'))
+
+
+def test_identical_upload_in_the_same_batch_is_a_duplicate(app_config, slow_extraction):
+    leader, follower = run_concurrently(app_config, [(Upload('a.pdf', b'%PDF same'), 'batch-a'),
+                                                     (Upload('c.pdf', b'%PDF same'), 'batch-a')], slow_extraction)
+
+    assert follower['is_duplicate'] and not follower['success']
+    assert follower['pending_id'] == leader['pending_id']
+    assert len(pending_rows(app_config['DATABASE'])) == 1
@@ -0,0 +1,69 @@
+import sqlite3
+
+from utils.database import get_db_connection
+from utils.migrations import MIGRATIONS, run_migrations, get_schema_version
+from utils.document_store import load_text
+from utils.backfill import run_pending_backfills
+
+
+def test_fresh_database_reaches_latest_version(db_path):
+    conn = get_db_connection(db_path)
+    try:
+        assert get_schema_version(conn) == MIGRATIONS[-1][0]
+    finally:
+        conn.close()
+    # Once current, running again is a no-op
+    assert run_migrations(db_path) == MIGRATIONS[-1][0]
+
+
+def test_legacy_database_is_upgraded_in_place(legacy_db_path):
+    assert run_migrations(legacy_db_path) == MIGRATIONS[-1][0]
+    run_pending_backfills(legacy_db_path, pause=0)
+
+    conn = get_db_connection(legacy_db_path)
+    try:
+        invoices = conn.execute(
+            'SELECT invoice_number, invoice_number_key, amount_cents, currency, invoice_date_iso, raw_text_hash '
+            'FROM invoices ORDER BY id'
+        ).fetchall()
+        assert [tuple(row)[:5] for row in invoices] == [
+            ('RE-2023/001', 'RE2023001', 123456, 'EUR', '2023-01-15'),
+            ('INV 77', 'INV77', 9900, 'USD', '2023-02-01'),
+        ]
+        assert load_text(conn, invoices[0]['raw_text_hash']) == 'Rechnung RE-2023/001 ACME'
+
+        # Pending text moved to the blob side table
+        blob = conn.execute('SELECT raw_text_hash, extracted_data FROM pending_invoice_blobs WHERE pending_id = 1').fetchone()
+        assert load_text(conn, blob['raw_text_hash']) == 'Rechnung'
+        assert blob['extracted_data'] == '{}'
+
+        # Search and dashboard statistics cover the existing invoices
+        assert conn.execute("SELECT COUNT(*) FROM invoice_fts WHERE invoice_fts MATCH 'globex'").fetchone()[0] == 1
+        assert conn.execute('SELECT invoice_count FROM dashboard_stats WHERE id = 1').fetchone()[0] == 2
+
+        table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'pending_invoices'").fetchone()[0]
+        assert 'AUTOINCREMENT' in table_sql.upper()
+        assert [row[0] for row in conn.execute('SELECT id FROM pending_invoices ORDER BY id')] == [1, 2]
+
+        # The audit view carries the columns added after it was first created
+        view_columns = {row[1] for row in conn.execute('PRAGMA table_info(pending_invoices_all)')}
+        assert {'file_hash', 'duplicate_score', 'duplicate_candidates', 'archive_id'} <= view_columns
+    finally:
+        conn.close()
+
+
+def test_migrations_can_stop_at_a_target_version(legacy_db_path):
+    assert run_migrations(legacy_db_path, target_version=2) == 2
+    assert run_migrations(legacy_db_path) == MIGRATIONS[-1][0]
+
+
+def test_invoices_are_writable_without_python_sql_functions(db_path):
+    # e.g. the sqlite3 shell or a raw connection in backup tooling
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("INSERT INTO invoices (invoice_number, description) VALUES ('S-1', 'shell insert')")
+        conn.execute("UPDATE invoices SET description = 'shell edit' WHERE invoice_number = 'S-1'")
+        conn.commit()
+        assert conn.execute("SELECT description FROM invoice_fts WHERE invoice_fts MATCH 'edit'").fetchone() == ('shell edit',)
+    finally:
+        conn.close()
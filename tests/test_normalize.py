@@ -0,0 +1,69 @@
+import pytest
+
+from utils.normalize import (
+    normalize_invoice_number, parse_amount_cents, amount_out_of_range, detect_currency, normalize_date_iso,
+    typed_invoice_values
+)
+
+
+@pytest.mark.parametrize('raw, key', [
+    ('re-2023/001', 'RE2023001'),
+    ('RE 2023 001', 'RE2023001'),
+    ('  inv_77 ', 'INV77'),
+    (12345, '12345'),
+    ('Nicht gefunden', None),
+    ('N/A', None),
+    ('', None),
+    (None, None),
+])
+def test_invoice_number_key(raw, key):
+    assert normalize_invoice_number(raw) == key
+
+
+@pytest.mark.parametrize('raw, cents', [
+    ('1.234,56 €', 123456),
+    ('$1,234.56', 123456),
+    ('1234.5', 123450),
+    ('1.234', 123400),
+    ('-12,30 EUR', -1230),
+    ('(5.00)', -500),
+    (99.995, 10000),
+    (7, 700),
+    ('Nicht gefunden', None),
+    ('', None),
+    (True, None),
+    ('9' * 20, None),
+    (float('inf'), None),
+])
+def test_amount_cents(raw, cents):
+    assert parse_amount_cents(raw) == cents
+
+
+def test_currency_prefers_codes_then_symbols():
+    assert detect_currency('CHF 12.00') == 'CHF'
+    assert detect_currency(None, '£3.00') == 'GBP'
+    assert detect_currency('12,00') == 'EUR'
+
+
+@pytest.mark.parametrize('raw, iso', [
+    ('15.01.2023', '2023-01-15'),
+    ('2023-01-15', '2023-01-15'),
+    ('03/04/2023', '2023-04-03'),
+    ('15.01.23', '2023-01-15'),
+    ('not a date', None),
+    (None, None),
+])
+def test_date_iso_is_day_first(raw, iso):
+    assert normalize_date_iso(raw) == iso
+
+
+def test_typed_values_leave_currency_empty_without_amounts():
+    assert typed_invoice_values('Nicht gefunden', '', '01.02.2023') == {
+        'amount_cents': None, 'vat_cents': None, 'currency': None, 'invoice_date_iso': '2023-02-01'
+    }
+
+
+def test_amounts_too_large_to_store_have_no_typed_value():
+    assert amount_out_of_range('9' * 20) and not amount_out_of_range('92233720368547758,07')
+    assert parse_amount_cents('92233720368547758,07') == 2 ** 63 - 1
+    assert typed_invoice_values('9' * 20, '1,00', None)['amount_cents'] is None
@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from utils.pagination import ListQuery, PaginationError, encode_cursor, decode_cursor
+
+ITEMS = ListQuery(
+    from_clause='FROM items',
+    columns={'id': 'id', 'name': 'name', 'amount': 'amount'},
+    sort_keys={'id': 'id', 'amount': 'COALESCE(amount, 0)'},
+    default_sort='id',
+    id_column='id'
+)
+
+
+def connect(rows, path=':memory:'):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, amount INTEGER)')
+    conn.executemany('INSERT INTO items VALUES (?, ?, ?)', rows)
+    return conn
+
+
+# Amounts repeat so pages break inside runs of equal sort values
+ROWS = [(n, f'item {n}', None if n % 7 == 0 else n % 4) for n in range(1, 24)]
+
+
+def walk(fetch, args):
+    ids, cursor = [], None
+    while True:
+        page = fetch(dict(args, cursor=cursor) if cursor else args)
+        ids.extend(item['id'] for item in page['items'])
+        if not page['has_more']:
+            assert page['next_cursor'] is None
+            return ids
+        cursor = page['next_cursor']
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_cursors_visit_every_row_once_in_order(order):
+    conn = connect(ROWS)
+    ids = walk(lambda args: ITEMS.page(conn, args), {'sort': 'amount', 'order': order, 'limit': '4'})
+
+    expected = sorted(ROWS, key=lambda row: (row[2] or 0, row[0]), reverse=order == 'desc')
+    assert ids == [row[0] for row in expected]
+
+
+def test_merged_pages_match_a_single_database(tmp_path):
+    paths = {'even': str(tmp_path / 'even.db'), 'odd': str(tmp_path / 'odd.db')}
+    for name, path in paths.items():
+        conn = connect([row for row in ROWS if row[0] % 2 == (name == 'odd')], path)
+        conn.commit()
+        conn.close()
+
+    def open_shard(name):
+        conn = sqlite3.connect(paths[name])
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    args = {'sort': 'amount', 'order': 'desc', 'limit': '5'}
+    merged = walk(lambda page_args: ITEMS.page_merged(open_shard, list(paths), page_args), args)
+    single = connect(ROWS)
+    assert merged == walk(lambda page_args: ITEMS.page(single, page_args), args)
+
+
+def test_cursor_from_another_sort_is_rejected():
+    conn = connect(ROWS)
+    cursor = ITEMS.page(conn, {'sort': 'amount', 'limit': '2'})['next_cursor']
+    with pytest.raises(PaginationError):
+        ITEMS.page(conn, {'sort': 'id', 'cursor': cursor})
+
+
+def test_cursor_round_trip_and_garbage():
+    assert decode_cursor(encode_cursor('amount', 'asc', 'ä', 7)) == ('amount', 'asc', 'ä', 7)
+    with pytest.raises(PaginationError):
+        decode_cursor('not-a-cursor')
@@ -0,0 +1,38 @@
+import pytest
+
+from utils.database import get_db_connection, PendingWriteBuffer, PendingRef
+
+
+def pending_count(db_path):
+    conn = get_db_connection(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM pending_invoices').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_buffer_flushes_when_full(db_path):
+    buffer = PendingWriteBuffer(db_path, max_rows=2, max_delay=60)
+    refs = [buffer.save({'invoice_number': f'B-{n}'}, 'batch') for n in range(3)]
+
+    assert pending_count(db_path) == 2
+    assert [ref.pending_id is not None for ref in refs] == [True, True, False]
+    assert buffer.resolve({'ids': refs})['ids'] == [1, 2, 3]
+    assert pending_count(db_path) == 3
+
+
+def test_buffer_flushes_rows_that_waited_too_long(db_path):
+    buffer = PendingWriteBuffer(db_path, max_rows=50, max_delay=0)
+    ref = buffer.save({'invoice_number': 'T-1'})
+
+    assert isinstance(ref, PendingRef) and ref.pending_id == 1
+    assert pending_count(db_path) == 1
+
+
+def test_rows_are_written_when_the_loop_fails(db_path):
+    with pytest.raises(RuntimeError):
+        with PendingWriteBuffer(db_path, max_rows=50, max_delay=60) as buffer:
+            buffer.save({'invoice_number': 'X-1'})
+            raise RuntimeError('extraction crashed')
+
+    assert pending_count(db_path) == 1
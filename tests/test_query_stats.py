@@ -0,0 +1,27 @@
+import pytest
+
+from utils.metrics import percentile
+from utils.query_stats import QueryStats
+
+
+def test_string_false_disables_collection():
+    stats = QueryStats()
+    stats.configure(enabled=True)
+    stats.configure(enabled='false')
+    assert stats.enabled is False
+    stats.configure(enabled='Yes')
+    assert stats.enabled is True
+
+
+def test_unknown_enabled_value_is_rejected_without_changes():
+    stats = QueryStats(slow_ms=100)
+    with pytest.raises(ValueError):
+        stats.configure(enabled='maybe', slow_ms=5)
+    assert stats.enabled is False and stats.slow_ms == 100
+
+
+def test_percentile_is_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+    assert percentile(values, 50) == 3
+    assert percentile(values, 95) == 5
+    assert percentile([], 95) == 0.0
@@ -0,0 +1,26 @@
+from utils.batches import add_batch_queue_file
+from utils.database import get_db_connection
+from utils.retry_queue import is_transient_failure
+
+
+def test_only_infrastructure_failures_are_retried():
+    assert is_transient_failure({'success': False, 'error_type': 'timeout'})
+    assert is_transient_failure({'success': False, 'error_type': 'ocr_error'})
+    assert not is_transient_failure({'success': False, 'error_type': 'processing_error'})
+    assert not is_transient_failure({'success': False, 'error_type': 'parse_error'})
+
+
+def test_retried_file_is_queued_after_the_batch_files(db_path):
+    conn = get_db_connection(db_path)
+    try:
+        add_batch_queue_file(conn, 'b1', '/up/a.pdf', None, 'a.pdf', 'pending', 1, position=3)
+        queue_id = add_batch_queue_file(conn, 'b1', '/up/b.pdf', '/prev/b.png', 'b.pdf', 'pending', 2)
+        add_batch_queue_file(conn, 'b2', '/up/c.pdf', None, 'c.pdf', 'pending_validation', 3)
+        conn.commit()
+
+        row = conn.execute('SELECT position, pending_id, preview_path FROM batch_queue WHERE id = ?',
+                           (queue_id,)).fetchone()
+        assert tuple(row) == (4, 2, '/prev/b.png')
+        assert conn.execute("SELECT position FROM batch_queue WHERE batch_id = 'b2'").fetchone()[0] == 1
+    finally:
+        conn.close()
@@ -0,0 +1,113 @@
+import pytest
+
+from utils.database import get_db_connection, save_many_to_pending, check_invoice_exists
+from utils.sharding import ShardRouter, shard_of_invoice
+
+
+@pytest.fixture
+def router(db_path, tmp_path):
+    router = ShardRouter(db_path, str(tmp_path / 'shards'), max_workers=2)
+    yield router
+    router.shutdown()
+
+
+def pending(db_path, *invoices):
+    return save_many_to_pending([
+        dict({'supplier_name': 'ACME', 'amount_original': '100.00', 'invoice_date': '2024-01-15'}, **invoice)
+        for invoice in invoices
+    ], db_path=db_path)
+
+
+def finalize(router, pending_ids):
+    return router.finalize(None, [{'pending_id': pending_id} for pending_id in pending_ids])
+
+
+def test_invoices_go_to_their_company_shard(router, db_path):
+    ids = pending(db_path, {'invoice_number': 'A-1', 'company_name': 'North'},
+                  {'invoice_number': 'A-2', 'company_name': 'South'},
+                  {'invoice_number': 'A-3'})
+    result = finalize(router, ids)
+
+    assert result['errors'] == []
+    shards = [shard_of_invoice(item['invoice_id']) for item in result['finalized']]
+    assert shards[0] != shards[1] and 0 not in shards[:2]
+    assert shards[2] == 0
+
+
+def test_duplicate_number_in_another_shard_is_rejected(router, db_path):
+    first = pending(db_path, {'invoice_number': 'RE-2024/001', 'company_name': 'North'})
+    assert finalize(router, first)['errors'] == []
+
+    second = pending(db_path, {'invoice_number': 're 2024 001', 'company_name': 'South'},
+                     {'invoice_number': 'RE-2024/001'})
+    result = finalize(router, second)
+
+    assert result['finalized'] == []
+    assert [error['pending_id'] for error in result['errors']] == second
+    assert all(error['is_duplicate'] for error in result['errors'])
+    assert check_invoice_exists('RE-2024-001', db_path, 'ACME')
+    assert not check_invoice_exists('RE-2024-001', db_path, 'Other Supplier')
+
+
+def test_duplicates_within_one_request_across_shards(router, db_path):
+    ids = pending(db_path, {'invoice_number': 'X-9', 'company_name': 'North'},
+                  {'invoice_number': 'X-9', 'company_name': 'South'})
+    result = finalize(router, ids)
+
+    assert [item['pending_id'] for item in result['finalized']] == ids[:1]
+    assert [error['pending_id'] for error in result['errors']] == ids[1:]
+
+
+def test_registry_follows_edits_and_deletes(router, db_path):
+    ids = pending(db_path, {'invoice_number': 'E-1', 'company_name': 'North'},
+                  {'invoice_number': 'E-2', 'company_name': 'South'})
+    first, second = (item['invoice_id'] for item in finalize(router, ids)['finalized'])
+
+    conn = get_db_connection(db_path)
+    try:
+        supplier_id = conn.execute("SELECT id FROM suppliers WHERE name = 'ACME'").fetchone()[0]
+    finally:
+        conn.close()
+    assert not router.register_invoice(second, 'E1', supplier_id)
+    assert router.register_invoice(second, 'E3', supplier_id)
+    assert check_invoice_exists('E-3', db_path, 'ACME')
+    assert not check_invoice_exists('E-2', db_path, 'ACME')
+
+    router.forget_invoice(first)
+    assert not check_invoice_exists('E-1', db_path, 'ACME')
+
+
+def test_failed_rows_release_their_numbers(router, db_path):
+    ids = pending(db_path, {'invoice_number': 'F-1', 'company_name': 'North'})
+    result = router.finalize(None, [{'pending_id': ids[0], 'invoice_number': 'F-1'},
+                                    {'pending_id': 999999, 'invoice_number': 'F-2'}])
+
+    assert len(result['finalized']) == 1
+    assert not check_invoice_exists('F-2', db_path)
+    conn = get_db_connection(db_path)
+    try:
+        assert conn.execute('SELECT COUNT(*) FROM invoice_number_registry WHERE invoice_id IS NULL').fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_rolled_back_route_is_not_cached(router, db_path, monkeypatch):
+    ids = pending(db_path, {'invoice_number': 'R-1', 'company_name': 'North'})
+
+    def fail(*args):
+        raise RuntimeError('catalog write failed')
+
+    monkeypatch.setattr(router, '_reserve_number', fail)
+    with pytest.raises(RuntimeError):
+        finalize(router, ids)
+    assert router.shard_paths() == [db_path]
+    monkeypatch.undo()
+
+    result = finalize(router, ids)
+    assert result['errors'] == []
+    conn = get_db_connection(db_path)
+    try:
+        shard_no = conn.execute('SELECT shard_no FROM company_shards').fetchone()[0]
+    finally:
+        conn.close()
+    assert shard_of_invoice(result['finalized'][0]['invoice_id']) == shard_no
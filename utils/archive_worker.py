@@ -0,0 +1,163 @@
+import os
+import queue
+import logging
+import threading
+
+from utils.database import get_db_connection
+from utils.file_utils import organize_file, cleanup_processed_files
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+class ArchiveWorker:
+    """Background thread that moves finalized invoice files into the archive
+
+    Validation requests only enqueue (invoice_id, file_path); the worker
+    copies each file to the archive, points invoices.file_path at the
+    archived copy (one transaction per drained group of jobs) and removes
+    the upload or temp original. With per-company shards, route maps an
+    invoice ID to the database holding it.
+
+    Jobs are recorded in invoices.archive_pending before they are queued,
+    so start() can re-queue whatever a previous process left unarchived;
+    databases lists every database to scan (the shards, if any).
+    """
+
+    def __init__(self, db_path, archive_dir, upload_folder=None, preview_folder=None,
+                 temp_folder=None, batch_size=50, route=None, databases=None):
+        self.db_path = db_path
+        self.route = route
+        self.databases = databases
+        self.archive_dir = archive_dir
+        self.upload_folder = upload_folder
+        self.preview_folder = preview_folder
+        self.temp_folder = temp_folder
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self, recover=True):
+        """Start the worker thread, first re-queueing unfinished jobs if recover is set"""
+        if recover:
+            self._recover()
+        self._thread = threading.Thread(target=self._run, name='invoice-archive-worker', daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, invoice_id, file_path):
+        """Queue a finalized invoice's file for archiving"""
+        self.submit_many([(invoice_id, file_path)])
+
+    def submit_many(self, jobs):
+        """Record (invoice_id, file_path) jobs on their invoices, then queue them"""
+        jobs = [(invoice_id, file_path) for invoice_id, file_path in jobs if file_path]
+        for db_path, group in self._by_database(jobs).items():
+            conn = get_db_connection(db_path)
+            try:
+                conn.executemany('UPDATE invoices SET archive_pending = 1 WHERE id = ?',
+                                 [(invoice_id,) for invoice_id, _ in group])
+                conn.commit()
+            except Exception as e:
+                # Still archived now, just not picked up again after a restart
+                log.error(f"Error recording archive jobs: {str(e)}")
+            finally:
+                conn.close()
+        for job in jobs:
+            self._queue.put(job)
+
+    def pending(self):
+        """Number of files waiting to be archived"""
+        return self._queue.qsize()
+
+    def stop(self):
+        """Stop the worker once the queued files are archived"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def _by_database(self, items):
+        """Group (invoice_id, ...) tuples by the database holding the invoice"""
+        by_database = {}
+        for item in items:
+            db_path = (self.route(item[0]) if self.route else None) or self.db_path
+            by_database.setdefault(db_path, []).append(item)
+        return by_database
+
+    def _recover(self):
+        """Queue the jobs a previous process recorded but did not finish"""
+        recovered = 0
+        for db_path in (self.databases() if self.databases else [self.db_path]):
+            conn = get_db_connection(db_path)
+            try:
+                rows = conn.execute(
+                    'SELECT id, file_path FROM invoices WHERE archive_pending = 1 ORDER BY id'
+                ).fetchall()
+            except Exception as e:
+                log.error(f"Error reading archive jobs from {db_path}: {str(e)}")
+                continue
+            finally:
+                conn.close()
+            for row in rows:
+                self._queue.put((row['id'], row['file_path']))
+            recovered += len(rows)
+        if recovered:
+            log.info(f"Re-queued {recovered} unfinished archive jobs")
+
+    def _run(self):
+        """Worker loop"""
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            try:
+                jobs = [self._queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._archive(jobs)
+
+    def _archive(self, jobs):
+        """Archive a group of files and record their new paths"""
+        moved = []
+        missing = []
+        for invoice_id, file_path in jobs:
+            try:
+                archive_path = organize_file(file_path, self.archive_dir)
+            except Exception as e:
+                log.warning(f"Error archiving {file_path} for invoice {invoice_id}: {str(e)}")
+                continue
+            if archive_path:
+                moved.append((archive_path, invoice_id, file_path))
+            else:
+                log.warning(f"File for invoice {invoice_id} no longer exists: {file_path}")
+                missing.append((invoice_id, None))
+
+        # Jobs whose file is gone are done too; failed copies stay recorded for the next start
+        done = [(invoice_id, archive_path) for archive_path, invoice_id, _ in moved] + missing
+        for db_path, updates in self._by_database(done).items():
+            conn = get_db_connection(db_path)
+            try:
+                conn.executemany(
+                    'UPDATE invoices SET file_path = COALESCE(?, file_path), archive_pending = 0 WHERE id = ?',
+                    [(archive_path, invoice_id) for invoice_id, archive_path in updates]
+                )
+                conn.commit()
+            except Exception as e:
+                log.error(f"Error recording archived file paths: {str(e)}")
+                return
+            finally:
+                conn.close()
+
+        # Originals are only removed once the database points at the archived copy
+        for archive_path, invoice_id, file_path in moved:
+            if self.temp_folder and self.temp_folder in file_path:
+                try:
+                    os.remove(file_path)
+                    log.info(f"Cleaned up temporary file after archiving: {file_path}")
+                except OSError as e:
+                    log.warning(f"Error cleaning up temporary file {file_path}: {str(e)}")
+            else:
+                cleanup_processed_files(file_path, archive_path, self.upload_folder, self.preview_folder)
+        log.info(f"Archived {len(moved)} of {len(jobs)} invoice files")
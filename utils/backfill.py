@@ -0,0 +1,141 @@
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+from utils.database import get_db_connection
+from utils.normalize import normalize_invoice_number, typed_invoice_values
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+def _invoice_number_key(row):
+    """Compute the invoice_number_key column for an invoices row"""
+    return {'invoice_number_key': normalize_invoice_number(row['invoice_number'])}
+
+def _invoice_typed_columns(row):
+    """Compute amount_cents, vat_cents, currency and invoice_date_iso for an invoices row"""
+    return typed_invoice_values(row['amount_original'], row['vat_amount_original'], row['invoice_date'])
+
+# Registered backfills: name -> (table, source columns, compute function).
+# The compute function returns the column values to write, or None to skip the row.
+BACKFILLS = {
+    'invoice_number_key': ('invoices', ['invoice_number'], _invoice_number_key),
+    'invoice_typed_columns': ('invoices', ['amount_original', 'vat_amount_original', 'invoice_date'], _invoice_typed_columns),
+}
+
+def get_backfill_progress(db_path, name=None):
+    """Return stored progress for one backfill, or all of them"""
+    conn = get_db_connection(db_path)
+    try:
+        if name:
+            row = conn.execute('SELECT * FROM backfill_progress WHERE name = ?', (name,)).fetchone()
+            return dict(row) if row else None
+        return [dict(row) for row in conn.execute('SELECT * FROM backfill_progress ORDER BY name').fetchall()]
+    finally:
+        conn.close()
+
+def run_backfill(db_path, name, chunk_size=1000, pause=0.05, stop_event=None):
+    """Run (or resume) a registered backfill in id-ordered chunks
+
+    Each chunk is written in its own short transaction together with the
+    progress marker, so the job can be interrupted at any time and resumes
+    after the last completed chunk. Rows whose new values violate a unique
+    constraint are left unchanged and counted as conflicts.
+
+    Returns:
+        dict: Final progress row
+    """
+    table, columns, compute = BACKFILLS[name]
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute('''
+            INSERT OR IGNORE INTO backfill_progress (name, last_id, rows_updated, conflicts, started_at)
+            VALUES (?, 0, 0, 0, ?)
+        ''', (name, datetime.now().isoformat()))
+        conn.commit()
+
+        progress = conn.execute('SELECT * FROM backfill_progress WHERE name = ?', (name,)).fetchone()
+        if progress['completed_at']:
+            return dict(progress)
+
+        last_id = progress['last_id'] or 0
+        updated = progress['rows_updated'] or 0
+        conflicts = progress['conflicts'] or 0
+        log.info(f"Running backfill {name} from id {last_id}")
+
+        while not (stop_event and stop_event.is_set()):
+            rows = conn.execute(f'''
+                SELECT id, {', '.join(columns)} FROM {table}
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+
+            if not rows:
+                conn.execute('''
+                    UPDATE backfill_progress SET completed_at = ?, updated_at = ? WHERE name = ?
+                ''', (datetime.now().isoformat(), datetime.now().isoformat(), name))
+                conn.commit()
+                log.info(f"Backfill {name} complete: {updated} rows updated, {conflicts} conflicts")
+                break
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for row in rows:
+                    values = compute(row)
+                    if not values:
+                        continue
+                    assignments = ', '.join(f"{column} = ?" for column in values)
+                    try:
+                        conn.execute('SAVEPOINT backfill_row')
+                        conn.execute(
+                            f'UPDATE {table} SET {assignments} WHERE id = ?',
+                            list(values.values()) + [row['id']]
+                        )
+                        conn.execute('RELEASE backfill_row')
+                        updated += 1
+                    except sqlite3.IntegrityError as e:
+                        conn.execute('ROLLBACK TO backfill_row')
+                        conn.execute('RELEASE backfill_row')
+                        conflicts += 1
+                        log.warning(f"Backfill {name}: {table} row {row['id']} conflicts with an existing row ({str(e)})")
+
+                last_id = rows[-1]['id']
+                conn.execute('''
+                    UPDATE backfill_progress
+                    SET last_id = ?, rows_updated = ?, conflicts = ?, updated_at = ?
+                    WHERE name = ?
+                ''', (last_id, updated, conflicts, datetime.now().isoformat(), name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            # Give interactive writers a chance to get the write lock
+            if pause:
+                time.sleep(pause)
+
+        return dict(conn.execute('SELECT * FROM backfill_progress WHERE name = ?', (name,)).fetchone())
+    finally:
+        conn.close()
+
+def run_pending_backfills(db_path, chunk_size=1000, pause=0.05, stop_event=None):
+    """Run every registered backfill that has not completed yet"""
+    for name in BACKFILLS:
+        if stop_event and stop_event.is_set():
+            break
+        try:
+            run_backfill(db_path, name, chunk_size, pause, stop_event)
+        except Exception as e:
+            log.error(f"Backfill {name} failed: {str(e)}", exc_info=True)
+
+def start_backfill_thread(db_path, chunk_size=1000, pause=0.05):
+    """Run pending backfills in a background thread"""
+    thread = threading.Thread(
+        target=run_pending_backfills,
+        args=(db_path, chunk_size, pause),
+        name='schema-backfill',
+        daemon=True
+    )
+    thread.start()
+    return thread
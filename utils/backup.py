@@ -0,0 +1,329 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+from utils.name_resolver import name_resolver
+from utils.worker_lock import try_worker_lock
+from utils.sharding import shard_database_paths
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Pages copied per backup step and the pause between steps. With 4 KiB pages
+# this copies ~1 MB at a time and leaves the disk to the upload paths in between.
+BACKUP_STEP_PAGES = 256
+BACKUP_STEP_PAUSE = 0.01
+
+SNAPSHOT_SUFFIX = '.db'
+PARTIAL_SUFFIX = '.partial'
+
+class BackupError(Exception):
+    """Snapshot could not be created, failed verification or cannot be restored"""
+
+def _snapshot_prefix(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0] + '-'
+
+def _shard_paths(db_path, shard_dir):
+    try:
+        return shard_database_paths(db_path, shard_dir)
+    except ValueError as e:
+        raise BackupError(str(e))
+
+def verify_snapshot(path):
+    """Run PRAGMA integrity_check on a snapshot
+
+    Returns:
+        list: Problems found (empty if the snapshot is intact)
+    """
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        rows = [row[0] for row in conn.execute('PRAGMA integrity_check').fetchall()]
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    finally:
+        conn.close()
+    return [] if rows == ['ok'] else rows
+
+def create_snapshot(db_path, backup_dir, pages=BACKUP_STEP_PAGES, pause=BACKUP_STEP_PAUSE, verify=True,
+                    created_at=None):
+    """Copy the live database to a timestamped snapshot without blocking writers
+
+    The copy runs inside one read transaction on a dedicated connection, so
+    it sees a single consistent state and (in WAL mode) writers carry on
+    committing; without it every concurrent commit would restart the copy.
+    Pages are copied in steps with a pause in between. The snapshot is
+    written to a .partial file and only renamed once it passes
+    integrity_check.
+
+    Returns:
+        dict: path, size in bytes, pages, elapsed seconds and created_at
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    created_at = created_at or datetime.now()
+    name = f"{_snapshot_prefix(db_path)}{created_at.strftime('%Y%m%d-%H%M%S-%f')}{SNAPSHOT_SUFFIX}"
+    path = os.path.join(backup_dir, name)
+    partial = path + PARTIAL_SUFFIX
+    if os.path.exists(path) or os.path.exists(partial):
+        raise BackupError(f"Snapshot {path} already exists")
+    started = time.perf_counter()
+
+    source = sqlite3.connect(db_path, isolation_level=None)
+    target = sqlite3.connect(partial)
+    try:
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()  # starts the read transaction
+        progress = {}
+
+        def step(status, remaining, total):
+            progress['total'] = total
+            if remaining and pause:
+                time.sleep(pause)
+
+        source.backup(target, pages=pages, progress=step)
+        source.execute('COMMIT')
+        # A copy of a WAL database is itself in WAL mode; keep snapshots as single files
+        target.execute('PRAGMA journal_mode = DELETE')
+    except sqlite3.Error as e:
+        target.close()
+        _remove(partial)
+        raise BackupError(f"Snapshot of {db_path} failed: {str(e)}")
+    finally:
+        source.close()
+        target.close()
+
+    if verify:
+        problems = verify_snapshot(partial)
+        if problems:
+            _remove(partial)
+            raise BackupError(f"Snapshot of {db_path} failed integrity check: {'; '.join(problems[:5])}")
+    os.replace(partial, path)
+
+    result = {
+        'path': path,
+        'size': os.path.getsize(path),
+        'pages': progress.get('total'),
+        'elapsed': round(time.perf_counter() - started, 3),
+        'created_at': created_at.isoformat(),
+        'verified': bool(verify)
+    }
+    log.info(f"Created database snapshot {path} ({result['size']} bytes in {result['elapsed']}s)")
+    return result
+
+def create_snapshot_set(db_path, backup_dir, shard_dir=None, **options):
+    """Snapshot the catalog and then every per-company shard it lists, under one timestamp
+
+    The shards are the ones named in the catalog snapshot, so a restore
+    finds a snapshot for each. The files are copied one after another, not
+    at one point in time: an invoice finalized meanwhile can be in its shard
+    snapshot while the catalog snapshot still lists it as pending.
+
+    Returns:
+        dict: create_snapshot result for db_path, with the shard results under 'shards'
+    """
+    created_at = datetime.now()
+    result = create_snapshot(db_path, backup_dir, created_at=created_at, **options)
+    result['shards'] = [
+        create_snapshot(path, backup_dir, created_at=created_at, **options)
+        for path in _shard_paths(result['path'], shard_dir)
+    ]
+    return result
+
+def list_snapshots(db_path, backup_dir):
+    """Snapshots of db_path in backup_dir, newest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    prefix = _snapshot_prefix(db_path)
+    snapshots = []
+    for name in os.listdir(backup_dir):
+        if name.startswith(prefix) and name.endswith(SNAPSHOT_SUFFIX):
+            path = os.path.join(backup_dir, name)
+            stat = os.stat(path)
+            snapshots.append({
+                'name': name,
+                'path': path,
+                'size': stat.st_size,
+                'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
+            })
+    # Names embed the timestamp, so they sort chronologically
+    return sorted(snapshots, key=lambda snapshot: snapshot['name'], reverse=True)
+
+def prune_snapshot_sets(db_path, backup_dir, keep=7, shard_dir=None):
+    """prune_snapshots for the catalog and each of its shards
+
+    Returns:
+        list: Paths removed
+    """
+    removed = []
+    for path in [db_path] + _shard_paths(db_path, shard_dir):
+        removed.extend(prune_snapshots(path, backup_dir, keep))
+    return removed
+
+def prune_snapshots(db_path, backup_dir, keep=7):
+    """Delete all but the newest `keep` snapshots (and leftover .partial files)
+
+    Returns:
+        list: Paths removed
+    """
+    removed = []
+    for snapshot in list_snapshots(db_path, backup_dir)[max(0, keep):]:
+        if _remove(snapshot['path']):
+            removed.append(snapshot['path'])
+    prefix = _snapshot_prefix(db_path)
+    for name in os.listdir(backup_dir) if os.path.isdir(backup_dir) else []:
+        if name.startswith(prefix) and name.endswith(PARTIAL_SUFFIX) and _remove(os.path.join(backup_dir, name)):
+            removed.append(os.path.join(backup_dir, name))
+    if removed:
+        log.info(f"Removed {len(removed)} old database snapshots")
+    return removed
+
+def restore_snapshot(snapshot_path, db_path, backup_dir=None, shard_dir=None):
+    """Replace the contents of db_path (and its shards) with a snapshot
+
+    The snapshot is verified first. A sharded catalog snapshot is restored
+    together with the shard snapshots taken with it (create_snapshot_set);
+    shard files the restored catalog no longer lists are renamed to
+    .pre-restore, so a company routed again later starts from an empty
+    shard. If backup_dir is given, the current databases are snapshotted
+    there before they are overwritten. The app must be stopped: its name
+    and shard routing caches would keep IDs the snapshot does not have, so
+    a restore while it holds the worker lock is refused.
+
+    Returns:
+        dict: restored snapshot path, restored shard snapshots, shard files
+              moved aside and the pre-restore snapshot (if taken)
+    """
+    if not os.path.isfile(snapshot_path):
+        raise BackupError(f"Snapshot not found: {snapshot_path}")
+    restores = [(snapshot_path, db_path)] + _shard_snapshots(snapshot_path, shard_dir)
+    for source_path, _ in restores:
+        if not os.path.isfile(source_path):
+            raise BackupError(f"Shard snapshot not found: {source_path}")
+        problems = verify_snapshot(source_path)
+        if problems:
+            raise BackupError(f"Snapshot {source_path} failed integrity check: {'; '.join(problems[:5])}")
+
+    lock_file = try_worker_lock(db_path)
+    if lock_file is None:
+        raise BackupError(f"{db_path} is in use by the running app; stop it before restoring")
+    try:
+        previous = None
+        current_shards = _shard_paths(db_path, shard_dir) if os.path.exists(db_path) else []
+        if backup_dir and os.path.exists(db_path):
+            previous = create_snapshot_set(db_path, backup_dir, shard_dir)['path']
+
+        for source_path, target_path in restores:
+            _copy_database(source_path, target_path)
+        moved = []
+        restored = {target_path for _, target_path in restores}
+        for path in current_shards:
+            if path not in restored and os.path.exists(path):
+                os.replace(path, path + '.pre-restore')
+                moved.append(path)
+    finally:
+        lock_file.close()
+    # IDs this process cached may not exist in the snapshot
+    name_resolver.invalidate()
+    log.warning(f"Restored {db_path} from snapshot {snapshot_path} ({len(restores) - 1} shards)")
+    return {
+        'restored_from': snapshot_path,
+        'shards': [source_path for source_path, _ in restores[1:]],
+        'moved_aside': moved,
+        'previous_snapshot': previous
+    }
+
+def _shard_snapshots(snapshot_path, shard_dir):
+    """(shard snapshot, shard database) pairs for a catalog snapshot taken by create_snapshot_set"""
+    shard_paths = _shard_paths(snapshot_path, shard_dir)
+    if not shard_paths:
+        return []
+    # Snapshot names end in -<date>-<time>-<microseconds>, shared by the whole set
+    name = os.path.basename(snapshot_path)[:-len(SNAPSHOT_SUFFIX)]
+    stamp = '-'.join(name.rsplit('-', 3)[1:])
+    directory = os.path.dirname(snapshot_path)
+    return [
+        (os.path.join(directory, f'{_snapshot_prefix(path)}{stamp}{SNAPSHOT_SUFFIX}'), path)
+        for path in shard_paths
+    ]
+
+def _copy_database(source_path, target_path):
+    """Overwrite target_path with the contents of the database at source_path"""
+    source = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True)
+    target = sqlite3.connect(target_path, timeout=30)
+    try:
+        source.backup(target)
+    except sqlite3.Error as e:
+        raise BackupError(f"Restore of {source_path} into {target_path} failed: {str(e)}")
+    finally:
+        source.close()
+        target.close()
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError as e:
+        log.warning(f"Could not remove {path}: {str(e)}")
+        return False
+
+class BackupScheduler:
+    """Background thread that snapshots the database at a fixed interval and applies retention
+
+    With shard_dir set, each run snapshots the per-company shards too.
+    """
+
+    def __init__(self, db_path, backup_dir, interval=24 * 3600, keep=7, shard_dir=None):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.shard_dir = shard_dir
+        self.interval = interval
+        self.keep = keep
+        self.last_result = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the scheduler thread"""
+        self._thread = threading.Thread(target=self._run, name='database-backup', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the scheduler (a running snapshot is finished first)"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def run_now(self):
+        """Take a snapshot and apply retention; one snapshot runs at a time"""
+        with self._lock:
+            try:
+                result = create_snapshot_set(self.db_path, self.backup_dir, self.shard_dir)
+                result['pruned'] = prune_snapshot_sets(self.db_path, self.backup_dir, self.keep, self.shard_dir)
+                self.last_result, self.last_error = result, None
+                return result
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+
+    def get_status(self):
+        """Schedule, retention and the outcome of the last snapshot"""
+        return {
+            'interval': self.interval,
+            'keep': self.keep,
+            'backup_dir': self.backup_dir,
+            'last_result': self.last_result,
+            'last_error': self.last_error
+        }
+
+    def _run(self):
+        """Scheduler loop"""
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.run_now()
+            except Exception as e:
+                log.error(f"Scheduled database backup failed: {str(e)}", exc_info=True)
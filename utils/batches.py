@@ -0,0 +1,80 @@
+import logging
+from datetime import datetime
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Columns returned for a batch (all counters are maintained incrementally)
+BATCH_COLUMNS = [
+    'id', 'name', 'status', 'file_count', 'processed_count', 'failed_count', 'duplicate_count',
+    'finalized_count', 'success_count', 'error_count', 'created_at', 'updated_at'
+]
+
+def create_batch(conn, batch_id, name=None, file_count=0, status='processing'):
+    """Register a batch (no-op if it already exists); does not commit"""
+    now = datetime.now().isoformat()
+    conn.execute('''
+        INSERT INTO batches (id, name, status, file_count, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO NOTHING
+    ''', (batch_id, name or f"Batch {datetime.now().strftime('%Y-%m-%d %H:%M')}", status, file_count, now, now))
+
+def record_batch_files(conn, batch_id, files=0, failed=0, duplicates=0):
+    """Add to a batch's file, failed and duplicate counters; does not commit
+
+    Processed and finalized counts follow batch_queue through triggers; these
+    counters cover files that never get a queue row.
+    """
+    now = datetime.now().isoformat()
+    conn.execute('''
+        INSERT INTO batches (id, name, file_count, failed_count, duplicate_count, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            file_count = file_count + excluded.file_count,
+            failed_count = failed_count + excluded.failed_count,
+            duplicate_count = duplicate_count + excluded.duplicate_count,
+            updated_at = excluded.updated_at
+    ''', (batch_id, f"Batch {datetime.now().strftime('%Y-%m-%d %H:%M')}", files, failed, duplicates, now, now))
+
+def add_batch_queue_file(conn, batch_id, file_path, preview_path, filename, status, pending_id, position=None):
+    """Queue an extracted file for validation in its batch; does not commit
+
+    Without a position the file goes after the batch's last one.
+
+    Returns:
+        int: batch_queue ID
+    """
+    if position is None:
+        position = conn.execute(
+            'SELECT COALESCE(MAX(position), 0) + 1 FROM batch_queue WHERE batch_id = ?', (batch_id,)
+        ).fetchone()[0]
+    return conn.execute('''
+        INSERT INTO batch_queue (batch_id, file_path, preview_path, filename, status, pending_id, position)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (batch_id, file_path, preview_path or '', filename, status, pending_id, position)).lastrowid
+
+def set_batch_status(conn, batch_id, status, **counts):
+    """Update a batch's status (and success_count/error_count if given); does not commit"""
+    assignments = ['status = ?', 'updated_at = ?']
+    params = [status, datetime.now().isoformat()]
+    for column in ('success_count', 'error_count'):
+        if column in counts:
+            assignments.append(f'{column} = ?')
+            params.append(counts[column])
+    conn.execute(f"UPDATE batches SET {', '.join(assignments)} WHERE id = ?", params + [batch_id])
+
+def get_batch(conn, batch_id):
+    """One batch with its counters, or None"""
+    row = conn.execute(f"SELECT {', '.join(BATCH_COLUMNS)} FROM batches WHERE id = ?", (batch_id,)).fetchone()
+    return dict(row) if row else None
+
+def list_batches(conn, limit=50, status=None):
+    """Most recent batches first (served by idx_batches_created_at / idx_batches_status)"""
+    query = f"SELECT {', '.join(BATCH_COLUMNS)} FROM batches"
+    params = []
+    if status:
+        query += ' WHERE status = ?'
+        params.append(status)
+    query += ' ORDER BY created_at DESC LIMIT ?'
+    params.append(limit)
+    return [dict(row) for row in conn.execute(query, params).fetchall()]
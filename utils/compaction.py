@@ -0,0 +1,201 @@
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from utils.database import get_db_connection
+from utils.document_store import prune_orphan_texts
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Pages released per compaction run by PRAGMA incremental_vacuum (4 KiB pages -> ~40 MB)
+INCREMENTAL_VACUUM_PAGES = 10000
+
+def _archive_columns(conn):
+    """pending_invoices columns that also exist in pending_invoices_archive"""
+    archive = {row[1] for row in conn.execute('PRAGMA table_info(pending_invoices_archive)').fetchall()}
+    return [row[1] for row in conn.execute('PRAGMA table_info(pending_invoices)').fetchall() if row[1] in archive]
+
+def archive_pending_invoices(db_path, chunk_size=500, finalized_age_days=1, rejected_age_days=30, stop_event=None):
+    """Move finalized and old rejected pending invoices to pending_invoices_archive
+
+    Rows move in id-ordered chunks, each in its own short transaction (copy,
+    then delete), so web requests are never blocked for long and an
+    interrupted run simply continues with the next call. Archived rows stay
+    readable through the pending_invoices_all view.
+
+    Args:
+        db_path: Database path
+        chunk_size: Rows per transaction
+        finalized_age_days: Archive finalized rows finalized at least this long ago
+        rejected_age_days: Archive rejected rows last updated at least this long ago
+        stop_event: threading.Event that ends the run after the current chunk
+
+    Returns:
+        int: Number of rows archived
+    """
+    now = datetime.now()
+    finalized_cutoff = (now - timedelta(days=finalized_age_days)).isoformat()
+    rejected_cutoff = (now - timedelta(days=rejected_age_days)).isoformat()
+
+    conn = get_db_connection(db_path)
+    try:
+        columns = _archive_columns(conn)
+        column_list = ', '.join(columns)
+        archived = 0
+        last_id = 0
+        while not (stop_event and stop_event.is_set()):
+            ids = [row[0] for row in conn.execute('''
+                SELECT id FROM pending_invoices
+                WHERE id > ? AND (
+                    (is_finalized = 1 AND COALESCE(finalized_at, updated_at, created_at) < ?)
+                    OR (validation_status = 'rejected' AND COALESCE(updated_at, created_at) < ?)
+                )
+                ORDER BY id LIMIT ?
+            ''', (last_id, finalized_cutoff, rejected_cutoff, chunk_size)).fetchall()]
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            placeholders = ', '.join(['?'] * len(ids))
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(f'''
+                    INSERT INTO pending_invoices_archive (
+                        {column_list}, raw_text_hash, ocr_text_hash, extracted_data, archived_at
+                    )
+                    SELECT {', '.join(f'p.{column}' for column in columns)},
+                           b.raw_text_hash, b.ocr_text_hash, b.extracted_data, ?
+                    FROM pending_invoices p
+                    LEFT JOIN pending_invoice_blobs b ON b.pending_id = p.id
+                    WHERE p.id IN ({placeholders})
+                ''', [now.isoformat()] + ids)
+                # The pending_blobs_delete trigger removes the side-table rows
+                conn.execute(f'DELETE FROM pending_invoices WHERE id IN ({placeholders})', ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            archived += len(ids)
+
+        if archived:
+            log.info(f"Archived {archived} pending invoices")
+        return archived
+    finally:
+        conn.close()
+
+def optimize_database(db_path, full_vacuum=False, vacuum_pages=INCREMENTAL_VACUUM_PAGES):
+    """Release free pages and refresh query planner statistics
+
+    Incremental vacuum only works once auto_vacuum is INCREMENTAL, which an
+    existing database only picks up through one full VACUUM (full_vacuum=True;
+    it rewrites the whole file and blocks writers while it runs).
+
+    Returns:
+        dict: auto_vacuum mode, free pages before and after, and whether a full VACUUM ran
+    """
+    conn = get_db_connection(db_path)
+    try:
+        freelist_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if full_vacuum:
+            if auto_vacuum != 2:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            log.info(f"Running full VACUUM on {db_path}")
+            conn.execute('VACUUM')
+            auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        elif auto_vacuum == 2:
+            conn.execute(f'PRAGMA incremental_vacuum({int(vacuum_pages)})').fetchall()
+        conn.execute('PRAGMA optimize')
+        return {
+            'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(auto_vacuum, auto_vacuum),
+            'freelist_before': freelist_before,
+            'freelist_after': conn.execute('PRAGMA freelist_count').fetchone()[0],
+            'full_vacuum': bool(full_vacuum)
+        }
+    finally:
+        conn.close()
+
+def compact_database(db_path, chunk_size=500, finalized_age_days=1, rejected_age_days=30,
+                     full_vacuum=False, stop_event=None, shard_paths=()):
+    """Archive dead pending rows, drop unreferenced document texts, then vacuum and optimize
+
+    Per-company shards (shard_paths) have no pending rows; their unreferenced
+    texts are dropped and they are vacuumed and optimized the same way.
+
+    Returns:
+        dict: archived rows, pruned texts, elapsed seconds and the optimize_database result,
+              plus the per-shard results under 'shards' if shard_paths were given
+    """
+    started = time.perf_counter()
+    archived = archive_pending_invoices(db_path, chunk_size, finalized_age_days, rejected_age_days, stop_event)
+
+    conn = get_db_connection(db_path)
+    try:
+        pruned = prune_orphan_texts(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+    result = {
+        'archived': archived,
+        'texts_pruned': pruned,
+        'optimize': optimize_database(db_path, full_vacuum=full_vacuum)
+    }
+    if shard_paths:
+        result['shards'] = {}
+        for path in shard_paths:
+            if stop_event and stop_event.is_set():
+                break
+            result['shards'][path] = _compact_shard(path, full_vacuum)
+    result['elapsed'] = round(time.perf_counter() - started, 3)
+    log.info(f"Compaction finished: {result}")
+    return result
+
+def _compact_shard(db_path, full_vacuum):
+    """Drop unreferenced texts from a shard database, then vacuum and optimize it"""
+    conn = get_db_connection(db_path)
+    try:
+        pruned = prune_orphan_texts(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    return {'texts_pruned': pruned, 'optimize': optimize_database(db_path, full_vacuum=full_vacuum)}
+
+class CompactionWorker:
+    """Background thread that runs compact_database at a fixed interval
+
+    databases lists every database (catalog first, then the shards, if any).
+    """
+
+    def __init__(self, db_path, interval=6 * 3600, databases=None, **options):
+        self.db_path = db_path
+        self.databases = databases
+        self.interval = interval
+        self.options = options
+        self.last_result = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread"""
+        self._thread = threading.Thread(target=self._run, name='pending-compaction', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the worker after the current chunk"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        """Worker loop"""
+        while not self._stop_event.wait(self.interval):
+            try:
+                shard_paths = self.databases()[1:] if self.databases else ()
+                self.last_result = compact_database(self.db_path, stop_event=self._stop_event,
+                                                    shard_paths=shard_paths, **self.options)
+            except Exception as e:
+                log.error(f"Pending invoice compaction failed: {str(e)}", exc_info=True)
@@ -1,293 +1,286 @@
 import os
+import json
+import uuid
 import sqlite3
 import logging
+import threading
+import time
 from datetime import datetime
 
+from utils.normalize import normalize_invoice_number
+from utils.name_resolver import get_supplier_id
+from utils.document_store import store_text, load_text, register_text_functions
+from utils.query_stats import query_stats, InstrumentedCursor
+from utils.near_duplicates import near_duplicate_flags
+
 # Setup logging
 log = logging.getLogger(__name__)
 
-def get_db_connection(db_path):
-    """Create a database connection"""
-    log.debug(f"Connecting to database at {db_path}")
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-    return conn
-
-def check_and_update_schema(conn=None, db_path=None):
-    """Check and update database schema if needed"""
-    close_conn = False
-    if conn is None and db_path:
-        conn = get_db_connection(db_path)
-        close_conn = True
-    
-    try:
-        # Check pending_invoices table for is_validated column
-        cursor = conn.execute("PRAGMA table_info(pending_invoices)")
-        columns = {col[1]: col for col in cursor.fetchall()}
-        
-        if 'is_validated' not in columns:
-            log.info("Adding is_validated column to pending_invoices table")
-            conn.execute("ALTER TABLE pending_invoices ADD COLUMN is_validated INTEGER DEFAULT 0")
-            conn.commit()
-        
-        if 'validated_at' not in columns:
-            log.info("Adding validated_at column to pending_invoices table")
-            conn.execute("ALTER TABLE pending_invoices ADD COLUMN validated_at TEXT")
-            conn.commit()
-            
-        if 'validated_by' not in columns:
-            log.info("Adding validated_by column to pending_invoices table")
-            conn.execute("ALTER TABLE pending_invoices ADD COLUMN validated_by TEXT")
-            conn.commit()
-        
-        # Make sure batch_queue table exists
-        conn.execute('''
-        CREATE TABLE IF NOT EXISTS batch_queue (
-            id INTEGER PRIMARY KEY,
-            batch_id TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            preview_path TEXT,
-            filename TEXT,
-            status TEXT DEFAULT 'pending',
-            processed_at TEXT,
-            pending_id INTEGER,
-            position INTEGER,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        conn.commit()
-        
-        # Make sure email_credentials table exists
-        conn.execute('''
-        CREATE TABLE IF NOT EXISTS email_credentials (
-            id INTEGER PRIMARY KEY,
-            email TEXT UNIQUE,
-            password TEXT,
-            imap_server TEXT,
-            port INTEGER DEFAULT 993,
-            use_ssl INTEGER DEFAULT 1,
-            is_custom INTEGER DEFAULT 0,
-            custom_server TEXT,
-            last_used TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+# PRAGMAs applied to every new connection. WAL lets readers (dashboards) run
+# while a batch is writing; synchronous=NORMAL is durable in WAL mode except
+# for the last transactions before a power loss.
+DB_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,        # negative = KiB, i.e. ~20 MB page cache per connection
+    'mmap_size': 268435456,      # 256 MB memory-mapped I/O
+    'busy_timeout': 5000,        # ms to wait for a lock before "database is locked"
+    'temp_store': 'MEMORY'
+}
+
+# Maximum number of idle connections kept open per database file
+DB_POOL_SIZE = 8
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to the pool
+
+    Every get_db_connection() call checks out a connection of its own, so a
+    helper's commit or rollback never ends its caller's transaction. Helpers
+    that must write inside the caller's transaction take the caller's
+    connection as an argument instead (a second connection would wait for
+    the caller's write lock). Any transaction still open on close() is
+    rolled back so the next user starts clean.
+    """
+
+    def close(self):
+        _pool.release(self)
+
+    # Statements go through an InstrumentedCursor while query statistics are enabled
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = InstrumentedCursor if query_stats.enabled else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if not query_stats.enabled:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not query_stats.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close_for_real(self):
+        """Close the underlying SQLite connection"""
+        super().close()
+
+class ConnectionPool:
+    """Pool of idle SQLite connections, keyed by database path"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}  # db_path -> [PooledConnection]
+
+    def acquire(self, db_path):
+        """Check out an idle connection for db_path, or open a new one"""
+        with self._lock:
+            idle = self._idle.get(db_path)
+            conn = idle.pop() if idle else None
+
+        if conn is None:
+            conn = self._connect(db_path)
+        conn._checked_out = True
+        return conn
+
+    def release(self, conn):
+        """Return a checked-out connection to the pool"""
+        with self._lock:
+            if not getattr(conn, '_checked_out', False):
+                # Already released (double close) or never pooled
+                return
+            conn._checked_out = False
+
+        try:
+            if conn.in_transaction:
+                log.warning(f"Rolling back uncommitted transaction on pooled connection to {conn.db_path}")
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error as e:
+            log.warning(f"Discarding broken pooled connection: {str(e)}")
+            self._discard(conn)
+            return
+
+        with self._lock:
+            idle = self._idle.setdefault(conn.db_path, [])
+            if len(idle) < DB_POOL_SIZE:
+                idle.append(conn)
+                return
+        self._discard(conn)
+
+    def close_all(self):
+        """Close all idle connections (checked-out ones return to the pool when closed)"""
+        with self._lock:
+            idle = [conn for conns in self._idle.values() for conn in conns]
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+    def _connect(self, db_path):
+        """Open and configure a new connection"""
+        log.debug(f"Opening new pooled connection to {db_path}")
+        conn = sqlite3.connect(
+            db_path,
+            timeout=DB_PRAGMAS.get('busy_timeout', 5000) / 1000.0,
+            check_same_thread=False,  # connections move between threads via the pool
+            factory=PooledConnection
         )
-        ''')
-        conn.commit()
-        
-        log.info("Database schema check and update completed successfully")
-    except Exception as e:
-        log.error(f"Error checking/updating schema: {e}")
-        conn.rollback()
-    finally:
-        if close_conn:
-            conn.close()
+        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        conn.db_path = db_path
+        register_text_functions(conn)
+        for pragma, value in DB_PRAGMAS.items():
+            try:
+                conn.execute(f"PRAGMA {pragma} = {value}")
+            except sqlite3.Error as e:
+                log.warning(f"Could not set PRAGMA {pragma}={value} on {db_path}: {str(e)}")
+        return conn
 
-def initialize_shadow_table(db_path):
-    """Initialize shadow copy of the pending_invoices table"""
-    conn = get_db_connection(db_path)
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS pending_invoices (
-        id INTEGER PRIMARY KEY,
-        batch_id TEXT,
-        file_path TEXT,
-        original_path TEXT,
-        preview_path TEXT,
-        invoice_number TEXT,
-        invoice_date TEXT,
-        due_date TEXT,
-        normalized_date TEXT,
-        amount_original TEXT,
-        vat_amount_original TEXT,
-        description TEXT,
-        supplier_name TEXT,
-        company_name TEXT,
-        processed_at TEXT,
-        is_viewed INTEGER DEFAULT 0,
-        needs_manual_input INTEGER DEFAULT 0,
-        is_finalized INTEGER DEFAULT 0,
-        finalized_at TEXT,
-        source TEXT,
-        source_info TEXT,
-        raw_text TEXT,
-        ocr_text TEXT,
-        extracted_data TEXT,
-        validation_status TEXT,
-        validation_notes TEXT,
-        created_at TEXT,
-        updated_at TEXT
-    )
-    ''')
-    conn.commit()
-    conn.close()
-
-def initialize_tables(db_path):
-    """Initialize database tables if they don't exist"""
-    conn = get_db_connection(db_path)
-    
-    # Create invoices table
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS invoices (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        file_path TEXT,
-        original_path TEXT,
-        invoice_number TEXT,
-        invoice_date TEXT,
-        due_date TEXT,
-        normalized_date TEXT,
-        amount_original TEXT,
-        vat_amount_original TEXT,
-        description TEXT,
-        supplier_id INTEGER,
-        company_id INTEGER,
-        confidence REAL,
-        ocr_text TEXT,
-        raw_text TEXT,
-        processed_at TEXT DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY(supplier_id) REFERENCES suppliers(id),
-        FOREIGN KEY(company_id) REFERENCES companies(id)
-    )
-    ''')
-    
-    # Create suppliers table
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS suppliers (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE
-    )
-    ''')
-    
-    # Create companies table
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS companies (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE
-    )
-    ''')
-    
-    # Create pending_invoices table
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS pending_invoices (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        batch_id TEXT,
-        file_path TEXT,
-        original_path TEXT,
-        preview_path TEXT,
-        invoice_number TEXT,
-        invoice_date TEXT,
-        due_date TEXT,
-        normalized_date TEXT,
-        amount_original TEXT,
-        vat_amount_original TEXT,
-        description TEXT,
-        supplier_name TEXT,
-        company_name TEXT,
-        processed_at TEXT,
-        is_viewed INTEGER DEFAULT 0,
-        needs_manual_input INTEGER DEFAULT 0,
-        is_finalized INTEGER DEFAULT 0,
-        finalized_at TEXT,
-        source TEXT,
-        source_info TEXT,
-        raw_text TEXT,
-        ocr_text TEXT,
-        extracted_data TEXT,
-        validation_status TEXT,
-        validation_notes TEXT,
-        is_validated INTEGER DEFAULT 0,
-        validated_at TEXT,
-        validated_by TEXT,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-        updated_at TEXT
-    )
-    ''')
+    def _discard(self, conn):
+        try:
+            conn.close_for_real()
+        except sqlite3.Error:
+            pass
+
+_pool = ConnectionPool()
+
+def configure_db_pool(pool_size=None, **pragmas):
+    """Override the pool size or connection PRAGMAs (applies to new connections)"""
+    global DB_POOL_SIZE
+    if pool_size is not None:
+        DB_POOL_SIZE = max(0, int(pool_size))
+    for pragma, value in pragmas.items():
+        if value is not None:
+            DB_PRAGMAS[pragma] = value
+
+def close_db_pool():
+    """Close all idle pooled connections"""
+    _pool.close_all()
+
+def get_db_connection(db_path):
+    """Get a pooled database connection (call close() to return it)"""
+    return _pool.acquire(db_path)
+
+def find_duplicate_invoice(conn, invoice_number, supplier_name=None, exclude_id=None):
+    """Find an invoice with the same normalised invoice number
     
-    # Create batch_queue table
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS batch_queue (
-        id INTEGER PRIMARY KEY,
-        batch_id TEXT NOT NULL,
-        file_path TEXT NOT NULL,
-        preview_path TEXT,
-        filename TEXT,
-        status TEXT DEFAULT 'pending',
-        processed_at TEXT,
-        pending_id INTEGER,
-        position INTEGER,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
+    Args:
+        conn: Open database connection
+        invoice_number: Invoice number as entered or extracted
+        supplier_name: Restrict the match to this supplier if given
+        exclude_id: Invoice ID to ignore (the invoice being edited)
+        
+    Besides the invoices in conn's database, the catalog's
+    invoice_number_registry is checked, which lists the numbers finalized
+    into per-company databases (see utils.sharding).
     
-    # Create lexoffice_credentials table
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS lexoffice_credentials (
-        id INTEGER PRIMARY KEY,
-        api_key TEXT NOT NULL,
-        download_dir TEXT,
-        is_active INTEGER DEFAULT 1,
-        last_sync TEXT,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-        updated_at TEXT
-    )
-    ''')
+    Returns:
+        int: ID of the matching invoice (0 while another finalize holds the
+             number), or None
+    """
+    key = normalize_invoice_number(invoice_number)
+    if not key:
+        return None
     
-    # Create lexoffice_processed_vouchers table to track processed invoices
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS lexoffice_processed_vouchers (
-        id INTEGER PRIMARY KEY,
-        voucher_id TEXT UNIQUE,
-        voucher_number TEXT,
-        voucher_type TEXT,
-        voucher_status TEXT,
-        file_id TEXT,
-        file_path TEXT,
-        processed_at TEXT,
-        batch_id TEXT,
-        pending_id INTEGER,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
+    # The raw number comparison covers rows the key backfill has not reached yet
+    query = 'SELECT id FROM invoices WHERE (invoice_number_key = ? OR invoice_number = ?)'
+    params = [key, invoice_number]
+    registry_query = 'SELECT COALESCE(invoice_id, 0) FROM invoice_number_registry WHERE invoice_number_key = ?'
+    registry_params = [key]
     
-    # Create email_credentials table
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS email_credentials (
-        id INTEGER PRIMARY KEY,
-        email TEXT UNIQUE,
-        password TEXT,
-        imap_server TEXT,
-        port INTEGER DEFAULT 993,
-        use_ssl INTEGER DEFAULT 1,
-        is_custom INTEGER DEFAULT 0,
-        custom_server TEXT,
-        last_used TEXT,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
+    if supplier_name:
+        supplier_id = get_supplier_id(conn, supplier_name)
+        if supplier_id is None:
+            return None
+        query += ' AND supplier_id = ?'
+        params.append(supplier_id)
+        registry_query += ' AND supplier_id = ?'
+        registry_params.append(supplier_id)
     
-    # Check and add missing columns to tables
-    check_and_update_schema(conn)
+    if exclude_id is not None:
+        query += ' AND id != ?'
+        params.append(exclude_id)
+        registry_query += ' AND invoice_id IS NOT ?'
+        registry_params.append(exclude_id)
     
-    conn.commit()
-    conn.close()
+    row = conn.execute(query + ' LIMIT 1', params).fetchone()
+    if row is None:
+        row = conn.execute(registry_query + ' LIMIT 1', registry_params).fetchone()
+    return row[0] if row else None
 
-def check_invoice_exists(invoice_number, db_path):
-    """Check if an invoice with the given invoice number already exists in the database"""
+def check_invoice_exists(invoice_number, db_path, supplier_name=None):
+    """Check if an invoice with the given invoice number already exists in the database
+    
+    Numbers are compared by their normalised key, so "RE-2023/001" matches
+    "re 2023 001" but "12" does not match "2012-0012".
+    """
     conn = get_db_connection(db_path)
-    cursor = conn.execute("""
-        SELECT COUNT(*) FROM invoices 
-        WHERE invoice_number = ? OR invoice_number LIKE ? OR invoice_number LIKE ?
-    """, (invoice_number, f"{invoice_number}%", f"%{invoice_number}"))
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count > 0
+    try:
+        return find_duplicate_invoice(conn, invoice_number, supplier_name) is not None
+    finally:
+        conn.close()
 
-def save_to_pending(invoice_data, batch_id=None, source_info=None, db_path=None):
-    """Save invoice data to pending_invoices table"""
+# Fixed column list for new pending invoices (the schema is guaranteed by utils.migrations)
+PENDING_INSERT_COLUMNS = [
+    "batch_id", "file_path", "original_path", "preview_path",
+    "invoice_number", "invoice_date", "due_date", "amount_original",
+    "vat_amount_original", "description", "supplier_name", "company_name",
+    "needs_manual_input", "validation_status", "validation_notes", "source", "source_info",
+    "created_at", "updated_at", "is_validated", "file_hash", "duplicate_score", "duplicate_candidates"
+]
+# IDs are assigned by the caller (see _insert_pending_rows)
+PENDING_INSERT_SQL = f'''
+    INSERT INTO pending_invoices (id, {', '.join(PENDING_INSERT_COLUMNS)})
+    VALUES (?, {', '.join(['?'] * len(PENDING_INSERT_COLUMNS))})
+'''
+
+# Large per-document values live in pending_invoice_blobs, keyed by pending_id,
+# so reading a pending row does not drag them along. The texts themselves are
+# stored compressed in document_texts and referenced by hash.
+PENDING_BLOB_COLUMNS = ["raw_text", "ocr_text", "extracted_data"]
+PENDING_TEXT_COLUMNS = ["raw_text", "ocr_text"]
+# The same values as pending_invoices_all returns them (text hashes, not texts)
+PENDING_ALL_BLOB_COLUMNS = ["raw_text_hash", "ocr_text_hash", "extracted_data"]
+PENDING_BLOB_INSERT_SQL = '''
+    INSERT OR REPLACE INTO pending_invoice_blobs (pending_id, raw_text_hash, ocr_text_hash, extracted_data)
+    VALUES (?, ?, ?, ?)
+'''
+
+def get_pending_blobs(conn, pending_id, columns=None):
+    """Load the blob columns of a pending invoice, archived or not (texts are decompressed only if requested)
+
+    Args:
+        conn: Open database connection
+        pending_id: Pending invoice ID
+        columns: Subset of PENDING_BLOB_COLUMNS (default: all)
+
+    Returns:
+        dict: column -> value (None where nothing was stored)
+    """
+    columns = list(columns or PENDING_BLOB_COLUMNS)
+    unknown = [column for column in columns if column not in PENDING_BLOB_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown blob columns: {', '.join(unknown)}")
+    row = conn.execute(
+        'SELECT raw_text_hash, ocr_text_hash, extracted_data FROM pending_invoices_all WHERE id = ?',
+        (pending_id,)
+    ).fetchone()
+    if row is None:
+        return {column: None for column in columns}
+    return {
+        column: load_text(conn, row[f'{column}_hash']) if column in PENDING_TEXT_COLUMNS else row[column]
+        for column in columns
+    }
+
+def _pending_row(conn, invoice_data, batch_id, source_info, now):
+    """Build the pending_invoices values and side-table values for one invoice dict
+
+    Also flags near-duplicates of existing invoices (see utils.near_duplicates).
+
+    Returns:
+        tuple: (values in PENDING_INSERT_COLUMNS order, raw_text, ocr_text, extracted_data)
+    """
     if batch_id is None:
-        import uuid
         batch_id = str(uuid.uuid4())
-        
-    # Initialize database connection
-    conn = get_db_connection(db_path)
     
     # Ensure invoice_data is a dictionary
     if invoice_data is None:
@@ -316,11 +309,7 @@ def save_to_pending(invoice_data, batch_id=None, source_info=None, db_path=None)
         if value is None:
             safe_data[key] = ''
     
-    # Get current time
-    now = datetime.now().isoformat()
-    
     # Extract extracted_data if available
-    import json
     extracted_data = None
     if 'extracted_data' in invoice_data:
         if isinstance(invoice_data['extracted_data'], dict):
@@ -332,73 +321,199 @@ def save_to_pending(invoice_data, batch_id=None, source_info=None, db_path=None)
     if not extracted_data and isinstance(invoice_data.get('data', None), dict):
         extracted_data = json.dumps(invoice_data['data'])
     
-    try:
-        # First check if the columns we need exist in the database
-        cursor = conn.execute("PRAGMA table_info(pending_invoices)")
-        columns = {col[1]: col for col in cursor.fetchall()}
-        
-        # Create the base query and parameters
-        fields = [
-            "batch_id", "file_path", "original_path", "preview_path", 
-            "invoice_number", "invoice_date", "due_date", "amount_original", 
-            "vat_amount_original", "description", "supplier_name", "company_name",
-            "needs_manual_input", "validation_status", "validation_notes", "source", "source_info",
-            "extracted_data", "created_at", "updated_at"
-        ]
-        
-        values = [
-            batch_id,
-            safe_data['file_path'],
-            safe_data['original_path'],
-            safe_data['preview_path'],
-            safe_data['invoice_number'],
-            safe_data['invoice_date'],
-            safe_data['due_date'],
-            safe_data['amount_original'],
-            safe_data['vat_amount_original'],
-            safe_data['description'],
-            safe_data['supplier_name'],
-            safe_data['company_name'],
-            safe_data['needs_manual_input'],
-            safe_data['validation_status'],
-            safe_data['validation_notes'],
-            invoice_data.get('source', 'upload'),
-            json.dumps(source_info) if source_info else '{}',
-            extracted_data,
-            now,
-            now
-        ]
-        
-        # Check if is_validated column exists and add it if so
-        if 'is_validated' in columns:
-            fields.append("is_validated")
-            values.append(0)  # Default to not validated
-            
-        # Check if is_processed column exists
-        if 'is_processed' in columns:
-            fields.append("is_processed")
-            values.append(0)  # Default to not processed
-            
-        # Build and execute the query
-        query = f'''
-        INSERT INTO pending_invoices (
-            {', '.join(fields)}
-        ) VALUES ({', '.join(['?'] * len(fields))})
-        '''
+    values = [
+        batch_id,
+        safe_data['file_path'],
+        safe_data['original_path'],
+        safe_data['preview_path'],
+        safe_data['invoice_number'],
+        safe_data['invoice_date'],
+        safe_data['due_date'],
+        safe_data['amount_original'],
+        safe_data['vat_amount_original'],
+        safe_data['description'],
+        safe_data['supplier_name'],
+        safe_data['company_name'],
+        safe_data['needs_manual_input'],
+        safe_data['validation_status'],
+        safe_data['validation_notes'],
+        invoice_data.get('source', 'upload'),
+        json.dumps(source_info) if source_info else '{}',
+        now,
+        now,
+        0  # Not validated yet
+    ]
+    file_hash = invoice_data.get('file_hash') or None
+    values += [file_hash, *near_duplicate_flags(
+        conn, safe_data['supplier_name'], safe_data['amount_original'], safe_data['invoice_date'],
+        safe_data['invoice_number'], file_hash
+    )]
+    return values, invoice_data.get('raw_text'), invoice_data.get('ocr_text'), extracted_data
+
+def _next_pending_id(conn):
+    """First free pending_invoices id, honouring AUTOINCREMENT's no-reuse rule"""
+    row = conn.execute('''
+        SELECT MAX(
+            COALESCE((SELECT MAX(id) FROM pending_invoices), 0),
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'pending_invoices'), 0)
+        ) + 1
+    ''').fetchone()
+    return row[0]
+
+def _insert_pending_rows(conn, entries):
+    """Insert (invoice_data, batch_id, source_info) entries; caller owns the transaction
+
+    IDs are assigned up front so the rows and their side-table values can be
+    written with executemany and the IDs returned in input order.
+    """
+    now = datetime.now().isoformat()
+    rows = [_pending_row(conn, invoice_data, batch_id, source_info, now) for invoice_data, batch_id, source_info in entries]
+    if not rows:
+        return []
+    
+    first_id = _next_pending_id(conn)
+    pending_ids = list(range(first_id, first_id + len(rows)))
+    conn.executemany(PENDING_INSERT_SQL, [[pending_id] + row[0] for pending_id, row in zip(pending_ids, rows)])
+    
+    blobs = []
+    for pending_id, (_, raw_text, ocr_text, extracted_data) in zip(pending_ids, rows):
+        blob = [store_text(conn, raw_text), store_text(conn, ocr_text), extracted_data]
+        if any(blob):
+            blobs.append([pending_id] + blob)
+    if blobs:
+        conn.executemany(PENDING_BLOB_INSERT_SQL, blobs)
+    return pending_ids
+
+def save_many_to_pending(invoices, batch_id=None, source_info=None, db_path=None):
+    """Save several invoices to pending_invoices in one transaction
+    
+    Args:
+        invoices: Invoice dicts (as for save_to_pending)
+        batch_id: Batch ID for all rows (a new one per row if not given)
+        source_info: Source details stored with every row
+        db_path: Database path
         
-        cursor = conn.execute(query, values)
-        pending_id = cursor.lastrowid
+    Returns:
+        list: New pending invoice IDs, in input order
+    """
+    return _save_pending_entries([(invoice_data, batch_id, source_info) for invoice_data in invoices], db_path)
+
+def _save_pending_entries(entries, db_path):
+    """Write (invoice_data, batch_id, source_info) entries in one transaction and commit"""
+    if not entries:
+        return []
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        pending_ids = _insert_pending_rows(conn, entries)
         conn.commit()
-        
-        return pending_id
-        
+        return pending_ids
     except Exception as e:
-        log.error(f"Error saving to pending: {str(e)}")
+        log.error(f"Error saving {len(entries)} invoices to pending: {str(e)}")
         conn.rollback()
         raise
     finally:
         conn.close()
 
+def save_to_pending(invoice_data, batch_id=None, source_info=None, db_path=None):
+    """Save invoice data to pending_invoices table"""
+    return _save_pending_entries([(invoice_data, batch_id, source_info)], db_path)[0]
+
+class PendingRef:
+    """Placeholder for the ID of a row waiting in a PendingWriteBuffer"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.pending_id = None
+
+    def get(self):
+        """The pending invoice ID, flushing the owning buffer if needed"""
+        if self.pending_id is None:
+            self.buffer.flush()
+        return self.pending_id
+
+    def __repr__(self):
+        return f"PendingRef({self.pending_id if self.pending_id is not None else 'unflushed'})"
+
+class PendingWriteBuffer:
+    """Collect pending invoices and write them together with save_many_to_pending
+    
+    `save` has the save_to_pending signature (minus db_path), so it can be
+    passed to process_invoice_file as save_to_pending_func. It returns a
+    PendingRef; after flush() (or leaving the `with` block) `resolve`
+    replaces the refs in result dicts with the real IDs. The buffer flushes
+    on its own once max_rows rows are waiting or the oldest has waited
+    max_delay seconds, so a crash mid-batch loses only the last few rows.
+    Use it as a context manager so the rest is written even if the loop fails.
+    """
+
+    def __init__(self, db_path, max_rows=50, max_delay=5.0):
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._entries = []
+        self._refs = []
+        self._oldest = None
+        self._lock = threading.Lock()
+
+    def save(self, invoice_data, batch_id=None, source_info=None):
+        """Queue one invoice; returns a PendingRef for its future ID"""
+        ref = PendingRef(self)
+        with self._lock:
+            if not self._entries:
+                self._oldest = time.monotonic()
+            self._entries.append((invoice_data, batch_id, source_info))
+            self._refs.append(ref)
+            due = len(self._entries) >= self.max_rows or time.monotonic() - self._oldest >= self.max_delay
+        if due:
+            self.flush()
+        return ref
+
+    def flush(self):
+        """Write all waiting rows in one transaction
+
+        Returns:
+            list: IDs written by this flush
+        """
+        with self._lock:
+            entries, refs = self._entries, self._refs
+            self._entries, self._refs = [], []
+            if not entries:
+                return []
+            try:
+                pending_ids = _save_pending_entries(entries, self.db_path)
+            except Exception:
+                # Keep the rows so a later flush can retry them
+                self._entries, self._refs = entries + self._entries, refs + self._refs
+                raise
+            for ref, pending_id in zip(refs, pending_ids):
+                ref.pending_id = pending_id
+        log.info(f"Flushed {len(pending_ids)} pending invoices in one transaction")
+        return pending_ids
+
+    def resolve(self, value):
+        """Replace PendingRefs in (nested) dicts and lists with their IDs"""
+        if isinstance(value, PendingRef):
+            return value.get()
+        if isinstance(value, dict):
+            return {key: self.resolve(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        return value
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.flush()
+        except Exception as e:
+            if exc_type is None:
+                raise
+            # Keep the original error; the rows stay in the buffer
+            log.error(f"Could not write buffered pending invoices: {str(e)}")
+        return False
+
 def update_pending_invoice(invoice_id, data, db_path):
     """Update a pending invoice with new data"""
     try:
@@ -415,10 +530,6 @@ def update_pending_invoice(invoice_id, data, db_path):
         # Convert existing invoice to dict for easier access
         existing_data = dict(existing_invoice)
         
-        # First check available columns in the table
-        cursor = conn.execute("PRAGMA table_info(pending_invoices)")
-        columns = {col[1]: col for col in cursor.fetchall()}
-        
         # Build update query
         query_parts = []
         params = []
@@ -427,14 +538,12 @@ def update_pending_invoice(invoice_id, data, db_path):
         query_parts.append("updated_at = ?")
         params.append(datetime.now().isoformat())
         
-        # Handle validation status if column exists
-        if 'is_validated' in columns and 'is_validated' in data and data['is_validated']:
+        # Handle validation status
+        if data.get('is_validated'):
             query_parts.append("is_validated = ?")
             params.append(1)
-            
-            if 'validated_at' in columns:
-                query_parts.append("validated_at = ?")
-                params.append(datetime.now().isoformat())
+            query_parts.append("validated_at = ?")
+            params.append(datetime.now().isoformat())
             
         # Basic fields to update
         fields_to_update = [
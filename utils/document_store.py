@@ -0,0 +1,125 @@
+import zlib
+import hashlib
+import logging
+import sqlite3
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# zlib level 6 is the usual speed/size balance; extracted invoice text
+# typically shrinks to a quarter of its size or less
+COMPRESSION_LEVEL = 6
+CODEC = 'zlib'
+
+def text_hash(text):
+    """Content hash used as the document_texts key"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def compress_text(text):
+    """Compress text for storage; returns (codec, data)"""
+    return CODEC, zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+def decompress_text(codec, data):
+    """Inverse of compress_text (also registered as the SQL function decompress_text)"""
+    if data is None:
+        return None
+    if codec == 'zlib':
+        return zlib.decompress(data).decode('utf-8')
+    if codec in (None, 'plain'):
+        return data if isinstance(data, str) else bytes(data).decode('utf-8')
+    raise ValueError(f"Unknown document text codec: {codec}")
+
+def register_text_functions(conn):
+    """Make decompress_text() available to SQL on pooled connections (for ad-hoc queries)"""
+    conn.create_function('decompress_text', 2, decompress_text, deterministic=True)
+
+def store_text(conn, text):
+    """Store text compressed, once per distinct content
+
+    Pending and finalized invoices reference the text by hash, so identical
+    documents (re-uploads, a pending row and its invoice) share one copy.
+    Does not commit.
+
+    Returns:
+        str: Content hash, or None for empty text
+    """
+    if not text:
+        return None
+    key = text_hash(text)
+    codec, data = compress_text(text)
+    conn.execute('''
+        INSERT OR IGNORE INTO document_texts (hash, codec, data, raw_size, stored_size)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (key, codec, sqlite3.Binary(data), len(text.encode('utf-8')), len(data)))
+    return key
+
+def load_text(conn, key):
+    """Decompress the text stored under key (None if key is empty or unknown)"""
+    if not key:
+        return None
+    row = conn.execute('SELECT codec, data FROM document_texts WHERE hash = ?', (key,)).fetchone()
+    if row is None:
+        log.warning(f"Document text {key} not found")
+        return None
+    return decompress_text(row['codec'], row['data'])
+
+def index_invoice_texts(conn, invoice_ids):
+    """Put the decompressed raw/OCR text of invoices into their invoice_fts rows
+
+    The FTS triggers index the plain columns only, so they work on any
+    connection; whoever inserts invoices with text hashes (or changes the
+    hashes) calls this in the same transaction. Does not commit.
+
+    Returns:
+        int: Number of FTS rows updated
+    """
+    if not invoice_ids:
+        return 0
+    placeholders = ', '.join(['?'] * len(invoice_ids))
+    rows = conn.execute(f'''
+        SELECT id, raw_text_hash, ocr_text_hash FROM invoices
+        WHERE id IN ({placeholders}) AND (raw_text_hash IS NOT NULL OR ocr_text_hash IS NOT NULL)
+    ''', list(invoice_ids)).fetchall()
+    hashes = list({key for row in rows for key in (row[1], row[2]) if key})
+    texts = {
+        key: decompress_text(codec, data) for key, codec, data in conn.execute(
+            f'SELECT hash, codec, data FROM document_texts WHERE hash IN ({", ".join(["?"] * len(hashes))})', hashes
+        ).fetchall()
+    } if hashes else {}
+    conn.executemany(
+        'UPDATE invoice_fts SET document_text = ? WHERE rowid = ?',
+        [(f"{texts.get(row[1]) or ''} {texts.get(row[2]) or ''}".strip(), row[0]) for row in rows]
+    )
+    return len(rows)
+
+def prune_orphan_texts(conn):
+    """Delete texts no pending, archived or finalized invoice refers to; does not commit
+
+    Returns:
+        int: Number of texts deleted
+    """
+    cursor = conn.execute('''
+        DELETE FROM document_texts
+        WHERE hash NOT IN (
+            SELECT raw_text_hash FROM pending_invoice_blobs WHERE raw_text_hash IS NOT NULL
+            UNION SELECT ocr_text_hash FROM pending_invoice_blobs WHERE ocr_text_hash IS NOT NULL
+            UNION SELECT raw_text_hash FROM invoices WHERE raw_text_hash IS NOT NULL
+            UNION SELECT ocr_text_hash FROM invoices WHERE ocr_text_hash IS NOT NULL
+            UNION SELECT raw_text_hash FROM pending_invoices_archive WHERE raw_text_hash IS NOT NULL
+            UNION SELECT ocr_text_hash FROM pending_invoices_archive WHERE ocr_text_hash IS NOT NULL
+        )
+    ''')
+    return cursor.rowcount
+
+def get_text_stats(conn):
+    """Number of stored texts, raw and compressed bytes, and the compression ratio"""
+    row = conn.execute('''
+        SELECT COUNT(*) AS texts,
+               COALESCE(SUM(raw_size), 0) AS raw_bytes,
+               COALESCE(SUM(stored_size), 0) AS stored_bytes
+        FROM document_texts
+    ''').fetchone()
+    stats = dict(row)
+    stats['compression_ratio'] = round(stats['raw_bytes'] / stats['stored_bytes'], 2) if stats['stored_bytes'] else None
+    stats['space_saved'] = round(1 - stats['stored_bytes'] / stats['raw_bytes'], 4) if stats['raw_bytes'] else 0.0
+    return stats
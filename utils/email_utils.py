@@ -150,98 +150,45 @@ def save_email_credentials(email, password, imap_server, port=993, use_ssl=True,
         # Get the current time
         current_time = datetime.now().isoformat()
         
-        # Check if the last_used column exists
-        columns_exist = True
-        try:
-            cursor.execute("SELECT last_used FROM email_credentials LIMIT 1")
-        except sqlite3.OperationalError:
-            columns_exist = False
-            # Add the column if it doesn't exist
-            try:
-                cursor.execute("ALTER TABLE email_credentials ADD COLUMN last_used TEXT")
-                conn.commit()
-                log.info("Added last_used column to email_credentials table")
-                columns_exist = True
-            except Exception as column_err:
-                log.error(f"Error adding last_used column: {str(column_err)}")
-        
         if existing:
             # Update existing record
-            if columns_exist:
-                cursor.execute('''
-                    UPDATE email_credentials SET 
-                        password = ?, 
-                        imap_server = ?, 
-                        port = ?, 
-                        use_ssl = ?, 
-                        is_custom = ?, 
-                        custom_server = ?,
-                        last_used = ?
-                    WHERE email = ?
-                ''', (
-                    password, 
-                    imap_server, 
-                    port, 
-                    1 if use_ssl else 0, 
-                    1 if is_custom else 0, 
-                    custom_server,
-                    current_time,
-                    email
-                ))
-            else:
-                # Fallback without last_used column
-                cursor.execute('''
-                    UPDATE email_credentials SET 
-                        password = ?, 
-                        imap_server = ?, 
-                        port = ?, 
-                        use_ssl = ?, 
-                        is_custom = ?, 
-                        custom_server = ?
-                    WHERE email = ?
-                ''', (
-                    password, 
-                    imap_server, 
-                    port, 
-                    1 if use_ssl else 0, 
-                    1 if is_custom else 0, 
-                    custom_server,
-                    email
-                ))
+            cursor.execute('''
+                UPDATE email_credentials SET 
+                    password = ?, 
+                    imap_server = ?, 
+                    port = ?, 
+                    use_ssl = ?, 
+                    is_custom = ?, 
+                    custom_server = ?,
+                    last_used = ?
+                WHERE email = ?
+            ''', (
+                password, 
+                imap_server, 
+                port, 
+                1 if use_ssl else 0, 
+                1 if is_custom else 0, 
+                custom_server,
+                current_time,
+                email
+            ))
         else:
             # Insert new record
-            if columns_exist:
-                cursor.execute('''
-                    INSERT INTO email_credentials (
-                        email, password, imap_server, port, use_ssl, is_custom, custom_server, last_used, created_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    email, 
-                    password, 
-                    imap_server, 
-                    port, 
-                    1 if use_ssl else 0, 
-                    1 if is_custom else 0, 
-                    custom_server,
-                    current_time,
-                    current_time
-                ))
-            else:
-                # Fallback without last_used column
-                cursor.execute('''
-                    INSERT INTO email_credentials (
-                        email, password, imap_server, port, use_ssl, is_custom, custom_server, created_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    email, 
-                    password, 
-                    imap_server, 
-                    port, 
-                    1 if use_ssl else 0, 
-                    1 if is_custom else 0, 
-                    custom_server,
-                    current_time
-                ))
+            cursor.execute('''
+                INSERT INTO email_credentials (
+                    email, password, imap_server, port, use_ssl, is_custom, custom_server, last_used, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                email, 
+                password, 
+                imap_server, 
+                port, 
+                1 if use_ssl else 0, 
+                1 if is_custom else 0, 
+                custom_server,
+                current_time,
+                current_time
+            ))
         
         conn.commit()
         return True, cursor.lastrowid if not existing else existing[0]
@@ -1,6 +1,7 @@
 import os
 import re
 import shutil
+import hashlib
 import logging
 from datetime import datetime
 import PyPDF2
@@ -28,6 +29,26 @@ def sanitize_filename(filename):
     
     return filename
 
+class FilePathStorage:
+    """FileStorage-like wrapper around a file that already exists on disk"""
+    def __init__(self, path, filename=None):
+        self.path = path
+        self.filename = filename or os.path.basename(path)
+    
+    def save(self, target_path):
+        # Nothing to copy when the file is already at the target location
+        if os.path.abspath(self.path) == os.path.abspath(target_path):
+            return
+        shutil.copy2(self.path, target_path)
+
+def compute_file_hash(file_path, chunk_size=65536):
+    """Compute the SHA-256 content hash of a file"""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
 def allowed_file(filename):
     """Check if the file has an allowed extension"""
     allowed_extensions = {'pdf'}
@@ -126,9 +147,11 @@ def check_for_duplicate_invoice(file_path, check_invoice_exists_func, extract_in
         # Extract invoice number from file using OCR only, don't process or store anything
         data = extract_invoice_data_func(file_path, store_in_db=False)
         invoice_number = None
+        supplier_name = None
         
         # Try to find invoice number in different data structures
         if data:
+            supplier_name = data.get('Lieferantename') or data.get('supplier_name')
             if 'Rechnungsnummer' in data:
                 invoice_number = data.get('Rechnungsnummer')
             elif 'invoice_number' in data:
@@ -138,7 +161,8 @@ def check_for_duplicate_invoice(file_path, check_invoice_exists_func, extract_in
             
         if invoice_number and invoice_number not in ['Unknown', 'Not found', 'Nicht gefunden', '']:
             # Check if this invoice number exists
-            is_duplicate = check_invoice_exists_func(invoice_number)
+            # Scope the check to the supplier when the extraction found one
+            is_duplicate = check_invoice_exists_func(invoice_number, supplier_name=supplier_name)
             if is_duplicate:
                 return {
                     'is_duplicate': True,
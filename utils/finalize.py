@@ -0,0 +1,326 @@
+import logging
+from datetime import datetime
+
+from utils.normalize import (
+    normalize_invoice_number, normalize_date_iso, parse_amount_cents, amount_out_of_range, detect_currency
+)
+from utils.document_store import index_invoice_texts
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Fields a reviewer can correct; a missing or empty value keeps the pending row's value
+VALIDATED_FIELDS = [
+    'supplier_name', 'company_name', 'invoice_number', 'invoice_date', 'due_date',
+    'normalized_date', 'amount_original', 'vat_amount_original', 'description'
+]
+
+def _create_staging_table(conn):
+    """Create (or empty) the per-connection staging table"""
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS finalize_staging (
+            pending_id INTEGER PRIMARY KEY,
+            position INTEGER,
+            request_file_path TEXT,
+            supplier_name TEXT,
+            company_name TEXT,
+            invoice_number TEXT,
+            invoice_date TEXT,
+            due_date TEXT,
+            normalized_date TEXT,
+            amount_original TEXT,
+            vat_amount_original TEXT,
+            description TEXT,
+            file_path TEXT,
+            original_path TEXT,
+            raw_text_hash TEXT,
+            ocr_text_hash TEXT,
+            file_hash TEXT,
+            invoice_number_key TEXT,
+            amount_cents INTEGER,
+            vat_cents INTEGER,
+            currency TEXT,
+            invoice_date_iso TEXT,
+            supplier_id INTEGER,
+            company_id INTEGER,
+            invoice_id INTEGER,
+            error TEXT,
+            is_duplicate INTEGER DEFAULT 0
+        )
+    ''')
+    conn.execute('DELETE FROM temp.finalize_staging')
+
+def _field_value(field, value):
+    """A reviewer-supplied field as stored: text, or None when empty; ValueError for objects"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError(f"Invalid {field}: expected text, got {type(value).__name__}")
+
+def _derived_values(row):
+    """Normalised key, typed amounts, currency and ISO date for one staged row"""
+    amount_cents = parse_amount_cents(row['amount_original'])
+    vat_cents = parse_amount_cents(row['vat_amount_original'])
+    for field, cents in (('amount_original', amount_cents), ('vat_amount_original', vat_cents)):
+        if cents is None and amount_out_of_range(row[field]):
+            raise ValueError(f"{field} {row[field]!r} is out of range")
+    currency = None
+    if amount_cents is not None or vat_cents is not None:
+        currency = detect_currency(row['amount_original'], row['vat_amount_original'])
+    return (
+        normalize_invoice_number(row['invoice_number']), amount_cents, vat_cents, currency,
+        normalize_date_iso(row['invoice_date'])
+    )
+
+def _next_invoice_id(conn):
+    """First free invoices id, honouring AUTOINCREMENT's no-reuse rule"""
+    row = conn.execute('''
+        SELECT MAX(
+            COALESCE((SELECT MAX(id) FROM invoices), 0),
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'invoices'), 0)
+        )
+    ''').fetchone()
+    return row[0] + 1
+
+def finalize_validated_files(conn, batch_id, validated_files):
+    """Move human-validated pending invoices into the invoices table in bulk
+
+    The validated rows are staged in a temporary table and every step
+    (merging with the pending rows, duplicate checks, supplier/company
+    resolution, the invoices insert and the pending/batch_queue updates) is
+    one statement over the whole set. Runs inside the caller's transaction
+    (which must hold the write lock, e.g. BEGIN IMMEDIATE) and does not commit.
+    Bad data in a row (missing pending invoice, values that are not text or
+    cannot be parsed) fails that row only and is reported in 'errors'.
+
+    Args:
+        conn: Open database connection with a transaction in progress
+        batch_id: Batch the files belong to, or None to use each pending row's batch
+        validated_files: List of dicts with pending_id and corrected fields
+
+    Returns:
+        dict: 'finalized' (index, pending_id, invoice_id, file_path, invoice_number
+              per row) and 'errors' (index, pending_id, file, error and optionally
+              is_duplicate/invoice_number); index is the position in validated_files
+    """
+    now = datetime.now().isoformat()
+    source_info = f"From batch {batch_id}, validated by human" if batch_id else 'Validated by human'
+    errors = []
+    staged = []
+    seen = set()
+
+    for position, file_data in enumerate(validated_files):
+        file_label = file_data.get('file_path', 'Unknown file')
+        try:
+            pending_id = int(file_data.get('pending_id'))
+        except (TypeError, ValueError):
+            errors.append({'index': position, 'pending_id': None, 'file': file_label, 'error': 'Missing pending_id'})
+            continue
+        if pending_id in seen:
+            errors.append({
+                'index': position,
+                'pending_id': pending_id,
+                'file': file_label,
+                'error': f'Pending invoice with ID {pending_id} listed more than once'
+            })
+            continue
+        try:
+            values = [_field_value(field, file_data.get(field)) for field in VALIDATED_FIELDS]
+        except ValueError as e:
+            errors.append({'index': position, 'pending_id': pending_id, 'file': file_label, 'error': str(e)})
+            continue
+        seen.add(pending_id)
+        staged.append([pending_id, position, str(file_label)] + values)
+
+    _create_staging_table(conn)
+
+    conn.executemany(f'''
+        INSERT INTO temp.finalize_staging (pending_id, position, request_file_path, {', '.join(VALIDATED_FIELDS)})
+        VALUES ({', '.join(['?'] * (len(VALIDATED_FIELDS) + 3))})
+    ''', staged)
+
+    conn.execute('''
+        UPDATE temp.finalize_staging
+        SET error = 'Pending invoice with ID ' || pending_id || ' not found'
+        WHERE pending_id NOT IN (SELECT id FROM pending_invoices)
+    ''')
+
+    # Reviewer values win; anything left empty falls back to the extracted value
+    merged = ',\n            '.join(f'{field} = COALESCE(s.{field}, p.{field})' for field in VALIDATED_FIELDS)
+    conn.execute(f'''
+        UPDATE temp.finalize_staging AS s SET
+            {merged},
+            file_path = p.file_path,
+            original_path = p.original_path,
+            file_hash = p.file_hash
+        FROM pending_invoices AS p
+        WHERE p.id = s.pending_id AND s.error IS NULL
+    ''')
+    conn.execute('''
+        UPDATE temp.finalize_staging AS s SET
+            raw_text_hash = b.raw_text_hash,
+            ocr_text_hash = b.ocr_text_hash
+        FROM pending_invoice_blobs AS b
+        WHERE b.pending_id = s.pending_id AND s.error IS NULL
+    ''')
+
+    # Derived columns, row by row so one unparseable value only fails its own row
+    derived = []
+    unparseable = []
+    for row in conn.execute('''
+        SELECT pending_id, invoice_number, amount_original, vat_amount_original, invoice_date
+        FROM temp.finalize_staging WHERE error IS NULL
+    ''').fetchall():
+        try:
+            derived.append(_derived_values(row) + (row['pending_id'],))
+        except (ValueError, ArithmeticError) as e:
+            unparseable.append((f"Could not parse values: {str(e)}", row['pending_id']))
+    conn.executemany('''
+        UPDATE temp.finalize_staging SET
+            invoice_number_key = ?, amount_cents = ?, vat_cents = ?, currency = ?, invoice_date_iso = ?
+        WHERE pending_id = ?
+    ''', derived)
+    conn.executemany('UPDATE temp.finalize_staging SET error = ? WHERE pending_id = ?', unparseable)
+
+    # Duplicates of existing invoices, same rules as find_duplicate_invoice: key or
+    # raw number, scoped to the supplier when one is named
+    conn.execute('''
+        UPDATE temp.finalize_staging AS s
+        SET error = 'Invoice number ' || s.invoice_number || ' already exists in database',
+            is_duplicate = 1
+        WHERE s.error IS NULL AND s.invoice_number_key IS NOT NULL AND (
+            EXISTS (
+                SELECT 1 FROM invoices i
+                WHERE i.invoice_number_key = s.invoice_number_key
+                AND (NULLIF(s.supplier_name, '') IS NULL
+                     OR i.supplier_id = (SELECT id FROM suppliers WHERE name = s.supplier_name))
+            )
+            OR EXISTS (
+                SELECT 1 FROM invoices i
+                WHERE i.invoice_number = s.invoice_number
+                AND (NULLIF(s.supplier_name, '') IS NULL
+                     OR i.supplier_id = (SELECT id FROM suppliers WHERE name = s.supplier_name))
+            )
+        )
+    ''')
+
+    # Duplicates within the request: the first occurrence wins
+    conn.execute('''
+        UPDATE temp.finalize_staging
+        SET error = 'Invoice number ' || invoice_number || ' appears more than once in this request',
+            is_duplicate = 1
+        WHERE pending_id IN (
+            SELECT pending_id FROM (
+                SELECT pending_id, ROW_NUMBER() OVER (
+                    PARTITION BY invoice_number_key, COALESCE(supplier_name, '')
+                    ORDER BY position
+                ) AS occurrence
+                FROM temp.finalize_staging
+                WHERE error IS NULL AND invoice_number_key IS NOT NULL
+            )
+            WHERE occurrence > 1
+        )
+    ''')
+
+    # Resolve suppliers and companies, creating the missing ones
+    for table, column, id_column in (('suppliers', 'supplier_name', 'supplier_id'),
+                                     ('companies', 'company_name', 'company_id')):
+        conn.execute(f'''
+            INSERT OR IGNORE INTO {table} (name)
+            SELECT DISTINCT {column} FROM temp.finalize_staging
+            WHERE error IS NULL AND {column} != ''
+        ''')
+        conn.execute(f'''
+            UPDATE temp.finalize_staging AS s SET {id_column} = t.id
+            FROM {table} AS t
+            WHERE t.name = s.{column} AND s.error IS NULL AND s.{column} != ''
+        ''')
+
+    # Assign invoice ids up front so each result can report its invoice
+    conn.execute('''
+        UPDATE temp.finalize_staging AS s SET invoice_id = ? + n.rank
+        FROM (
+            SELECT pending_id, ROW_NUMBER() OVER (ORDER BY position) - 1 AS rank
+            FROM temp.finalize_staging WHERE error IS NULL
+        ) AS n
+        WHERE n.pending_id = s.pending_id
+    ''', (_next_invoice_id(conn),))
+
+    conn.execute('''
+        INSERT INTO invoices (
+            id, file_path, original_path, invoice_number, invoice_number_key, invoice_date, due_date, normalized_date,
+            amount_original, vat_amount_original, description, supplier_id, company_id,
+            confidence, ocr_text_hash, raw_text_hash, processed_at, source_info,
+            amount_extracted_raw, vat_amount_extracted_raw,
+            amount_cents, vat_cents, currency, invoice_date_iso, file_hash
+        )
+        SELECT
+            invoice_id, file_path, original_path, invoice_number, invoice_number_key, invoice_date, due_date, normalized_date,
+            amount_original, vat_amount_original, description, supplier_id, company_id,
+            NULL, ocr_text_hash, raw_text_hash, ?, ?,
+            amount_original, vat_amount_original,
+            amount_cents, vat_cents, currency, invoice_date_iso, file_hash
+        FROM temp.finalize_staging
+        WHERE error IS NULL
+        ORDER BY position
+    ''', (now, source_info))
+
+    index_invoice_texts(conn, [row[0] for row in conn.execute(
+        'SELECT invoice_id FROM temp.finalize_staging WHERE error IS NULL '
+        'AND (raw_text_hash IS NOT NULL OR ocr_text_hash IS NOT NULL)'
+    ).fetchall()])
+
+    validated = ',\n            '.join(f'{field} = s.{field}' for field in VALIDATED_FIELDS)
+    conn.execute(f'''
+        UPDATE pending_invoices AS p SET
+            {validated},
+            is_validated = 1,
+            validated_at = ?,
+            validation_status = 'human_validated',
+            is_finalized = 1,
+            finalized_at = ?
+        FROM temp.finalize_staging AS s
+        WHERE p.id = s.pending_id AND s.error IS NULL
+    ''', (now, now))
+
+    conn.execute('''
+        UPDATE batch_queue SET status = 'processed'
+        WHERE batch_id = COALESCE(?, batch_id) AND pending_id IN (
+            SELECT pending_id FROM temp.finalize_staging WHERE error IS NULL
+        )
+    ''', (batch_id,))
+
+    finalized = []
+    for row in conn.execute('SELECT * FROM temp.finalize_staging ORDER BY position').fetchall():
+        if row['error'] is None:
+            finalized.append({
+                'index': row['position'],
+                'pending_id': row['pending_id'],
+                'invoice_id': row['invoice_id'],
+                'file_path': row['file_path'],
+                'invoice_number': row['invoice_number']
+            })
+        elif row['is_duplicate']:
+            errors.append({
+                'index': row['position'],
+                'pending_id': row['pending_id'],
+                'file': row['file_path'],
+                'error': row['error'],
+                'is_duplicate': True,
+                'invoice_number': row['invoice_number']
+            })
+        else:
+            errors.append({
+                'index': row['position'],
+                'pending_id': row['pending_id'],
+                'file': row['request_file_path'],
+                'error': row['error']
+            })
+
+    conn.execute('DELETE FROM temp.finalize_staging')
+    errors.sort(key=lambda error: error['index'])
+    log.info(f"Finalized {len(finalized)} invoices{f' from batch {batch_id}' if batch_id else ''}, {len(errors)} errors")
+    return {'finalized': finalized, 'errors': errors}
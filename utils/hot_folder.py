@@ -0,0 +1,243 @@
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.database import get_db_connection
+from utils.file_utils import allowed_file, compute_file_hash
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# inotify event masks (see <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+_EVENT_HEADER = struct.Struct('iIII')
+
+_libc = None
+
+def _load_libc():
+    """Load libc with the inotify entry points, or raise OSError"""
+    global _libc
+    if _libc is None:
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc = libc
+    return _libc
+
+class Inotify:
+    """Minimal ctypes wrapper around the Linux inotify API"""
+
+    def __init__(self):
+        self._libc = _load_libc()
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self.watches = {}
+
+    def add_watch(self, path, mask=IN_CLOSE_WRITE | IN_MOVED_TO):
+        """Watch a directory for the given events"""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch failed for {path}: {os.strerror(err)}")
+        self.watches[wd] = path
+        return wd
+
+    def read_events(self, timeout=None):
+        """Block until events arrive (or timeout) and return (directory, name, mask) tuples"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0').decode('utf-8', errors='surrogateescape')
+            offset += length
+            events.append((self.watches.get(wd), name, mask))
+        return events
+
+    def close(self):
+        """Close the inotify file descriptor"""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def claim_file(db_path, content_hash, file_path):
+    """Record a hot folder file by content hash
+
+    Returns:
+        bool: True if this content has not been ingested before
+    """
+    conn = get_db_connection(db_path)
+    try:
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO hot_folder_files (content_hash, file_path, status, created_at)
+            VALUES (?, ?, 'processing', ?)
+        ''', (content_hash, file_path, datetime.now().isoformat()))
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+def update_file_status(db_path, content_hash, status, pending_id=None, error=None):
+    """Store the outcome of ingesting a hot folder file"""
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute('''
+            UPDATE hot_folder_files
+            SET status = ?, pending_id = ?, error = ?, processed_at = ?
+            WHERE content_hash = ?
+        ''', (status, pending_id, error, datetime.now().isoformat(), content_hash))
+        conn.commit()
+    finally:
+        conn.close()
+
+def release_file(db_path, content_hash):
+    """Forget a hot folder file so the same content can be ingested again"""
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute('DELETE FROM hot_folder_files WHERE content_hash = ?', (content_hash,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def record_result(db_path, content_hash, result):
+    """Store the outcome of processing a hot folder file
+
+    Files waiting in the retry queue or dead-lettered keep their claim under
+    that status; after any other failure the content hash is released so the
+    same file is ingested again when it is dropped again.
+    """
+    status = result.get('status')
+    if result.get('success'):
+        update_file_status(db_path, content_hash, 'processed', pending_id=result.get('pending_id'))
+    elif result.get('is_duplicate'):
+        update_file_status(db_path, content_hash, 'duplicate', error=result.get('error'))
+    elif status in ('queued_for_retry', 'dead_lettered'):
+        update_file_status(db_path, content_hash, status, error=result.get('error'))
+    else:
+        release_file(db_path, content_hash)
+
+class HotFolderWatcher:
+    """Watch directories with inotify and ingest new PDF files
+
+    Files are picked up on IN_CLOSE_WRITE (the writer closed the file) or
+    IN_MOVED_TO (the file was atomically renamed into place), so partially
+    written files are never processed. Each file is deduplicated by its
+    SHA-256 content hash before it is handed to `process_func`.
+    """
+
+    def __init__(self, directories, process_func, db_path, workers=2, scan_existing=True):
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.process_func = process_func
+        self.db_path = db_path
+        self.scan_existing = scan_existing
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hot-folder')
+        self._inotify = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Start watching in a background thread"""
+        self._inotify = Inotify()
+        for directory in self.directories:
+            os.makedirs(directory, exist_ok=True)
+            self._inotify.add_watch(directory)
+            log.info(f"Watching hot folder: {directory}")
+
+        # Pick up files that arrived while the watcher was not running
+        if self.scan_existing:
+            for directory in self.directories:
+                for name in sorted(os.listdir(directory)):
+                    self._schedule(os.path.join(directory, name))
+
+        self._thread = threading.Thread(target=self._run, name='hot-folder-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop watching and wait for in-flight files to finish"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+        if self._inotify:
+            self._inotify.close()
+
+    def _run(self):
+        """Event loop - blocks in select() until the kernel reports events"""
+        while not self._stop_event.is_set():
+            try:
+                # The timeout only bounds how long stop() waits; no files are scanned
+                events = self._inotify.read_events(timeout=1.0)
+            except Exception as e:
+                log.error(f"Error reading inotify events: {str(e)}")
+                continue
+
+            for directory, name, mask in events:
+                if mask & IN_Q_OVERFLOW:
+                    log.warning("inotify queue overflowed - some hot folder events were lost")
+                    continue
+                if mask & (IN_IGNORED | IN_ISDIR) or not directory or not name:
+                    continue
+                self._schedule(os.path.join(directory, name))
+
+    def _schedule(self, file_path):
+        """Queue a file for ingestion if it looks like an invoice PDF"""
+        name = os.path.basename(file_path)
+        if name.startswith('.') or not allowed_file(name) or not os.path.isfile(file_path):
+            return
+        self._executor.submit(self._ingest, file_path)
+
+    def _ingest(self, file_path):
+        """Deduplicate and process a single file"""
+        try:
+            content_hash = compute_file_hash(file_path)
+        except OSError as e:
+            log.error(f"Could not read hot folder file {file_path}: {str(e)}")
+            return None
+
+        if not claim_file(self.db_path, content_hash, file_path):
+            log.info(f"Skipping hot folder file with already ingested content: {file_path}")
+            return None
+
+        log.info(f"Ingesting hot folder file {file_path} ({content_hash[:12]})")
+        try:
+            result = self.process_func(file_path)
+        except Exception as e:
+            log.error(f"Error ingesting hot folder file {file_path}: {str(e)}", exc_info=True)
+            # Allow the same content to be retried when it is dropped again
+            release_file(self.db_path, content_hash)
+            return None
+
+        if not result.get('success') and not result.get('is_duplicate'):
+            log.warning(f"Hot folder file {file_path} not ingested ({result.get('status', 'error')}): {result.get('error')}")
+        record_result(self.db_path, content_hash, result)
+        return result
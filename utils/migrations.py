@@ -0,0 +1,999 @@
+import re
+import logging
+
+from utils.database import get_db_connection
+from utils.document_store import store_text
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+def _add_missing_columns(conn, table, columns):
+    """Add columns that databases created by older releases lack"""
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+    for column, definition in columns:
+        if column not in existing:
+            log.info(f"Adding {column} column to {table} table")
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def _baseline_schema(conn):
+    """Schema as it stood before versioned migrations (user_version 0)
+
+    Creates the tables on a fresh database and brings databases from older
+    releases up to the same columns. Only runs while user_version is 0.
+    """
+    # Create invoices table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS invoices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT,
+        original_path TEXT,
+        invoice_number TEXT,
+        invoice_date TEXT,
+        due_date TEXT,
+        normalized_date TEXT,
+        amount_original TEXT,
+        vat_amount_original TEXT,
+        description TEXT,
+        supplier_id INTEGER,
+        company_id INTEGER,
+        confidence REAL,
+        ocr_text TEXT,
+        raw_text TEXT,
+        processed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(supplier_id) REFERENCES suppliers(id),
+        FOREIGN KEY(company_id) REFERENCES companies(id)
+    )
+    ''')
+    
+    # Create suppliers table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS suppliers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE
+    )
+    ''')
+    
+    # Create companies table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS companies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE
+    )
+    ''')
+    
+    # Create pending_invoices table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS pending_invoices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        batch_id TEXT,
+        file_path TEXT,
+        original_path TEXT,
+        preview_path TEXT,
+        invoice_number TEXT,
+        invoice_date TEXT,
+        due_date TEXT,
+        normalized_date TEXT,
+        amount_original TEXT,
+        vat_amount_original TEXT,
+        description TEXT,
+        supplier_name TEXT,
+        company_name TEXT,
+        processed_at TEXT,
+        is_viewed INTEGER DEFAULT 0,
+        needs_manual_input INTEGER DEFAULT 0,
+        is_finalized INTEGER DEFAULT 0,
+        finalized_at TEXT,
+        source TEXT,
+        source_info TEXT,
+        raw_text TEXT,
+        ocr_text TEXT,
+        extracted_data TEXT,
+        validation_status TEXT,
+        validation_notes TEXT,
+        is_validated INTEGER DEFAULT 0,
+        validated_at TEXT,
+        validated_by TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT
+    )
+    ''')
+    
+    # Create batch_queue table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS batch_queue (
+        id INTEGER PRIMARY KEY,
+        batch_id TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        preview_path TEXT,
+        filename TEXT,
+        status TEXT DEFAULT 'pending',
+        processed_at TEXT,
+        pending_id INTEGER,
+        position INTEGER,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Create lexoffice_credentials table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS lexoffice_credentials (
+        id INTEGER PRIMARY KEY,
+        api_key TEXT NOT NULL,
+        download_dir TEXT,
+        is_active INTEGER DEFAULT 1,
+        last_sync TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT
+    )
+    ''')
+    
+    # Create lexoffice_processed_vouchers table to track processed invoices
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS lexoffice_processed_vouchers (
+        id INTEGER PRIMARY KEY,
+        voucher_id TEXT UNIQUE,
+        voucher_number TEXT,
+        voucher_type TEXT,
+        voucher_status TEXT,
+        file_id TEXT,
+        file_path TEXT,
+        processed_at TEXT,
+        batch_id TEXT,
+        pending_id INTEGER,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Create email_credentials table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS email_credentials (
+        id INTEGER PRIMARY KEY,
+        email TEXT UNIQUE,
+        password TEXT,
+        imap_server TEXT,
+        port INTEGER DEFAULT 993,
+        use_ssl INTEGER DEFAULT 1,
+        is_custom INTEGER DEFAULT 0,
+        custom_server TEXT,
+        last_used TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Create hot_folder_files table to deduplicate hot folder ingestion by content
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS hot_folder_files (
+        id INTEGER PRIMARY KEY,
+        content_hash TEXT UNIQUE NOT NULL,
+        file_path TEXT,
+        status TEXT,
+        pending_id INTEGER,
+        error TEXT,
+        processed_at TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Create retry queue for extractions that failed transiently (Ollama down, OCR crash)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS extraction_retries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT NOT NULL,
+        filename TEXT,
+        source TEXT,
+        batch_id TEXT,
+        source_info TEXT,
+        attempts INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'waiting',
+        last_error TEXT,
+        error_type TEXT,
+        next_attempt_at TEXT,
+        created_at TEXT,
+        updated_at TEXT
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_extraction_retries_due ON extraction_retries(status, next_attempt_at)')
+    
+    # Create dead-letter table for extractions that failed permanently or ran out of retries
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS extraction_dead_letters (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT NOT NULL,
+        filename TEXT,
+        source TEXT,
+        batch_id TEXT,
+        source_info TEXT,
+        attempts INTEGER DEFAULT 0,
+        error TEXT,
+        error_type TEXT,
+        first_failed_at TEXT,
+        dead_lettered_at TEXT
+    )
+    ''')
+
+    # Columns that were added to existing databases at startup before migrations existed
+    _add_missing_columns(conn, 'pending_invoices', [
+        ('is_validated', 'INTEGER DEFAULT 0'),
+        ('validated_at', 'TEXT'),
+        ('validated_by', 'TEXT'),
+    ])
+    _add_missing_columns(conn, 'email_credentials', [('last_used', 'TEXT')])
+
+def _migration_1_index_suite(conn):
+    """Secondary indexes for the hot lookups and list ORDER BYs"""
+    statements = [
+        # Duplicate checks and validation look invoices up by number
+        'CREATE INDEX IF NOT EXISTS idx_invoices_invoice_number ON invoices(invoice_number)',
+        # /api/invoices orders by processed_at; dashboard filters by date
+        'CREATE INDEX IF NOT EXISTS idx_invoices_processed_at ON invoices(processed_at)',
+        'CREATE INDEX IF NOT EXISTS idx_invoices_invoice_date ON invoices(invoice_date)',
+        # Joins and per-supplier / per-company listings
+        'CREATE INDEX IF NOT EXISTS idx_invoices_supplier_id ON invoices(supplier_id)',
+        'CREATE INDEX IF NOT EXISTS idx_invoices_company_id ON invoices(company_id)',
+        # Name filters: SQLite LIKE is case-insensitive, so only a NOCASE index
+        # can serve prefix searches (the UNIQUE index covers exact lookups)
+        'CREATE INDEX IF NOT EXISTS idx_suppliers_name_nocase ON suppliers(name COLLATE NOCASE)',
+        'CREATE INDEX IF NOT EXISTS idx_companies_name_nocase ON companies(name COLLATE NOCASE)',
+        # /api/pending-invoices filters by batch and manual-input flag, newest first
+        'CREATE INDEX IF NOT EXISTS idx_pending_invoices_created_at ON pending_invoices(created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_pending_invoices_batch_id ON pending_invoices(batch_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_pending_invoices_needs_manual ON pending_invoices(needs_manual_input, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_pending_invoices_invoice_number ON pending_invoices(invoice_number)',
+        # Batch views list files in order and resolve queue entries by pending ID
+        'CREATE INDEX IF NOT EXISTS idx_batch_queue_batch_id ON batch_queue(batch_id, position)',
+        'CREATE INDEX IF NOT EXISTS idx_batch_queue_pending_id ON batch_queue(pending_id)',
+    ]
+    for statement in statements:
+        conn.execute(statement)
+    # Give the query planner statistics for the new indexes
+    conn.execute('ANALYZE')
+
+def _migration_2_invoice_number_key(conn):
+    """Normalised invoice number key, unique per supplier"""
+    _add_missing_columns(conn, 'invoices', [('invoice_number_key', 'TEXT')])
+    # Key first so unscoped duplicate checks can use the index too
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_number_key_supplier
+        ON invoices(invoice_number_key, supplier_id)
+    ''')
+    # Existing rows are filled in by the resumable backfill in utils/backfill.py
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_progress (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER DEFAULT 0,
+            rows_updated INTEGER DEFAULT 0,
+            conflicts INTEGER DEFAULT 0,
+            started_at TEXT,
+            updated_at TEXT,
+            completed_at TEXT
+        )
+    ''')
+
+def _migration_3_typed_amounts_and_dates(conn):
+    """Integer cent amounts, currency code and ISO invoice date"""
+    _add_missing_columns(conn, 'invoices', [
+        ('amount_cents', 'INTEGER'),
+        ('vat_cents', 'INTEGER'),
+        ('currency', 'TEXT'),
+        ('invoice_date_iso', 'TEXT'),
+    ])
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_invoice_date_iso ON invoices(invoice_date_iso)')
+    # Existing rows are converted by the 'invoice_typed_columns' backfill
+
+def _migration_4_invoice_source_columns(conn):
+    """Columns the validate and finalize inserts write but no DDL created"""
+    _add_missing_columns(conn, 'invoices', [
+        ('source_info', 'TEXT'),
+        ('amount_extracted_raw', 'TEXT'),
+        ('vat_amount_extracted_raw', 'TEXT'),
+    ])
+
+def _migration_5_invoice_fts(conn):
+    """FTS5 index over invoice numbers, names, descriptions and document text"""
+    # Self-contained FTS table (rowid = invoices.id) so snippets work without
+    # joining back, and supplier/company names are indexed by value
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS invoice_fts USING fts5(
+            invoice_number, supplier_name, company_name, description, document_text,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    fts_row = '''
+        new.invoice_number,
+        (SELECT name FROM suppliers WHERE id = new.supplier_id),
+        (SELECT name FROM companies WHERE id = new.company_id),
+        new.description,
+        trim(COALESCE(new.raw_text, '') || ' ' || COALESCE(new.ocr_text, ''))
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_insert AFTER INSERT ON invoices BEGIN
+            INSERT INTO invoice_fts (rowid, invoice_number, supplier_name, company_name, description, document_text)
+            VALUES (new.id, {fts_row});
+        END
+    ''')
+    # Only columns that feed the index re-index the row (file moves do not)
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_update
+        AFTER UPDATE OF invoice_number, supplier_id, company_id, description, raw_text, ocr_text ON invoices BEGIN
+            DELETE FROM invoice_fts WHERE rowid = old.id;
+            INSERT INTO invoice_fts (rowid, invoice_number, supplier_name, company_name, description, document_text)
+            VALUES (new.id, {fts_row});
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_delete AFTER DELETE ON invoices BEGIN
+            DELETE FROM invoice_fts WHERE rowid = old.id;
+        END
+    ''')
+    for table, column in (('suppliers', 'supplier'), ('companies', 'company')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_rename AFTER UPDATE OF name ON {table} BEGIN
+                UPDATE invoice_fts SET {column}_name = new.name
+                WHERE rowid IN (SELECT id FROM invoices WHERE {column}_id = new.id);
+            END
+        ''')
+    # Index the invoices that already exist
+    conn.execute('DELETE FROM invoice_fts')
+    conn.execute('''
+        INSERT INTO invoice_fts (rowid, invoice_number, supplier_name, company_name, description, document_text)
+        SELECT i.id, i.invoice_number, s.name, c.name, i.description,
+               trim(COALESCE(i.raw_text, '') || ' ' || COALESCE(i.ocr_text, ''))
+        FROM invoices i
+        LEFT JOIN suppliers s ON i.supplier_id = s.id
+        LEFT JOIN companies c ON i.company_id = c.id
+    ''')
+
+def _dashboard_invoice_delta(row, sign):
+    """Trigger statements that add (sign=1) or remove (sign=-1) one invoice row from the stats"""
+    statements = [f'''
+        UPDATE dashboard_stats SET
+            invoice_count = invoice_count + {sign},
+            amount_cents_sum = amount_cents_sum + {sign} * COALESCE({row}.amount_cents, 0),
+            amount_count = amount_count + {sign} * ({row}.amount_cents IS NOT NULL)
+        WHERE id = 1;
+    ''', f'''
+        INSERT INTO dashboard_daily_uploads (day, invoice_count)
+        VALUES (COALESCE(substr({row}.processed_at, 1, 10), ''), {sign})
+        ON CONFLICT(day) DO UPDATE SET invoice_count = invoice_count + {sign};
+    ''']
+    # Per-supplier/company invoice counts; the distinct totals change when one goes 0 <-> 1
+    for entity in ('supplier', 'company'):
+        counts = f'dashboard_{entity}_invoices'
+        if sign > 0:
+            statements.append(f'''
+                UPDATE dashboard_stats SET {entity}_count = {entity}_count + 1
+                WHERE id = 1 AND {row}.{entity}_id IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM {counts} WHERE {entity}_id = {row}.{entity}_id);
+            ''')
+            statements.append(f'''
+                INSERT INTO {counts} ({entity}_id, invoice_count)
+                SELECT {row}.{entity}_id, 1 WHERE {row}.{entity}_id IS NOT NULL
+                ON CONFLICT({entity}_id) DO UPDATE SET invoice_count = invoice_count + 1;
+            ''')
+        else:
+            statements.append(f'''
+                UPDATE {counts} SET invoice_count = invoice_count - 1 WHERE {entity}_id = {row}.{entity}_id;
+            ''')
+            statements.append(f'''
+                UPDATE dashboard_stats SET {entity}_count = {entity}_count - 1
+                WHERE id = 1 AND EXISTS (
+                    SELECT 1 FROM {counts} WHERE {entity}_id = {row}.{entity}_id AND invoice_count <= 0
+                );
+            ''')
+            statements.append(f'''
+                DELETE FROM {counts} WHERE {entity}_id = {row}.{entity}_id AND invoice_count <= 0;
+            ''')
+    return ''.join(statements)
+
+def _migration_6_dashboard_stats(conn):
+    """Trigger-maintained dashboard counters, amount sums and daily upload histogram"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            invoice_count INTEGER NOT NULL DEFAULT 0,
+            pending_count INTEGER NOT NULL DEFAULT 0,
+            needs_manual_count INTEGER NOT NULL DEFAULT 0,
+            supplier_count INTEGER NOT NULL DEFAULT 0,
+            company_count INTEGER NOT NULL DEFAULT 0,
+            amount_cents_sum INTEGER NOT NULL DEFAULT 0,
+            amount_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_daily_uploads (
+            day TEXT PRIMARY KEY,
+            invoice_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for entity in ('supplier', 'company'):
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS dashboard_{entity}_invoices (
+                {entity}_id INTEGER PRIMARY KEY,
+                invoice_count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS invoices_stats_insert AFTER INSERT ON invoices BEGIN
+            {_dashboard_invoice_delta('new', 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS invoices_stats_delete AFTER DELETE ON invoices BEGIN
+            {_dashboard_invoice_delta('old', -1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS invoices_stats_update
+        AFTER UPDATE OF supplier_id, company_id, amount_cents, processed_at ON invoices BEGIN
+            {_dashboard_invoice_delta('old', -1)}
+            {_dashboard_invoice_delta('new', 1)}
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS pending_stats_insert AFTER INSERT ON pending_invoices BEGIN
+            UPDATE dashboard_stats SET
+                pending_count = pending_count + 1,
+                needs_manual_count = needs_manual_count + (new.needs_manual_input = 1)
+            WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS pending_stats_delete AFTER DELETE ON pending_invoices BEGIN
+            UPDATE dashboard_stats SET
+                pending_count = pending_count - 1,
+                needs_manual_count = needs_manual_count - (old.needs_manual_input = 1)
+            WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS pending_stats_update AFTER UPDATE OF needs_manual_input ON pending_invoices BEGIN
+            UPDATE dashboard_stats SET
+                needs_manual_count = needs_manual_count - (old.needs_manual_input = 1) + (new.needs_manual_input = 1)
+            WHERE id = 1;
+        END
+    ''')
+
+    # Seed from the current data
+    conn.execute('DELETE FROM dashboard_stats')
+    conn.execute('DELETE FROM dashboard_daily_uploads')
+    conn.execute('DELETE FROM dashboard_supplier_invoices')
+    conn.execute('DELETE FROM dashboard_company_invoices')
+    conn.execute('''
+        INSERT INTO dashboard_supplier_invoices (supplier_id, invoice_count)
+        SELECT supplier_id, COUNT(*) FROM invoices WHERE supplier_id IS NOT NULL GROUP BY supplier_id
+    ''')
+    conn.execute('''
+        INSERT INTO dashboard_company_invoices (company_id, invoice_count)
+        SELECT company_id, COUNT(*) FROM invoices WHERE company_id IS NOT NULL GROUP BY company_id
+    ''')
+    conn.execute('''
+        INSERT INTO dashboard_daily_uploads (day, invoice_count)
+        SELECT COALESCE(substr(processed_at, 1, 10), ''), COUNT(*) FROM invoices GROUP BY 1
+    ''')
+    conn.execute('''
+        INSERT INTO dashboard_stats (
+            id, invoice_count, pending_count, needs_manual_count, supplier_count, company_count,
+            amount_cents_sum, amount_count
+        )
+        SELECT 1,
+            (SELECT COUNT(*) FROM invoices),
+            (SELECT COUNT(*) FROM pending_invoices),
+            (SELECT COUNT(*) FROM pending_invoices WHERE needs_manual_input = 1),
+            (SELECT COUNT(*) FROM dashboard_supplier_invoices),
+            (SELECT COUNT(*) FROM dashboard_company_invoices),
+            (SELECT COALESCE(SUM(amount_cents), 0) FROM invoices),
+            (SELECT COUNT(amount_cents) FROM invoices)
+    ''')
+
+def _migration_7_list_sort_indexes(conn):
+    """Expression indexes backing the keyset-paginated list sorts (see utils.pagination)"""
+    statements = [
+        "CREATE INDEX IF NOT EXISTS idx_invoices_sort_processed_at ON invoices(COALESCE(processed_at, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_sort_invoice_date ON invoices(COALESCE(invoice_date_iso, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_sort_invoice_number ON invoices(COALESCE(invoice_number, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_sort_amount ON invoices(COALESCE(amount_cents, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_pending_sort_created_at ON pending_invoices(COALESCE(created_at, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_pending_sort_invoice_date ON pending_invoices(COALESCE(invoice_date, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_pending_sort_invoice_number ON pending_invoices(COALESCE(invoice_number, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_pending_sort_batch_created_at ON pending_invoices(batch_id, COALESCE(created_at, ''))",
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+def _migration_8_pending_blobs(conn):
+    """Move the raw text, OCR text and extraction JSON of pending invoices to a side table
+
+    The validation screens read pending rows one after another and only need
+    the form fields; the blobs are loaded on demand by pending_id.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pending_invoice_blobs (
+            pending_id INTEGER PRIMARY KEY,
+            raw_text TEXT,
+            ocr_text TEXT,
+            extracted_data TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS pending_blobs_delete AFTER DELETE ON pending_invoices BEGIN
+            DELETE FROM pending_invoice_blobs WHERE pending_id = old.id;
+        END
+    ''')
+
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(pending_invoices)').fetchall()}
+    columns = [column for column in ('raw_text', 'ocr_text', 'extracted_data') if column in existing]
+    if not columns:
+        return
+    conn.execute(f'''
+        INSERT OR IGNORE INTO pending_invoice_blobs (pending_id, {', '.join(columns)})
+        SELECT id, {', '.join(columns)} FROM pending_invoices
+        WHERE {' OR '.join(f'{column} IS NOT NULL' for column in columns)}
+    ''')
+    for column in columns:
+        conn.execute(f'ALTER TABLE pending_invoices DROP COLUMN {column}')
+
+def _migration_9_compressed_document_texts(conn):
+    """Store raw and OCR text compressed in document_texts, referenced by content hash
+
+    pending_invoice_blobs and invoices keep only raw_text_hash/ocr_text_hash.
+    The FTS triggers read the text back through the decompress_text() SQL
+    function, which every pooled connection registers (replaced by
+    migration 16).
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS document_texts (
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL,
+            raw_size INTEGER NOT NULL,
+            stored_size INTEGER NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # The FTS triggers name raw_text/ocr_text and would block dropping them
+    conn.execute('DROP TRIGGER IF EXISTS invoices_fts_insert')
+    conn.execute('DROP TRIGGER IF EXISTS invoices_fts_update')
+
+    for table, key in (('pending_invoice_blobs', 'pending_id'), ('invoices', 'id')):
+        _add_missing_columns(conn, table, [('raw_text_hash', 'TEXT'), ('ocr_text_hash', 'TEXT')])
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+        for column in ('raw_text', 'ocr_text'):
+            if column not in existing:
+                continue
+            rows = conn.execute(
+                f'SELECT {key}, {column} FROM {table} WHERE {column} IS NOT NULL AND {column} != \'\''
+            ).fetchall()
+            conn.executemany(
+                f'UPDATE {table} SET {column}_hash = ? WHERE {key} = ?',
+                [(store_text(conn, row[1]), row[0]) for row in rows]
+            )
+            log.info(f"Moved {len(rows)} {table}.{column} values to document_texts")
+            conn.execute(f'ALTER TABLE {table} DROP COLUMN {column}')
+
+    fts_row = '''
+        new.invoice_number,
+        (SELECT name FROM suppliers WHERE id = new.supplier_id),
+        (SELECT name FROM companies WHERE id = new.company_id),
+        new.description,
+        trim(
+            COALESCE((SELECT decompress_text(codec, data) FROM document_texts WHERE hash = new.raw_text_hash), '')
+            || ' ' ||
+            COALESCE((SELECT decompress_text(codec, data) FROM document_texts WHERE hash = new.ocr_text_hash), '')
+        )
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER invoices_fts_insert AFTER INSERT ON invoices BEGIN
+            INSERT INTO invoice_fts (rowid, invoice_number, supplier_name, company_name, description, document_text)
+            VALUES (new.id, {fts_row});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER invoices_fts_update
+        AFTER UPDATE OF invoice_number, supplier_id, company_id, description, raw_text_hash, ocr_text_hash ON invoices BEGIN
+            DELETE FROM invoice_fts WHERE rowid = old.id;
+            INSERT INTO invoice_fts (rowid, invoice_number, supplier_name, company_name, description, document_text)
+            VALUES (new.id, {fts_row});
+        END
+    ''')
+
+def _migration_10_pending_archive(conn):
+    """Archive table and audit view for pending invoices compacted out of pending_invoices"""
+    table_info = conn.execute('PRAGMA table_info(pending_invoices)').fetchall()
+    columns = [row[1] for row in table_info]
+    definitions = ',\n            '.join(
+        'id INTEGER PRIMARY KEY' if row[1] == 'id' else f'{row[1]} {row[2] or "TEXT"}' for row in table_info
+    )
+    # Same columns as pending_invoices, plus the side-table values and when the row moved
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS pending_invoices_archive (
+            {definitions},
+            raw_text_hash TEXT,
+            ocr_text_hash TEXT,
+            extracted_data TEXT,
+            archived_at TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pending_archive_batch_id ON pending_invoices_archive(batch_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pending_archive_archived_at ON pending_invoices_archive(archived_at)')
+
+    # Candidates for compaction are found through these instead of a full scan
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pending_invoices_finalized ON pending_invoices(is_finalized, finalized_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pending_invoices_status ON pending_invoices(validation_status, updated_at)')
+
+    column_list = ', '.join(columns)
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS pending_invoices_all AS
+        SELECT {', '.join(f'p.{column}' for column in columns)},
+               b.raw_text_hash, b.ocr_text_hash, b.extracted_data,
+               NULL AS archived_at, 0 AS is_archived
+        FROM pending_invoices p
+        LEFT JOIN pending_invoice_blobs b ON b.pending_id = p.id
+        UNION ALL
+        SELECT {column_list}, raw_text_hash, ocr_text_hash, extracted_data, archived_at, 1 AS is_archived
+        FROM pending_invoices_archive
+    ''')
+
+def _migration_11_batches(conn):
+    """Batch entity with counters kept current by batch_queue triggers
+
+    processed_count counts files that produced a pending invoice (one
+    batch_queue row each) and finalized_count those whose queue row reached
+    'processed'. file_count, failed_count and duplicate_count are maintained
+    by the upload routes (see utils.batches), since failed files never get a
+    queue row.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS batches (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            status TEXT NOT NULL DEFAULT 'processing',
+            file_count INTEGER NOT NULL DEFAULT 0,
+            processed_count INTEGER NOT NULL DEFAULT 0,
+            failed_count INTEGER NOT NULL DEFAULT 0,
+            duplicate_count INTEGER NOT NULL DEFAULT 0,
+            finalized_count INTEGER NOT NULL DEFAULT 0,
+            success_count INTEGER NOT NULL DEFAULT 0,
+            error_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+    # Databases that had a hand-made batches table get the remaining columns
+    _add_missing_columns(conn, 'batches', [
+        ('name', 'TEXT'), ('status', "TEXT NOT NULL DEFAULT 'processing'"),
+        ('file_count', 'INTEGER NOT NULL DEFAULT 0'), ('processed_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('failed_count', 'INTEGER NOT NULL DEFAULT 0'), ('duplicate_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('finalized_count', 'INTEGER NOT NULL DEFAULT 0'), ('success_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('error_count', 'INTEGER NOT NULL DEFAULT 0'), ('created_at', 'TEXT'), ('updated_at', 'TEXT'),
+    ])
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_batches_created_at ON batches(created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_batches_status ON batches(status, created_at)')
+
+    # Queue rows for batches nobody registered (older releases, direct uploads) create the batch
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS batch_queue_counts_insert AFTER INSERT ON batch_queue BEGIN
+            INSERT OR IGNORE INTO batches (id, name, created_at, updated_at)
+            VALUES (new.batch_id, 'Batch ' || new.batch_id, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'),
+                    strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'));
+            UPDATE batches SET
+                processed_count = processed_count + 1,
+                finalized_count = finalized_count + (new.status = 'processed')
+            WHERE id = new.batch_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS batch_queue_counts_update AFTER UPDATE OF status, batch_id ON batch_queue BEGIN
+            UPDATE batches SET
+                processed_count = processed_count - 1,
+                finalized_count = finalized_count - (old.status = 'processed')
+            WHERE id = old.batch_id;
+            UPDATE batches SET
+                processed_count = processed_count + 1,
+                finalized_count = finalized_count + (new.status = 'processed')
+            WHERE id = new.batch_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS batch_queue_counts_delete AFTER DELETE ON batch_queue BEGIN
+            UPDATE batches SET
+                processed_count = processed_count - 1,
+                finalized_count = finalized_count - (old.status = 'processed')
+            WHERE id = old.batch_id;
+        END
+    ''')
+
+    # Batches that already have queue rows
+    conn.execute('''
+        INSERT OR IGNORE INTO batches (
+            id, name, status, file_count, processed_count, finalized_count, created_at, updated_at
+        )
+        SELECT batch_id, 'Batch ' || batch_id,
+               CASE WHEN SUM(status = 'processed') = COUNT(*) THEN 'completed' ELSE 'ready_for_validation' END,
+               COUNT(*), COUNT(*), SUM(status = 'processed'), MIN(created_at), MAX(COALESCE(processed_at, created_at))
+        FROM batch_queue
+        GROUP BY batch_id
+    ''')
+
+def _migration_12_near_duplicates(conn):
+    """PDF content hashes and the composite index behind near-duplicate detection"""
+    for table in ('invoices', 'pending_invoices', 'pending_invoices_archive'):
+        _add_missing_columns(conn, table, [('file_hash', 'TEXT')])
+    # Near-duplicate flags set when the pending row is written (utils.near_duplicates)
+    for table in ('pending_invoices', 'pending_invoices_archive'):
+        _add_missing_columns(conn, table, [('duplicate_score', 'REAL'), ('duplicate_candidates', 'TEXT')])
+    # Same supplier and amount within a few days of the invoice date is one range seek
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_invoices_near_duplicate
+        ON invoices(supplier_id, amount_cents, invoice_date_iso)
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_file_hash ON invoices(file_hash) WHERE file_hash IS NOT NULL')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_pending_invoices_file_hash
+        ON pending_invoices(file_hash) WHERE file_hash IS NOT NULL
+    ''')
+
+def _migration_13_company_shards(conn):
+    """Routing table for per-company invoice databases (see utils.sharding)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS company_shards (
+            company_id INTEGER PRIMARY KEY,
+            shard_no INTEGER NOT NULL UNIQUE,
+            db_file TEXT NOT NULL,
+            created_at TEXT
+        )
+    ''')
+
+def _migration_14_invoice_number_registry(conn):
+    """Catalog-wide (invoice number key, supplier) registry for per-company databases
+
+    Each shard's unique index only sees its own invoices; the catalog keeps
+    one row per number finalized into any database so duplicate checks hold
+    across shards. invoice_id stays NULL while a finalize holds the number.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS invoice_number_registry (
+            invoice_number_key TEXT NOT NULL,
+            supplier_id INTEGER,
+            shard_no INTEGER NOT NULL,
+            invoice_id INTEGER,
+            pending_id INTEGER,
+            created_at TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_invoice_number_registry_key
+        ON invoice_number_registry(invoice_number_key, supplier_id)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_invoice_number_registry_invoice
+        ON invoice_number_registry(invoice_id)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_invoice_number_registry_pending
+        ON invoice_number_registry(pending_id)
+    ''')
+
+def _rebuild_table(conn, table, create_sql, columns):
+    """Replace a table with one created by create_sql (as {table}_rebuild)
+
+    Rows (the given columns, in id order), indexes and triggers carry over.
+    Views and other tables' triggers refer to the table by name and keep
+    working once the rebuilt table takes it over.
+    """
+    dependents = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()]
+    conn.execute(create_sql)
+    column_list = ', '.join(columns)
+    conn.execute(f'INSERT INTO {table}_rebuild ({column_list}) SELECT {column_list} FROM {table} ORDER BY id')
+    conn.execute(f'DROP TABLE {table}')
+    # Legacy mode renames without re-checking the views that name the dropped table
+    conn.execute('PRAGMA legacy_alter_table = ON')
+    try:
+        conn.execute(f'ALTER TABLE {table}_rebuild RENAME TO {table}')
+    finally:
+        conn.execute('PRAGMA legacy_alter_table = OFF')
+    for sql in dependents:
+        conn.execute(sql)
+
+def _migration_15_pending_ids_never_reused(conn):
+    """AUTOINCREMENT pending IDs and a surrogate key for the archive
+
+    Databases created by older releases have pending_invoices.id without
+    AUTOINCREMENT, so IDs freed by compaction were handed out again and
+    archiving the new row replaced the old archived one. pending_invoices is
+    rebuilt with AUTOINCREMENT, its sequence starts past every archived ID,
+    and archive rows get their own archive_id key so nothing is overwritten.
+    """
+    table_sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'pending_invoices'"
+    ).fetchone()[0]
+    if 'AUTOINCREMENT' not in table_sql.upper():
+        log.info("Rebuilding pending_invoices with AUTOINCREMENT ids")
+        create_sql = re.sub(r'\bid\s+INTEGER\s+PRIMARY\s+KEY\b', 'id INTEGER PRIMARY KEY AUTOINCREMENT',
+                            table_sql, count=1, flags=re.IGNORECASE)
+        create_sql = re.sub(r'^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?["`\[]?pending_invoices["`\]]?',
+                            'CREATE TABLE pending_invoices_rebuild', create_sql, count=1, flags=re.IGNORECASE)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(pending_invoices)').fetchall()]
+        _rebuild_table(conn, 'pending_invoices', create_sql, columns)
+
+    archive_info = conn.execute('PRAGMA table_info(pending_invoices_archive)').fetchall()
+    if 'archive_id' not in [row[1] for row in archive_info]:
+        columns = [row[1] for row in archive_info]
+        definitions = ',\n                '.join(
+            'id INTEGER' if row[1] == 'id' else f'{row[1]} {row[2] or "TEXT"}' for row in archive_info
+        )
+        _rebuild_table(conn, 'pending_invoices_archive', f'''
+            CREATE TABLE pending_invoices_archive_rebuild (
+                archive_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                {definitions}
+            )
+        ''', columns)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_pending_archive_id ON pending_invoices_archive(id)')
+
+    highest = conn.execute('''
+        SELECT MAX(
+            COALESCE((SELECT MAX(id) FROM pending_invoices), 0),
+            COALESCE((SELECT MAX(id) FROM pending_invoices_archive), 0)
+        )
+    ''').fetchone()[0]
+    if conn.execute("SELECT 1 FROM sqlite_sequence WHERE name = 'pending_invoices'").fetchone():
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'pending_invoices'", (highest,))
+    else:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('pending_invoices', ?)", (highest,))
+
+def _migration_16_fts_triggers_without_udf(conn):
+    """FTS triggers that only use plain SQL
+
+    The migration 9 triggers decompressed the document text through the
+    decompress_text() Python function, so inserting or editing invoices
+    failed on connections without it (sqlite3 shell, backup tooling). The
+    triggers now index the plain columns and keep document_text as it is;
+    the Python write paths fill it in with index_invoice_texts.
+    """
+    conn.execute('DROP TRIGGER IF EXISTS invoices_fts_insert')
+    conn.execute('DROP TRIGGER IF EXISTS invoices_fts_update')
+    conn.execute('''
+        CREATE TRIGGER invoices_fts_insert AFTER INSERT ON invoices BEGIN
+            INSERT INTO invoice_fts (rowid, invoice_number, supplier_name, company_name, description, document_text)
+            VALUES (
+                new.id,
+                new.invoice_number,
+                (SELECT name FROM suppliers WHERE id = new.supplier_id),
+                (SELECT name FROM companies WHERE id = new.company_id),
+                new.description,
+                ''
+            );
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER invoices_fts_update
+        AFTER UPDATE OF invoice_number, supplier_id, company_id, description ON invoices BEGIN
+            UPDATE invoice_fts SET
+                invoice_number = new.invoice_number,
+                supplier_name = (SELECT name FROM suppliers WHERE id = new.supplier_id),
+                company_name = (SELECT name FROM companies WHERE id = new.company_id),
+                description = new.description
+            WHERE rowid = new.id;
+        END
+    ''')
+
+def _migration_17_archive_jobs(conn):
+    """Archive jobs recorded on the invoice row
+
+    archive_pending is set when a finalized invoice's file is queued for
+    the archive and cleared once invoices.file_path points at the archived
+    copy, so jobs a restart interrupted are picked up again.
+    """
+    _add_missing_columns(conn, 'invoices', [('archive_pending', 'INTEGER DEFAULT 0')])
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_invoices_archive_pending
+        ON invoices(id) WHERE archive_pending = 1
+    ''')
+
+def _create_pending_invoices_all_view(conn):
+    """(Re)create pending_invoices_all over the current pending and archive columns
+
+    A view's column list is fixed when it is created, so migrations that add
+    columns to pending_invoices and its archive call this again.
+    """
+    archive = {row[1] for row in conn.execute('PRAGMA table_info(pending_invoices_archive)').fetchall()}
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(pending_invoices)').fetchall() if row[1] in archive]
+    conn.execute('DROP VIEW IF EXISTS pending_invoices_all')
+    conn.execute(f'''
+        CREATE VIEW pending_invoices_all AS
+        SELECT {', '.join(f'p.{column}' for column in columns)},
+               b.raw_text_hash, b.ocr_text_hash, b.extracted_data,
+               NULL AS archived_at, 0 AS is_archived, NULL AS archive_id
+        FROM pending_invoices p
+        LEFT JOIN pending_invoice_blobs b ON b.pending_id = p.id
+        UNION ALL
+        SELECT {', '.join(columns)}, raw_text_hash, ocr_text_hash, extracted_data, archived_at,
+               1 AS is_archived, archive_id
+        FROM pending_invoices_archive
+    ''')
+
+def _migration_18_pending_invoices_all_columns(conn):
+    """pending_invoices_all with the columns added after migration 10
+
+    The view still had the migration 10 column list, so file_hash,
+    duplicate_score and duplicate_candidates (migration 12) were missing,
+    and archived rows could not be told apart by their archive_id
+    (migration 15).
+    """
+    _create_pending_invoices_all_view(conn)
+
+# Ordered list of (version, description, function). Each function receives an
+# open connection inside a transaction and must not commit.
+MIGRATIONS = [
+    (1, 'Index suite for invoice, pending and batch tables', _migration_1_index_suite),
+    (2, 'Normalised invoice number key', _migration_2_invoice_number_key),
+    (3, 'Typed amount, currency and ISO date columns', _migration_3_typed_amounts_and_dates),
+    (4, 'Source info and raw amount columns on invoices', _migration_4_invoice_source_columns),
+    (5, 'Full-text search index over invoices', _migration_5_invoice_fts),
+    (6, 'Trigger-maintained dashboard statistics', _migration_6_dashboard_stats),
+    (7, 'Sort indexes for paginated list endpoints', _migration_7_list_sort_indexes),
+    (8, 'Side table for pending invoice text and extraction blobs', _migration_8_pending_blobs),
+    (9, 'Compressed, content-addressed document text storage', _migration_9_compressed_document_texts),
+    (10, 'Archive table and audit view for compacted pending invoices', _migration_10_pending_archive),
+    (11, 'Batches table with trigger-maintained counters', _migration_11_batches),
+    (12, 'File hashes and composite index for near-duplicate detection', _migration_12_near_duplicates),
+    (13, 'Company to shard database routing table', _migration_13_company_shards),
+    (14, 'Catalog-wide invoice number registry for sharded duplicate checks', _migration_14_invoice_number_registry),
+    (15, 'Never reuse pending invoice IDs; surrogate key for archived rows', _migration_15_pending_ids_never_reused),
+    (16, 'FTS triggers without the decompress_text() function', _migration_16_fts_triggers_without_udf),
+    (17, 'Persistent archive jobs on invoices', _migration_17_archive_jobs),
+    (18, 'Current columns in the pending_invoices_all view', _migration_18_pending_invoices_all_columns),
+]
+
+def get_schema_version(conn):
+    """Return the schema version stored in PRAGMA user_version"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def run_migrations(db_path, target_version=None):
+    """Create or upgrade the schema to the latest (or target) version
+
+    A database at version 0 (new, or from a release before migrations)
+    first gets the baseline schema. Each migration then runs in its own
+    transaction together with the user_version bump, so a failed migration
+    leaves the database at the previous version. Once up to date this is a
+    single PRAGMA read.
+
+    Returns:
+        int: Schema version after running
+    """
+    conn = get_db_connection(db_path)
+    try:
+        current = get_schema_version(conn)
+        if current == 0:
+            log.info("Creating baseline schema")
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                _baseline_schema(conn)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                log.error(f"Baseline schema failed: {str(e)}", exc_info=True)
+                raise
+        for version, description, migrate in MIGRATIONS:
+            if version <= current or (target_version is not None and version > target_version):
+                continue
+            log.info(f"Applying migration {version}: {description}")
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                migrate(conn)
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                log.error(f"Migration {version} failed: {str(e)}", exc_info=True)
+                raise
+            current = version
+        return current
+    finally:
+        conn.close()
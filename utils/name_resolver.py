@@ -0,0 +1,112 @@
+import logging
+import threading
+from collections import OrderedDict
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Tables resolved by name; both have a UNIQUE name column
+NAME_TABLES = {'suppliers', 'companies'}
+
+# Default number of (database, table, name) entries kept in the cache
+NAME_CACHE_SIZE = 4096
+
+class NameResolver:
+    """Resolve supplier/company names to IDs through a bounded LRU cache
+
+    A miss costs one indexed SELECT, plus one
+    INSERT ... ON CONFLICT DO NOTHING RETURNING id when the name is new.
+    IDs are only cached when the connection has no open transaction, so an
+    ID that a later rollback would undo never enters the cache; rows created
+    inside a transaction are cached on their next lookup.
+    """
+
+    def __init__(self, maxsize=NAME_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def resolve(self, conn, table, name, create=True):
+        """Return the ID for name in table, creating the row if create is set
+
+        Returns:
+            int: Row ID, or None for an empty name (or an unknown one with create=False)
+        """
+        if table not in NAME_TABLES:
+            raise ValueError(f"Unsupported name table: {table}")
+        if not name:
+            return None
+
+        key = (getattr(conn, 'db_path', None), table, name)
+        with self._lock:
+            row_id = self._cache.get(key)
+            if row_id is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return row_id
+            self._misses += 1
+
+        row = conn.execute(f'SELECT id FROM {table} WHERE name = ?', (name,)).fetchone()
+        if row is None and create:
+            rows = conn.execute(
+                f'INSERT INTO {table} (name) VALUES (?) ON CONFLICT(name) DO NOTHING RETURNING id',
+                (name,)
+            ).fetchall()
+            if rows:
+                row = rows[0]
+                log.info(f"Created {table} entry: {name} (ID: {row[0]})")
+            else:
+                # Another connection inserted it between our SELECT and INSERT
+                row = conn.execute(f'SELECT id FROM {table} WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+
+        row_id = row[0]
+        if key[0] is not None and not conn.in_transaction:
+            self._remember(key, row_id)
+        return row_id
+
+    def invalidate(self, table=None, name=None):
+        """Drop cached entries (all, one table, or one name) after renames or deletes"""
+        with self._lock:
+            if table is None:
+                self._cache.clear()
+                return
+            for key in [key for key in self._cache if key[1] == table and (name is None or key[2] == name)]:
+                del self._cache[key]
+
+    def get_stats(self):
+        """Cache size and hit/miss counters"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'size': len(self._cache),
+                'maxsize': self.maxsize,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / total, 4) if total else 0.0
+            }
+
+    def _remember(self, key, row_id):
+        with self._lock:
+            self._cache[key] = row_id
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+# Process-wide resolver shared by the app, the scanner and the workers
+name_resolver = NameResolver()
+
+def get_or_create_supplier_id(conn, name):
+    """ID of the named supplier, created if needed"""
+    return name_resolver.resolve(conn, 'suppliers', name)
+
+def get_or_create_company_id(conn, name):
+    """ID of the named company, created if needed"""
+    return name_resolver.resolve(conn, 'companies', name)
+
+def get_supplier_id(conn, name):
+    """ID of the named supplier, or None if it does not exist"""
+    return name_resolver.resolve(conn, 'suppliers', name, create=False)
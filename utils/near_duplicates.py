@@ -0,0 +1,139 @@
+import json
+import logging
+from datetime import date, timedelta
+from difflib import SequenceMatcher
+
+from utils.name_resolver import get_supplier_id
+from utils.normalize import normalize_invoice_number, typed_invoice_values
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Invoice dates this many days apart still count as the same invoice (misread digits)
+DATE_WINDOW_DAYS = 3
+# Candidates scoring below this are not flagged
+MIN_SCORE = 0.6
+# Candidates stored per pending invoice
+MAX_CANDIDATES = 5
+
+def number_similarity(a, b):
+    """Similarity of two invoice numbers (0..1) after normalisation; None if either is missing"""
+    a, b = normalize_invoice_number(a), normalize_invoice_number(b)
+    if not a or not b:
+        return None
+    return SequenceMatcher(None, a, b).ratio()
+
+def _date_closeness(a, b, window_days):
+    """1.0 for the same day, falling linearly to 0 just past the window; None if unknown"""
+    try:
+        days = abs((date.fromisoformat(a) - date.fromisoformat(b)).days)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, 1 - days / (window_days + 1))
+
+def score_candidate(invoice_number, invoice_date_iso, candidate, window_days=DATE_WINDOW_DAYS):
+    """Similarity score of an invoice with the same supplier and amount
+
+    Supplier and amount already match, which alone scores 0.5; the date and
+    the invoice number add up to 0.25 each. Whatever cannot be compared
+    (missing date or number) counts as half similar.
+    """
+    closeness = _date_closeness(invoice_date_iso, candidate['invoice_date_iso'], window_days)
+    similarity = number_similarity(invoice_number, candidate['invoice_number'])
+    return round(
+        0.5
+        + 0.25 * (0.5 if closeness is None else closeness)
+        + 0.25 * (0.5 if similarity is None else similarity),
+        3
+    )
+
+def find_near_duplicates(conn, supplier_name, amount, invoice_date, invoice_number=None, file_hash=None,
+                         exclude_pending_id=None, window_days=DATE_WINDOW_DAYS, min_score=MIN_SCORE,
+                         limit=MAX_CANDIDATES):
+    """Invoices that are probably the same document under a misread invoice number
+
+    Two checks, both index seeks:
+    - identical file bytes (file_hash) among invoices and pending invoices, score 1.0
+    - the same supplier and amount with an invoice date within window_days,
+      a range scan on idx_invoices_near_duplicate (supplier_id, amount_cents,
+      invoice_date_iso), scored by score_candidate
+
+    Args:
+        conn: Open database connection
+        supplier_name: Supplier as extracted
+        amount: Total amount as extracted (parsed to cents)
+        invoice_date: Invoice date as extracted (parsed to ISO)
+        invoice_number: Invoice number as extracted
+        file_hash: SHA-256 of the PDF
+        exclude_pending_id: Pending invoice to ignore (the one being checked)
+
+    Returns:
+        list: Candidate dicts (kind, id, invoice_number, invoice_date, amount_cents,
+              score, reasons), best first
+    """
+    candidates = {}
+
+    if file_hash:
+        for row in conn.execute(
+            'SELECT id, invoice_number, invoice_date_iso, amount_cents FROM invoices WHERE file_hash = ? LIMIT ?',
+            (file_hash, limit)
+        ).fetchall():
+            candidates[('invoice', row['id'])] = dict(row, kind='invoice', score=1.0, reasons=['identical_file'])
+        for row in conn.execute(
+            'SELECT id, invoice_number, invoice_date AS invoice_date_iso, NULL AS amount_cents '
+            'FROM pending_invoices WHERE file_hash = ? AND id IS NOT ? AND is_finalized = 0 LIMIT ?',
+            (file_hash, exclude_pending_id, limit)
+        ).fetchall():
+            candidates[('pending', row['id'])] = dict(row, kind='pending', score=1.0, reasons=['identical_file'])
+
+    typed = typed_invoice_values(amount, None, invoice_date)
+    supplier_id = get_supplier_id(conn, supplier_name) if supplier_name else None
+    if supplier_id is not None and typed['amount_cents'] is not None:
+        query = '''
+            SELECT id, invoice_number, invoice_date_iso, amount_cents FROM invoices
+            WHERE supplier_id = ? AND amount_cents = ?
+        '''
+        params = [supplier_id, typed['amount_cents']]
+        if typed['invoice_date_iso']:
+            day = date.fromisoformat(typed['invoice_date_iso'])
+            query += ' AND invoice_date_iso BETWEEN ? AND ?'
+            params += [(day - timedelta(days=window_days)).isoformat(), (day + timedelta(days=window_days)).isoformat()]
+        for row in conn.execute(query + ' LIMIT ?', params + [limit * 4]).fetchall():
+            key = ('invoice', row['id'])
+            score = score_candidate(invoice_number, typed['invoice_date_iso'], row, window_days)
+            if key in candidates:
+                candidates[key]['reasons'].append('same_supplier_amount_date')
+            elif score >= min_score:
+                candidates[key] = dict(row, kind='invoice', score=score, reasons=['same_supplier_amount_date'])
+
+    ranked = sorted(candidates.values(), key=lambda candidate: (-candidate['score'], candidate['kind'], candidate['id']))
+    return [
+        {
+            'kind': candidate['kind'],
+            'id': candidate['id'],
+            'invoice_number': candidate['invoice_number'],
+            'invoice_date': candidate['invoice_date_iso'],
+            'amount_cents': candidate['amount_cents'],
+            'score': candidate['score'],
+            'reasons': candidate['reasons']
+        }
+        for candidate in ranked[:limit]
+    ]
+
+def near_duplicate_flags(conn, supplier_name, amount, invoice_date, invoice_number, file_hash):
+    """duplicate_score and duplicate_candidates values for a new pending invoice
+
+    Returns:
+        tuple: (best score or None, JSON list of candidates or None)
+    """
+    try:
+        candidates = find_near_duplicates(conn, supplier_name, amount, invoice_date, invoice_number, file_hash)
+    except Exception as e:
+        # Flagging is advisory; never lose an upload over it
+        log.warning(f"Near-duplicate check failed: {str(e)}")
+        return None, None
+    if not candidates:
+        return None, None
+    log.info(f"Invoice {invoice_number or '(no number)'} has {len(candidates)} near-duplicate candidates "
+             f"(best score {candidates[0]['score']})")
+    return candidates[0]['score'], json.dumps(candidates)
@@ -0,0 +1,160 @@
+import re
+import logging
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Values the model returns when it could not find an invoice number
+PLACEHOLDER_INVOICE_NUMBERS = {'', 'UNKNOWN', 'NOTFOUND', 'NICHTGEFUNDEN', 'NOTAVAILABLE', 'NA', 'NONE', 'NULL'}
+
+_NON_ALNUM = re.compile(r'[\W_]+', re.UNICODE)
+
+def normalize_invoice_number(invoice_number):
+    """Build the comparison key for an invoice number
+
+    Uppercases and strips separators, whitespace and punctuation, so
+    "re-2023/001" and "RE 2023 001" share the key "RE2023001".
+
+    Returns:
+        str: The key, or None for empty and placeholder values
+    """
+    if invoice_number is None:
+        return None
+    key = _NON_ALNUM.sub('', str(invoice_number)).upper()
+    if key in PLACEHOLDER_INVOICE_NUMBERS:
+        return None
+    return key
+
+# Currency symbols and the ISO 4217 codes they map to
+CURRENCY_SYMBOLS = {'€': 'EUR', '$': 'USD', '£': 'GBP', '¥': 'JPY', 'Fr.': 'CHF'}
+KNOWN_CURRENCIES = {'EUR', 'USD', 'GBP', 'CHF', 'JPY', 'PLN', 'CZK', 'DKK', 'SEK', 'NOK', 'HUF', 'MAD'}
+DEFAULT_CURRENCY = 'EUR'
+
+_CURRENCY_CODE = re.compile(r'\b([A-Z]{3})\b')
+_AMOUNT_CHARS = re.compile(r'[^\d.,\-]')
+
+# Largest magnitude an INTEGER column (and a bound SQLite parameter) holds
+MAX_CENTS = 2 ** 63 - 1
+
+def parse_amount_cents(amount):
+    """Parse an amount as written on an invoice into integer cents
+
+    Handles German ("1.234,56"), English ("1,234.56") and plain ("1234.5")
+    formats, currency symbols and codes. A single separator followed by
+    exactly three digits is read as a thousands separator ("1.234" = 1234.00).
+
+    Returns:
+        int: Amount in cents, or None if no number could be read or it is
+             too large to store (see amount_out_of_range)
+    """
+    cents = _amount_cents(amount)
+    if cents is not None and abs(cents) > MAX_CENTS:
+        log.warning(f"Amount out of range: {amount}")
+        return None
+    return cents
+
+def amount_out_of_range(amount):
+    """True if amount reads as a number too large for an INTEGER column"""
+    cents = _amount_cents(amount)
+    return cents is not None and abs(cents) > MAX_CENTS
+
+def _amount_cents(amount):
+    """parse_amount_cents without the range check"""
+    if amount is None or amount == '':
+        return None
+    if isinstance(amount, bool):
+        return None
+    if isinstance(amount, (int, float)):
+        try:
+            return int(Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100)
+        except (InvalidOperation, ValueError):
+            return None  # inf and nan
+
+    text = str(amount).strip()
+    negative = text.startswith('-') or (text.startswith('(') and text.endswith(')'))
+    text = _AMOUNT_CHARS.sub('', text).strip('-')
+    if not any(ch.isdigit() for ch in text):
+        return None
+
+    last_dot = text.rfind('.')
+    last_comma = text.rfind(',')
+    if last_dot >= 0 and last_comma >= 0:
+        # Both present: whichever comes last is the decimal separator
+        decimal_sep = '.' if last_dot > last_comma else ','
+    elif last_dot >= 0 or last_comma >= 0:
+        sep = '.' if last_dot >= 0 else ','
+        digits_after = len(text) - text.rfind(sep) - 1
+        if text.count(sep) > 1 or digits_after == 3:
+            decimal_sep = None  # thousands separators only
+        else:
+            decimal_sep = sep
+    else:
+        decimal_sep = None
+
+    if decimal_sep:
+        whole, _, fraction = text.rpartition(decimal_sep)
+        whole = re.sub(r'[.,]', '', whole)
+        number = f"{whole or '0'}.{fraction}"
+    else:
+        number = re.sub(r'[.,]', '', text)
+
+    try:
+        cents = int((Decimal(number) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        log.warning(f"Could not parse amount: {amount}")
+        return None
+    return -cents if negative else cents
+
+def detect_currency(*values, default=DEFAULT_CURRENCY):
+    """Return the ISO currency code mentioned in any of the values"""
+    for value in values:
+        if not value or not isinstance(value, str):
+            continue
+        upper = value.upper()
+        for code in _CURRENCY_CODE.findall(upper):
+            if code in KNOWN_CURRENCIES:
+                return code
+        for symbol, code in CURRENCY_SYMBOLS.items():
+            if symbol in value:
+                return code
+    return default
+
+def normalize_date_iso(date_value):
+    """Normalise an invoice date to YYYY-MM-DD (day-first for ambiguous dates)
+
+    Returns:
+        str: ISO date, or None if the value is empty or cannot be parsed
+    """
+    if not date_value:
+        return None
+    if isinstance(date_value, (datetime, date)):
+        return date_value.strftime('%Y-%m-%d')
+
+    text = str(date_value).strip()
+    for fmt in ('%Y-%m-%d', '%d.%m.%Y', '%d.%m.%y', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d'):
+        try:
+            return datetime.strptime(text, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    try:
+        from dateutil import parser as date_parser
+        return date_parser.parse(text, dayfirst=True).strftime('%Y-%m-%d')
+    except (ValueError, OverflowError, ImportError):
+        return None
+
+def typed_invoice_values(amount, vat_amount, invoice_date):
+    """Typed column values for an invoice row (shared by all write paths)
+
+    Returns:
+        dict: amount_cents, vat_cents, currency and invoice_date_iso
+    """
+    amount_cents = parse_amount_cents(amount)
+    vat_cents = parse_amount_cents(vat_amount)
+    return {
+        'amount_cents': amount_cents,
+        'vat_cents': vat_cents,
+        'currency': detect_currency(amount, vat_amount) if amount_cents is not None or vat_cents is not None else None,
+        'invoice_date_iso': normalize_date_iso(invoice_date)
+    }
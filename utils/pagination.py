@@ -0,0 +1,191 @@
+import json
+import base64
+import logging
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+class PaginationError(ValueError):
+    """Invalid limit, sort, order, fields or cursor parameter"""
+
+def encode_cursor(sort, order, value, row_id):
+    """Opaque cursor for the row after which the next page starts"""
+    payload = json.dumps([sort, order, value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; returns (sort, order, value, row_id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort, order, value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return sort, order, value, int(row_id)
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise PaginationError(f"Invalid cursor: {str(e)}")
+
+class ListQuery:
+    """Keyset-paginated, sortable list over one FROM clause
+
+    Pages are ordered by (sort key, id) and continue from the last row of the
+    previous page, so the cost of a page does not grow with its position.
+    Sort expressions must never be NULL (wrap them in COALESCE) and should be
+    backed by an index on (expression) so SQLite can walk the index directly.
+
+    Args:
+        from_clause: FROM ... (joins included)
+        columns: dict of field name -> SQL expression, in default output order
+        sort_keys: dict of sort name -> non-NULL SQL expression
+        default_sort: Sort name used when the request gives none
+        id_column: Unique tie-breaker expression (the table's id)
+        default_fields: Fields returned when the request gives no fields=
+    """
+
+    def __init__(self, from_clause, columns, sort_keys, default_sort, id_column, default_fields=None):
+        self.from_clause = from_clause
+        self.columns = columns
+        self.sort_keys = sort_keys
+        self.default_sort = default_sort
+        self.id_column = id_column
+        self.default_fields = default_fields or list(columns)
+
+    def _parse(self, args):
+        """Validate the paging parameters from the request"""
+        try:
+            limit = int(args.get('limit') or DEFAULT_PAGE_SIZE)
+        except ValueError:
+            raise PaginationError('limit must be an integer')
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        sort = args.get('sort') or self.default_sort
+        order = (args.get('order') or 'desc').lower()
+        if sort.startswith('-'):
+            sort, order = sort[1:], 'desc'
+        if sort not in self.sort_keys:
+            raise PaginationError(f"Cannot sort by '{sort}' (allowed: {', '.join(self.sort_keys)})")
+        if order not in ('asc', 'desc'):
+            raise PaginationError("order must be 'asc' or 'desc'")
+
+        fields = self.default_fields
+        if args.get('fields'):
+            fields = [field.strip() for field in args.get('fields').split(',') if field.strip()]
+            unknown = [field for field in fields if field not in self.columns]
+            if unknown:
+                raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+            if 'id' in self.columns and 'id' not in fields:
+                fields.insert(0, 'id')
+
+        after = None
+        if args.get('cursor'):
+            cursor_sort, cursor_order, value, row_id = decode_cursor(args.get('cursor'))
+            if (cursor_sort, cursor_order) != (sort, order):
+                raise PaginationError('Cursor belongs to a different sort order')
+            after = (value, row_id)
+
+        return limit, sort, order, fields, after
+
+    def _select(self, conn, limit, sort, order, fields, after, conditions, filter_params):
+        """Up to limit + 1 rows after the cursor, with _sort_value and _row_id"""
+        sort_expr = self.sort_keys[sort]
+        direction = 'DESC' if order == 'desc' else 'ASC'
+
+        page_conditions = list(conditions)
+        page_params = list(filter_params)
+        if after is not None:
+            # Row-value comparison lets SQLite seek the (sort key, id) index
+            page_conditions.append(f"({sort_expr}, {self.id_column}) {'<' if order == 'desc' else '>'} (?, ?)")
+            page_params.extend(after)
+
+        select_list = ', '.join(f'{self.columns[field]} AS {field}' for field in fields)
+        return conn.execute(f'''
+            SELECT {select_list}, {sort_expr} AS _sort_value, {self.id_column} AS _row_id
+            {self.from_clause}
+            WHERE {' AND '.join(page_conditions)}
+            ORDER BY {sort_expr} {direction}, {self.id_column} {direction}
+            LIMIT ?
+        ''', page_params + [limit + 1]).fetchall()
+
+    def _count(self, conn, conditions, filter_params):
+        return conn.execute(f'''
+            SELECT COUNT(*) {self.from_clause} WHERE {' AND '.join(conditions)}
+        ''', filter_params).fetchone()[0]
+
+    def _result(self, rows, limit, sort, order, fields):
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            'items': [{field: row[field] for field in fields} for row in rows],
+            'next_cursor': encode_cursor(sort, order, rows[-1]['_sort_value'], rows[-1]['_row_id']) if has_more else None,
+            'has_more': has_more
+        }
+
+    def page(self, conn, args, where=None, params=None):
+        """Fetch one page
+
+        Args:
+            conn: Open database connection
+            args: Request arguments (limit, cursor, sort, order, fields, count)
+            where: List of SQL filter conditions (ANDed)
+            params: Parameters for the filter conditions
+
+        Returns:
+            dict: items, next_cursor (None on the last page), has_more, and
+                  total when count=true was requested
+        """
+        limit, sort, order, fields, after = self._parse(args)
+        conditions = list(where or []) or ['1=1']
+        filter_params = list(params or [])
+
+        rows = self._select(conn, limit, sort, order, fields, after, conditions, filter_params)
+        result = self._result(rows, limit, sort, order, fields)
+        if str(args.get('count', '')).lower() in ('1', 'true', 'yes'):
+            result['total'] = self._count(conn, conditions, filter_params)
+        return result
+
+    def page_merged(self, connect, sources, args, where=None, params=None, map_func=map):
+        """Fetch one page across several databases with the same schema (see utils.sharding)
+
+        Each database returns its first limit + 1 rows after the cursor and
+        the rows are merged by (sort key, id). IDs must be unique across the
+        databases; cursors then work exactly as for a single database.
+
+        Args:
+            connect: Function returning an open connection for a source
+            sources: Databases to read (e.g. paths)
+            map_func: map-like function used to query the sources (e.g. a thread pool's map)
+        """
+        limit, sort, order, fields, after = self._parse(args)
+        conditions = list(where or []) or ['1=1']
+        filter_params = list(params or [])
+        count = str(args.get('count', '')).lower() in ('1', 'true', 'yes')
+
+        def fetch(source):
+            conn = connect(source)
+            try:
+                rows = [dict(row) for row in self._select(conn, limit, sort, order, fields, after,
+                                                          conditions, filter_params)]
+                return rows, self._count(conn, conditions, filter_params) if count else None
+            finally:
+                conn.close()
+
+        fetched = list(map_func(fetch, sources))
+        rows = sorted(
+            (row for source_rows, _ in fetched for row in source_rows),
+            key=lambda row: (_sql_sort_key(row['_sort_value']), row['_row_id']),
+            reverse=order == 'desc'
+        )
+        result = self._result(rows[:limit + 1], limit, sort, order, fields)
+        if count:
+            result['total'] = sum(total for _, total in fetched)
+        return result
+
+def _sql_sort_key(value):
+    """Python sort key matching SQLite's ordering of mixed types (NULL < numbers < text < blobs)"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, bytes(value))
@@ -10,6 +10,11 @@ import traceback
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from parser import validate_invoice_data, normalize_amount
+from utils.scheduler import extraction_scheduler, priority_for_source
+from utils.singleflight import extraction_flight
+from utils.file_utils import compute_file_hash
+from utils.retry_queue import is_transient_failure, is_permanent_failure, schedule_retry, add_dead_letter
+from utils.database import PendingRef
 
 # Setup logging
 log = logging.getLogger(__name__)
@@ -42,9 +47,366 @@ def create_preview(file_path, preview_dir):
         log.error(f"Error creating preview: {str(e)}", exc_info=True)
         return None
 
+def _extract_invoice_data(file_path, filename, selected_model, app_config, InvoiceScannerClass):
+    """Extract text and invoice fields from a saved file
+    
+    Returns:
+        tuple: (extracted_data, extraction_successful, raw_text, ocr_text)
+    """
+    scanner = None
+    extracted_data = {}
+    extraction_successful = False
+    raw_text = ""
+    ocr_text = ""
+    
+    try:
+        scanner = InvoiceScannerClass(
+            app_config['DATABASE'],
+            app_config['ARCHIVE_DIR']
+        )
+        
+        # Extract text from file
+        raw_text, ocr_text = scanner.extract_text_from_pdf(file_path)
+        extraction_error = getattr(scanner, 'last_extraction_error', None)
+        
+        if not raw_text and extraction_error:
+            log.error(f"Text extraction failed for {filename}: {extraction_error}")
+            extracted_data = {
+                'success': False,
+                'error': extraction_error,
+                'error_type': 'ocr_error',
+                'needs_manual_input': True
+            }
+        elif raw_text == "SKIP_PROCESSING":
+            log.warning(f"File {filename} doesn't appear to be an invoice - skipping AI processing")
+            extracted_data = {
+                'invoice_number': os.path.splitext(filename)[0],
+                'invoice_date': datetime.now().strftime('%Y-%m-%d'),
+                'amount': '',
+                'vat_amount': '',
+                'supplier_name': 'Unknown Supplier',
+                'company_name': '',
+                'description': f'This file does not appear to be an invoice',
+                'success': False,
+                'error': 'File does not appear to be an invoice',
+                'needs_manual_input': True
+            }
+        else:
+            # Process with AI model
+            model_result = scanner.process_with_model(raw_text, selected_model)
+            
+            if isinstance(model_result, dict) and model_result.get('success') is False:
+                # Keep the failure (and its error_type) instead of validating placeholder values
+                log.warning(f"Model extraction failed for {filename}: {model_result.get('error')}")
+                extracted_data = model_result
+            elif isinstance(model_result, dict):
+                # Validate and normalize the data
+                validated_data = validate_invoice_data(model_result)
+                
+                if validated_data.get('validation_success', False):
+                    log.info(f"Successfully validated invoice data for {filename}")
+                    extracted_data = validated_data
+                    extraction_successful = True
+                else:
+                    log.warning(f"Validation failed for {filename}, using raw model output")
+                    extracted_data = model_result
+                    extraction_successful = model_result.get('success', False)
+            else:
+                log.error(f"Unexpected model result type: {type(model_result)}")
+                extracted_data = {
+                    'success': False,
+                    'error': 'Unexpected model result format',
+                    'needs_manual_input': True
+                }
+    except Exception as ai_error:
+        log.error(f"AI processing error for {filename}: {str(ai_error)}", exc_info=True)
+        extracted_data = {
+            'invoice_number': os.path.splitext(filename)[0],
+            'invoice_date': datetime.now().strftime('%Y-%m-%d'),
+            'amount': '',
+            'vat_amount': '',
+            'supplier_name': 'Unknown Supplier',
+            'company_name': '',
+            'description': f'Error during AI processing: {str(ai_error)}',
+            'success': False,
+            'error': str(ai_error),
+            'error_type': 'processing_error',
+            'needs_manual_input': True
+        }
+    finally:
+        if scanner:
+            try:
+                scanner.close()
+            except:
+                pass
+        
+    return extracted_data, extraction_successful, raw_text, ocr_text
+
+def _check_and_extract(file_path, filename, app_config, check_invoice_exists_func, select_ai_model_func,
+                       InvoiceScannerClass, priority):
+    """Duplicate check, model selection and extraction for one file's content
+    
+    Returns the extraction for _extract_and_save, which also creates the
+    preview and the retry queue entry or pending row.
+    
+    Returns:
+        dict: 'duplicate' (the duplicate check result) for known invoices, otherwise
+              selected_model, extracted_data, extraction_successful, raw_text and ocr_text
+    """
+    # Check for duplicate invoices before further processing
+    try:
+        duplicate_check = extraction_scheduler.run(priority, check_invoice_exists_func, file_path)
+        if duplicate_check.get('is_duplicate', False):
+            log.warning(f"Duplicate invoice detected: {filename} - {duplicate_check.get('invoice_number', 'unknown')}")
+            return {'duplicate': duplicate_check}
+    except Exception as duplicate_error:
+        log.error(f"Error checking for duplicates: {str(duplicate_error)}", exc_info=True)
+        # We'll continue processing even if duplicate check fails
+        
+    log.info(f"Processing {filename} with AI extraction")
+    
+    # Select appropriate AI model based on file size
+    try:
+        file_size = os.path.getsize(file_path)
+        selected_model = select_ai_model_func(file_path, file_size)
+        log.info(f"Selected AI model for {filename}: {selected_model}")
+    except Exception as model_error:
+        log.error(f"Error selecting AI model: {str(model_error)}", exc_info=True)
+        selected_model = "llama3:latest"  # Default model as fallback
+        log.info(f"Using fallback model: {selected_model}")
+    
+    # Run the OCR/LLM extraction through the priority scheduler
+    extracted_data, extraction_successful, raw_text, ocr_text = extraction_scheduler.run(
+        priority, _extract_invoice_data, file_path, filename, selected_model,
+        app_config, InvoiceScannerClass
+    )
+    return {
+        'selected_model': selected_model,
+        'extracted_data': extracted_data,
+        'extraction_successful': extraction_successful,
+        'raw_text': raw_text,
+        'ocr_text': ocr_text
+    }
+
+def _process_saved_file(file_path, filename, original_filename, app_config, check_invoice_exists_func,
+                        select_ai_model_func, save_to_pending_func, InvoiceScannerClass,
+                        batch_id, source, current_user, priority, extra_source_info=None, retry_id=None,
+                        content_hash=None):
+    """Check for duplicates, extract and save an already stored upload to the pending table
+    
+    Identical bytes uploaded concurrently (same content_hash) are processed
+    once through extraction_flight: the first upload creates the pending
+    row and the others get its result back (see _follower_result).
+    
+    Returns:
+        dict: Result of processing with success status
+    """
+    args = (file_path, filename, original_filename, app_config, check_invoice_exists_func,
+            select_ai_model_func, save_to_pending_func, InvoiceScannerClass,
+            batch_id, source, current_user, priority, extra_source_info, retry_id, content_hash)
+    if content_hash is None:
+        return _extract_and_save(*args)
+    result, shared = extraction_flight.do(content_hash, _extract_and_save, *args)
+    if not shared:
+        return result
+    log.info(f"{original_filename} joined in-flight processing of identical content")
+    return _follower_result(result, file_path, original_filename, batch_id)
+
+def _follower_result(leader_result, file_path, original_filename, batch_id):
+    """Result for an upload that joined the in-flight processing of identical bytes
+    
+    A saved leader's pending row is shared: the follower's own copy of the
+    file is removed and it gets the leader's pending_id, so a caller in
+    another batch only links that row into its batch_queue. In the leader's
+    own batch the follower is reported as a duplicate instead.
+    """
+    result = {**leader_result, 'filename': original_filename, 'shared_result': True}
+    if not leader_result.get('success'):
+        return result
+    
+    if isinstance(result['pending_id'], PendingRef):
+        result['pending_id'] = result['pending_id'].get()
+        result['extracted_data'] = {**result['extracted_data'], 'pending_id': result['pending_id']}
+    if file_path != leader_result['file_path']:
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            log.warning(f"Could not remove duplicate upload {file_path}: {str(e)}")
+            
+    if batch_id is not None and batch_id == leader_result.get('batch_id'):
+        return {
+            'success': False,
+            'is_duplicate': True,
+            'error': 'Identical file is already in this batch',
+            'pending_id': result['pending_id'],
+            'filename': original_filename,
+            'file_path': leader_result['file_path'],
+            'shared_result': True
+        }
+    return result
+
+def _extract_and_save(file_path, filename, original_filename, app_config, check_invoice_exists_func,
+                      select_ai_model_func, save_to_pending_func, InvoiceScannerClass,
+                      batch_id, source, current_user, priority, extra_source_info, retry_id, content_hash):
+    """Duplicate check, extraction, preview and retry queue entry or pending row for one file"""
+    extraction = _check_and_extract(file_path, filename, app_config, check_invoice_exists_func,
+                                    select_ai_model_func, InvoiceScannerClass, priority)
+    
+    duplicate_check = extraction.get('duplicate')
+    if duplicate_check:
+        return {
+            'success': False,
+            'is_duplicate': True,
+            'error': duplicate_check.get('error', 'Duplicate invoice detected'),
+            'invoice_number': duplicate_check.get('invoice_number'),
+            'filename': original_filename,
+            'file_path': file_path
+        }
+    selected_model = extraction['selected_model']
+    extracted_data = extraction['extracted_data']
+    extraction_successful = extraction['extraction_successful']
+    raw_text, ocr_text = extraction['raw_text'], extraction['ocr_text']
+    
+    # Create preview file
+    preview_path = create_preview(file_path, app_config['PREVIEW_FOLDER'])
+    if not preview_path:
+        log.warning(f"Could not create preview for {filename}, using original file path")
+        preview_path = file_path  # Fallback to original file path
+    
+    # Send failed extractions to the retry queue instead of asking a human for data entry
+    max_attempts = app_config.get('RETRY_MAX_ATTEMPTS', 0)
+    if not extraction_successful and max_attempts and is_transient_failure(extracted_data):
+        retry = schedule_retry(
+            app_config['DATABASE'], file_path, original_filename, source,
+            extracted_data.get('error'), extracted_data.get('error_type'),
+            batch_id=batch_id, source_info=extra_source_info, retry_id=retry_id,
+            max_attempts=max_attempts,
+            base_delay=app_config.get('RETRY_BASE_DELAY', 30),
+            max_delay=app_config.get('RETRY_MAX_DELAY', 1800)
+        )
+        return {
+            **retry,
+            'success': False,
+            'status': 'queued_for_retry' if retry['status'] == 'queued' else retry['status'],
+            'error': extracted_data.get('error'),
+            'error_type': extracted_data.get('error_type'),
+            'filename': original_filename,
+            'file_path': file_path,
+            'preview_path': preview_path
+        }
+    if not extraction_successful and max_attempts and is_permanent_failure(extracted_data):
+        dead_letter = add_dead_letter(
+            app_config['DATABASE'], file_path, original_filename, source,
+            extracted_data.get('error'), extracted_data.get('error_type'),
+            batch_id=batch_id, source_info=extra_source_info, retry_id=retry_id
+        )
+        return {
+            'success': False,
+            'error': extracted_data.get('error'),
+            'error_type': extracted_data.get('error_type'),
+            'filename': original_filename,
+            'file_path': file_path,
+            'preview_path': preview_path,
+            **dead_letter
+        }
+        
+    # Create normalized form data for frontend display and database storage
+    form_data = {
+        'file_path': file_path,
+        'preview_path': preview_path,
+        'supplier_name': extracted_data.get('supplier_name', '') or extracted_data.get('Lieferantename', ''),
+        'company_name': extracted_data.get('company_name', '') or extracted_data.get('Empfängerfirma', ''),
+        'invoice_number': extracted_data.get('invoice_number', '') or extracted_data.get('Rechnungsnummer', ''),
+        'invoice_date': extracted_data.get('invoice_date', '') or extracted_data.get('Rechnungsdatum', ''),
+        'amount_original': extracted_data.get('amount', '') or extracted_data.get('Gesamtbetrag', ''),
+        'vat_amount_original': extracted_data.get('vat_amount', '') or extracted_data.get('Mehrwertsteuerbetrag', ''),
+        'description': extracted_data.get('description', '') or extracted_data.get('Leistungsbeschreibung', ''),
+        'Lieferantename': extracted_data.get('Lieferantename', '') or extracted_data.get('supplier_name', ''),
+        'Empfängerfirma': extracted_data.get('Empfängerfirma', '') or extracted_data.get('company_name', ''),
+        'Rechnungsnummer': extracted_data.get('Rechnungsnummer', '') or extracted_data.get('invoice_number', ''),
+        'Rechnungsdatum': extracted_data.get('Rechnungsdatum', '') or extracted_data.get('invoice_date', ''),
+        'Gesamtbetrag': extracted_data.get('Gesamtbetrag', '') or extracted_data.get('amount', ''),
+        'Mehrwertsteuerbetrag': extracted_data.get('Mehrwertsteuerbetrag', '') or extracted_data.get('vat_amount', ''),
+        'Leistungsbeschreibung': extracted_data.get('Leistungsbeschreibung', '') or extracted_data.get('description', '')
+    }
+        
+    # Additional fields from enhanced extraction
+    if extracted_data.get('due_date'):
+        form_data['due_date'] = extracted_data['due_date']
+        
+    if extracted_data.get('currency'):
+        form_data['currency'] = extracted_data['currency']
+        
+    # Source info for database
+    source_info = {
+        'source': source,
+        'batch_id': batch_id,
+        'processed_at': datetime.now().isoformat(),
+        'filename': original_filename,
+        'model_used': selected_model,
+        'success': extraction_successful
+    }
+    
+    # Add caller-provided details (e.g. the email an attachment came from)
+    if extra_source_info:
+        source_info.update({k: v for k, v in extra_source_info.items() if k not in source_info})
+        
+    # Add user info if available
+    if current_user:
+        source_info['user'] = current_user
+        
+    # Create database record
+    pending_invoice_data = {
+        **form_data,  # Include all normalized form data
+        'original_path': file_path,
+        'needs_manual_input': not extraction_successful,
+        'extracted_data': json.dumps(extracted_data),
+        'raw_text': raw_text if isinstance(raw_text, str) else '',  # Stored compressed in full
+        'ocr_text': ocr_text if isinstance(ocr_text, str) else '',
+        'source': source,
+        'source_info': json.dumps(source_info),
+        'batch_id': batch_id,
+        'validation_status': 'pending_validation',
+        'file_hash': content_hash  # Checked against earlier uploads for near-duplicates
+    }
+    
+    # Try to save to database
+    try:
+        pending_id = save_to_pending_func(pending_invoice_data, batch_id, source_info)
+        form_data['pending_id'] = pending_id
+        
+        log.info(f"Invoice data saved to pending_invoices with ID {pending_id}")
+        
+        # Return data for the frontend
+        result = {
+            'success': True,
+            'filename': filename,
+            'file_path': file_path,
+            'preview_path': preview_path,
+            'pending_id': pending_id,
+            'batch_id': batch_id,
+            'extracted_data': form_data,
+            'needs_validation': True,
+            'status': 'processed'
+        }
+        return result
+        
+    except Exception as db_error:
+        log.error(f"Database error saving invoice {filename}: {str(db_error)}", exc_info=True)
+        return {
+            'success': False,
+            'filename': original_filename,
+            'error': f"Database error: {str(db_error)}",
+            'file_path': file_path,
+            'preview_path': preview_path,
+            'extracted_data': form_data,
+            'status': 'error'
+        }
+
 def process_invoice_file(file_storage, app_config, db_conn_func, check_invoice_exists_func, 
                          select_ai_model_func, save_to_pending_func, InvoiceScannerClass,
-                         batch_id=None, source='upload', current_user=None):
+                         batch_id=None, source='upload', current_user=None, priority=None,
+                         source_info=None, retry_id=None):
     """Process an uploaded invoice file with consistent AI model usage
     
     This function handles both batch and single uploads consistently:
@@ -61,15 +423,22 @@ def process_invoice_file(file_storage, app_config, db_conn_func, check_invoice_e
         db_conn_func: Function to get database connection
         check_invoice_exists_func: Function to check if invoice exists
         select_ai_model_func: Function to select AI model
-        save_to_pending_func: Function to save to pending table
+        save_to_pending_func: Function to save to pending table (e.g. PendingWriteBuffer.save,
+            in which case pending_id in the result is a PendingRef until the buffer is flushed)
         InvoiceScannerClass: The InvoiceScanner class
         batch_id: Batch ID if part of batch upload
         source: Source of upload (single_upload, batch_upload, etc.)
         current_user: Current user info if available
+        priority: Scheduling priority for the extraction work (derived from source if not given)
+        source_info: Extra details to store with the source info (e.g. sender email)
+        retry_id: Retry queue ID when re-running a previously failed extraction
         
     Returns:
         dict: Result of processing with success status
     """
+    if priority is None:
+        priority = priority_for_source(source)
+        
     try:
         # Ensure upload folder exists
         os.makedirs(app_config['UPLOAD_FOLDER'], exist_ok=True)
@@ -100,200 +469,18 @@ def process_invoice_file(file_storage, app_config, db_conn_func, check_invoice_e
                 'filename': original_filename
             }
             
-        # Check for duplicate invoices before further processing
-        try:
-            duplicate_check = check_invoice_exists_func(file_path)
-            if duplicate_check.get('is_duplicate', False):
-                log.warning(f"Duplicate invoice detected: {filename} - {duplicate_check.get('invoice_number', 'unknown')}")
-                return {
-                    'success': False,
-                    'is_duplicate': True,
-                    'error': duplicate_check.get('error', 'Duplicate invoice detected'),
-                    'invoice_number': duplicate_check.get('invoice_number'),
-                    'filename': original_filename,
-                    'file_path': file_path
-                }
-        except Exception as duplicate_error:
-            log.error(f"Error checking for duplicates: {str(duplicate_error)}", exc_info=True)
-            # We'll continue processing even if duplicate check fails
-            
-        # Create preview file
-        preview_path = create_preview(file_path, app_config['PREVIEW_FOLDER'])
-        if not preview_path:
-            log.warning(f"Could not create preview for {filename}, using original file path")
-            preview_path = file_path  # Fallback to original file path
-            
-        log.info(f"Processing {filename} with AI extraction")
-        
-        # Select appropriate AI model based on file size
-        try:
-            file_size = os.path.getsize(file_path)
-            selected_model = select_ai_model_func(file_path, file_size)
-            log.info(f"Selected AI model for {filename}: {selected_model}")
-        except Exception as model_error:
-            log.error(f"Error selecting AI model: {str(model_error)}", exc_info=True)
-            selected_model = "llama3:latest"  # Default model as fallback
-            log.info(f"Using fallback model: {selected_model}")
-        
-        # Initialize InvoiceScanner
-        scanner = None
-        extracted_data = {}
-        extraction_successful = False
-        raw_text = ""
-        ocr_text = ""
-        
-        try:
-            scanner = InvoiceScannerClass(
-                app_config['DATABASE'],
-                app_config['ARCHIVE_DIR']
-            )
-            
-            # Extract text from file
-            raw_text, ocr_text = scanner.extract_text_from_pdf(file_path)
-            
-            if raw_text == "SKIP_PROCESSING":
-                log.warning(f"File {filename} doesn't appear to be an invoice - skipping AI processing")
-                extracted_data = {
-                    'invoice_number': os.path.splitext(filename)[0],
-                    'invoice_date': datetime.now().strftime('%Y-%m-%d'),
-                    'amount': '',
-                    'vat_amount': '',
-                    'supplier_name': 'Unknown Supplier',
-                    'company_name': '',
-                    'description': f'This file does not appear to be an invoice',
-                    'success': False,
-                    'error': 'File does not appear to be an invoice',
-                    'needs_manual_input': True
-                }
-            else:
-                # Process with AI model
-                model_result = scanner.process_with_model(raw_text, selected_model)
-                
-                if isinstance(model_result, dict):
-                    # Validate and normalize the data
-                    validated_data = validate_invoice_data(model_result)
-                    
-                    if validated_data.get('validation_success', False):
-                        log.info(f"Successfully validated invoice data for {filename}")
-                        extracted_data = validated_data
-                        extraction_successful = True
-                    else:
-                        log.warning(f"Validation failed for {filename}, using raw model output")
-                        extracted_data = model_result
-                        extraction_successful = model_result.get('success', False)
-                else:
-                    log.error(f"Unexpected model result type: {type(model_result)}")
-                    extracted_data = {
-                        'success': False,
-                        'error': 'Unexpected model result format',
-                        'needs_manual_input': True
-                    }
-        except Exception as ai_error:
-            log.error(f"AI processing error for {filename}: {str(ai_error)}", exc_info=True)
-            extracted_data = {
-                'invoice_number': os.path.splitext(filename)[0],
-                'invoice_date': datetime.now().strftime('%Y-%m-%d'),
-                'amount': '',
-                'vat_amount': '',
-                'supplier_name': 'Unknown Supplier',
-                'company_name': '',
-                'description': f'Error during AI processing: {str(ai_error)}',
-                'success': False,
-                'error': str(ai_error),
-                'needs_manual_input': True
-            }
-        finally:
-            if scanner:
-                try:
-                    scanner.close()
-                except:
-                    pass
-            
-        # Create normalized form data for frontend display and database storage
-        form_data = {
-            'file_path': file_path,
-            'preview_path': preview_path,
-            'supplier_name': extracted_data.get('supplier_name', '') or extracted_data.get('Lieferantename', ''),
-            'company_name': extracted_data.get('company_name', '') or extracted_data.get('Empfängerfirma', ''),
-            'invoice_number': extracted_data.get('invoice_number', '') or extracted_data.get('Rechnungsnummer', ''),
-            'invoice_date': extracted_data.get('invoice_date', '') or extracted_data.get('Rechnungsdatum', ''),
-            'amount_original': extracted_data.get('amount', '') or extracted_data.get('Gesamtbetrag', ''),
-            'vat_amount_original': extracted_data.get('vat_amount', '') or extracted_data.get('Mehrwertsteuerbetrag', ''),
-            'description': extracted_data.get('description', '') or extracted_data.get('Leistungsbeschreibung', ''),
-            'Lieferantename': extracted_data.get('Lieferantename', '') or extracted_data.get('supplier_name', ''),
-            'Empfängerfirma': extracted_data.get('Empfängerfirma', '') or extracted_data.get('company_name', ''),
-            'Rechnungsnummer': extracted_data.get('Rechnungsnummer', '') or extracted_data.get('invoice_number', ''),
-            'Rechnungsdatum': extracted_data.get('Rechnungsdatum', '') or extracted_data.get('invoice_date', ''),
-            'Gesamtbetrag': extracted_data.get('Gesamtbetrag', '') or extracted_data.get('amount', ''),
-            'Mehrwertsteuerbetrag': extracted_data.get('Mehrwertsteuerbetrag', '') or extracted_data.get('vat_amount', ''),
-            'Leistungsbeschreibung': extracted_data.get('Leistungsbeschreibung', '') or extracted_data.get('description', '')
-        }
-            
-        # Additional fields from enhanced extraction
-        if extracted_data.get('due_date'):
-            form_data['due_date'] = extracted_data['due_date']
-            
-        if extracted_data.get('currency'):
-            form_data['currency'] = extracted_data['currency']
-            
-        # Source info for database
-        source_info = {
-            'source': source,
-            'batch_id': batch_id,
-            'processed_at': datetime.now().isoformat(),
-            'filename': original_filename,
-            'model_used': selected_model,
-            'success': extraction_successful
-        }
-        
-        # Add user info if available
-        if current_user:
-            source_info['user'] = current_user
-            
-        # Create database record
-        pending_invoice_data = {
-            **form_data,  # Include all normalized form data
-            'original_path': file_path,
-            'needs_manual_input': not extraction_successful,
-            'extracted_data': json.dumps(extracted_data),
-            'raw_text': raw_text[:10000] if isinstance(raw_text, str) else '',  # Limit text size
-            'ocr_text': ocr_text[:10000] if isinstance(ocr_text, str) else '',  # Limit OCR text size
-            'source': source,
-            'source_info': json.dumps(source_info),
-            'batch_id': batch_id,
-            'validation_status': 'pending_validation'
-        }
-        
-        # Try to save to database
+        # Identical bytes uploaded concurrently share one extraction
         try:
-            pending_id = save_to_pending_func(pending_invoice_data, batch_id, source_info)
-            form_data['pending_id'] = pending_id
-            
-            log.info(f"Invoice data saved to pending_invoices with ID {pending_id}")
+            content_hash = compute_file_hash(file_path)
+        except OSError as e:
+            log.warning(f"Could not hash {filename}, processing without single-flight: {str(e)}")
+            content_hash = None
             
-            # Return data for the frontend
-            return {
-                'success': True,
-                'filename': filename,
-                'file_path': file_path,
-                'preview_path': preview_path,
-                'pending_id': pending_id,
-                'extracted_data': form_data,
-                'needs_validation': True,
-                'status': 'processed'
-            }
-            
-        except Exception as db_error:
-            log.error(f"Database error saving invoice {filename}: {str(db_error)}", exc_info=True)
-            return {
-                'success': False,
-                'filename': original_filename,
-                'error': f"Database error: {str(db_error)}",
-                'file_path': file_path,
-                'preview_path': preview_path,
-                'extracted_data': form_data,
-                'status': 'error'
-            }
+        return _process_saved_file(
+            file_path, filename, original_filename, app_config, check_invoice_exists_func,
+            select_ai_model_func, save_to_pending_func, InvoiceScannerClass,
+            batch_id, source, current_user, priority, source_info, retry_id, content_hash
+        )
             
     except Exception as e:
         log.error(f"Unhandled error processing file {file_storage.filename if hasattr(file_storage, 'filename') else 'unknown file'}: {str(e)}", exc_info=True)
@@ -0,0 +1,228 @@
+import re
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+
+from utils.metrics import percentile
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Per-fingerprint timing samples kept for percentiles
+SAMPLES_PER_QUERY = 1000
+
+REPORT_SORTS = ('total', 'count', 'mean', 'max', 'p50', 'p95', 'p99')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_VALUES_LIST = re.compile(r'(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+')
+_SPACE = re.compile(r'\s+')
+
+_TRUE = ('1', 'true', 'yes', 'on')
+_FALSE = ('0', 'false', 'no', 'off')
+
+def parse_bool(value):
+    """A JSON boolean, 0/1 or one of true/false, yes/no, on/off; anything else is a ValueError"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in _TRUE + _FALSE:
+        return value.strip().lower() in _TRUE
+    raise ValueError(f"not a boolean: {value!r}")
+
+def fingerprint(sql):
+    """Normalise SQL so statements differing only in literals or list lengths group together"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _VALUES_LIST.sub(r'\1, ...', sql)
+    sql = _IN_LIST.sub('(?, ...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+class QueryStats:
+    """Statement timings grouped by SQL fingerprint, with plans of slow statements
+
+    Disabled by default; while disabled, connections from get_db_connection
+    execute statements without any timing overhead beyond one attribute check.
+    """
+
+    def __init__(self, slow_ms=100.0):
+        self.enabled = False
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._started_at = time.time()
+
+    def configure(self, enabled=None, slow_ms=None):
+        """Switch collection on or off and set the slow statement threshold (ms)"""
+        if enabled is not None:
+            enabled = parse_bool(enabled)
+        if slow_ms is not None:
+            self.slow_ms = float(slow_ms)
+        if enabled is not None:
+            self.enabled = enabled
+            log.info(f"Query statistics {'enabled' if self.enabled else 'disabled'} (slow threshold {self.slow_ms} ms)")
+
+    def reset(self):
+        """Drop all collected statistics"""
+        with self._lock:
+            self._queries.clear()
+            self._started_at = time.time()
+
+    def start(self, sql):
+        """Register one execution; returns (entry, sample) for add_time"""
+        key = fingerprint(sql)
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is None:
+                entry = self._queries[key] = {
+                    'fingerprint': key,
+                    'count': 0,
+                    'total': 0.0,
+                    'max': 0.0,
+                    'slow_count': 0,
+                    'samples': deque(maxlen=SAMPLES_PER_QUERY),
+                    'plan': None,
+                    'plan_sql': None
+                }
+            entry['count'] += 1
+            sample = [0.0]
+            entry['samples'].append(sample)
+        return entry, sample
+
+    def add_time(self, entry, sample, seconds):
+        """Add execute or fetch time to a registered execution
+
+        Returns:
+            bool: True if this execution just crossed the slow threshold
+        """
+        with self._lock:
+            was_slow = sample[0] > 0 and sample[0] * 1000 >= self.slow_ms
+            sample[0] += seconds
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], sample[0])
+            slow = not was_slow and sample[0] * 1000 >= self.slow_ms
+            if slow:
+                entry['slow_count'] += 1
+            return slow
+
+    def needs_plan(self, entry):
+        with self._lock:
+            return entry['plan'] is None
+
+    def set_plan(self, entry, sql, plan):
+        with self._lock:
+            entry['plan'] = plan
+            entry['plan_sql'] = sql
+
+    def report(self, sort='total', limit=50):
+        """Fingerprints with count, total/mean/max and p50/p95/p99 in ms, slowest first
+
+        Args:
+            sort: total, count, mean, max, p50, p95 or p99
+            limit: Number of fingerprints returned
+        """
+        if sort not in REPORT_SORTS:
+            raise ValueError(f"Cannot sort query statistics by '{sort}' (allowed: {', '.join(REPORT_SORTS)})")
+        sort_key = 'count' if sort == 'count' else f'{sort}_ms'
+
+        with self._lock:
+            entries = [dict(entry, samples=sorted(sample[0] for sample in entry['samples']))
+                       for entry in self._queries.values()]
+            started_at = self._started_at
+
+        queries = []
+        for entry in entries:
+            samples = entry.pop('samples')
+            queries.append({
+                'fingerprint': entry['fingerprint'],
+                'count': entry['count'],
+                'slow_count': entry['slow_count'],
+                'total_ms': round(entry['total'] * 1000, 3),
+                'mean_ms': round(entry['total'] * 1000 / entry['count'], 3) if entry['count'] else 0.0,
+                'max_ms': round(entry['max'] * 1000, 3),
+                'p50_ms': round(percentile(samples, 50) * 1000, 3),
+                'p95_ms': round(percentile(samples, 95) * 1000, 3),
+                'p99_ms': round(percentile(samples, 99) * 1000, 3),
+                'plan': entry['plan'],
+                'plan_sql': entry['plan_sql']
+            })
+        queries.sort(key=lambda query: query[sort_key], reverse=True)
+        return {
+            'enabled': self.enabled,
+            'slow_ms': self.slow_ms,
+            'since': started_at,
+            'fingerprints': len(queries),
+            'queries': queries[:limit]
+        }
+
+# Process-wide statistics used by utils.database
+query_stats = QueryStats()
+
+def _explain(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN for a statement, bypassing the instrumentation"""
+    try:
+        rows = sqlite3.Cursor(conn).execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+        return [row[3] for row in rows]
+    except sqlite3.Error as e:
+        return [f'(no plan: {str(e)})']
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports execute and fetch time to query_stats"""
+
+    _stats_entry = None
+    _stats_sample = None
+    _stats_sql = None
+    _stats_parameters = ()
+
+    def _record(self, seconds):
+        """Add time to the current statement; capture its plan when it turns slow"""
+        if self._stats_entry is None:
+            return
+        slow = query_stats.add_time(self._stats_entry, self._stats_sample, seconds)
+        if slow:
+            log.warning(f"Slow query ({self._stats_sample[0] * 1000:.1f} ms): {self._stats_entry['fingerprint']}")
+            if query_stats.needs_plan(self._stats_entry):
+                query_stats.set_plan(self._stats_entry, self._stats_sql,
+                                     _explain(self.connection, self._stats_sql, self._stats_parameters))
+
+    def execute(self, sql, parameters=()):
+        self._stats_entry, self._stats_sample = query_stats.start(sql)
+        self._stats_sql, self._stats_parameters = sql, parameters
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        # The first parameter row is kept for EXPLAIN, so iterators are materialised
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        first = seq_of_parameters[0] if seq_of_parameters else ()
+        self._stats_entry, self._stats_sample = query_stats.start(sql)
+        self._stats_sql, self._stats_parameters = sql, first
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
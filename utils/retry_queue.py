@@ -0,0 +1,324 @@
+import json
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from utils.database import get_db_connection
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Failures that are likely to succeed later (Ollama restarting, OCR crash, network hiccup).
+# processing_error is any other exception during extraction, usually a bug or a
+# broken file, so it is not retried; those invoices go to manual input instead.
+TRANSIENT_ERROR_TYPES = {'timeout', 'model_error', 'no_result', 'ocr_error'}
+
+# Failures that will not go away by retrying the same input
+PERMANENT_ERROR_TYPES = {'parse_error'}
+
+def is_transient_failure(extracted_data):
+    """Check whether an extraction result failed in a way worth retrying"""
+    return isinstance(extracted_data, dict) and extracted_data.get('error_type') in TRANSIENT_ERROR_TYPES
+
+def is_permanent_failure(extracted_data):
+    """Check whether an extraction result failed in a way retries cannot fix"""
+    return isinstance(extracted_data, dict) and extracted_data.get('error_type') in PERMANENT_ERROR_TYPES
+
+def compute_backoff(attempt, base_delay=30, max_delay=1800):
+    """Exponential backoff in seconds for the given attempt number, with +/-20% jitter"""
+    delay = min(max_delay, base_delay * (2 ** max(0, attempt - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+def schedule_retry(db_path, file_path, filename, source, error, error_type, batch_id=None,
+                   source_info=None, retry_id=None, max_attempts=5, base_delay=30, max_delay=1800):
+    """Record a transient failure and schedule the next attempt
+
+    The first failure inserts a queue row; failures of a retried item update it.
+    Once `max_attempts` is reached the item is moved to the dead-letter table.
+
+    Returns:
+        dict: {'status': 'queued', 'retry_id', 'attempts', 'next_attempt_at'}
+              or {'status': 'dead_lettered', 'dead_letter_id', 'attempts'}
+    """
+    now = datetime.now()
+    conn = get_db_connection(db_path)
+    try:
+        attempts = 1
+        created_at = now.isoformat()
+        if retry_id is not None:
+            row = conn.execute(
+                'SELECT attempts, created_at, source_info FROM extraction_retries WHERE id = ?', (retry_id,)
+            ).fetchone()
+            if row:
+                attempts = (row['attempts'] or 0) + 1
+                created_at = row['created_at'] or created_at
+                if source_info is None and row['source_info']:
+                    source_info = json.loads(row['source_info'])
+            else:
+                retry_id = None
+
+        source_info_json = json.dumps(source_info) if source_info is not None else None
+
+        if attempts >= max_attempts:
+            cursor = conn.execute('''
+                INSERT INTO extraction_dead_letters (
+                    file_path, filename, source, batch_id, source_info, attempts,
+                    error, error_type, first_failed_at, dead_lettered_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (file_path, filename, source, batch_id, source_info_json, attempts,
+                  error, error_type, created_at, now.isoformat()))
+            dead_letter_id = cursor.lastrowid
+            if retry_id is not None:
+                conn.execute('DELETE FROM extraction_retries WHERE id = ?', (retry_id,))
+            conn.commit()
+            log.warning(f"Extraction of {filename} failed {attempts} times - moved to dead letters ({error})")
+            return {'status': 'dead_lettered', 'dead_letter_id': dead_letter_id, 'attempts': attempts}
+
+        next_attempt_at = (now + timedelta(seconds=compute_backoff(attempts, base_delay, max_delay))).isoformat()
+        if retry_id is None:
+            cursor = conn.execute('''
+                INSERT INTO extraction_retries (
+                    file_path, filename, source, batch_id, source_info, attempts, status,
+                    last_error, error_type, next_attempt_at, created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, 'waiting', ?, ?, ?, ?, ?)
+            ''', (file_path, filename, source, batch_id, source_info_json, attempts,
+                  error, error_type, next_attempt_at, created_at, now.isoformat()))
+            retry_id = cursor.lastrowid
+        else:
+            conn.execute('''
+                UPDATE extraction_retries
+                SET attempts = ?, status = 'waiting', last_error = ?, error_type = ?,
+                    next_attempt_at = ?, updated_at = ?
+                WHERE id = ?
+            ''', (attempts, error, error_type, next_attempt_at, now.isoformat(), retry_id))
+        conn.commit()
+        log.info(f"Extraction of {filename} failed ({error_type}), attempt {attempts}/{max_attempts} - retrying at {next_attempt_at}")
+        return {'status': 'queued', 'retry_id': retry_id, 'attempts': attempts, 'next_attempt_at': next_attempt_at}
+    finally:
+        conn.close()
+
+def add_dead_letter(db_path, file_path, filename, source, error, error_type, batch_id=None,
+                    source_info=None, retry_id=None):
+    """Move a permanently failed extraction straight to the dead-letter table"""
+    now = datetime.now().isoformat()
+    conn = get_db_connection(db_path)
+    try:
+        attempts = 1
+        if retry_id is not None:
+            row = conn.execute('SELECT attempts FROM extraction_retries WHERE id = ?', (retry_id,)).fetchone()
+            if row:
+                attempts = (row['attempts'] or 0) + 1
+            conn.execute('DELETE FROM extraction_retries WHERE id = ?', (retry_id,))
+        cursor = conn.execute('''
+            INSERT INTO extraction_dead_letters (
+                file_path, filename, source, batch_id, source_info, attempts,
+                error, error_type, first_failed_at, dead_lettered_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (file_path, filename, source, batch_id,
+              json.dumps(source_info) if source_info is not None else None,
+              attempts, error, error_type, now, now))
+        conn.commit()
+        log.warning(f"Extraction of {filename} failed permanently ({error_type}) - moved to dead letters")
+        return {'status': 'dead_lettered', 'dead_letter_id': cursor.lastrowid, 'attempts': attempts}
+    finally:
+        conn.close()
+
+def complete_retry(db_path, retry_id):
+    """Remove a retry item once it no longer needs another attempt"""
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute('DELETE FROM extraction_retries WHERE id = ?', (retry_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def claim_due_retries(db_path, limit=5):
+    """Mark due retry items as running and return them"""
+    now = datetime.now().isoformat()
+    conn = get_db_connection(db_path)
+    try:
+        rows = conn.execute('''
+            SELECT * FROM extraction_retries
+            WHERE status = 'waiting' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at
+            LIMIT ?
+        ''', (now, limit)).fetchall()
+
+        claimed = []
+        for row in rows:
+            cursor = conn.execute('''
+                UPDATE extraction_retries SET status = 'running', updated_at = ?
+                WHERE id = ? AND status = 'waiting'
+            ''', (now, row['id']))
+            if cursor.rowcount:
+                claimed.append(dict(row))
+        conn.commit()
+        return claimed
+    finally:
+        conn.close()
+
+def reset_running_retries(db_path):
+    """Put items left 'running' by a crashed process back in the queue"""
+    conn = get_db_connection(db_path)
+    try:
+        cursor = conn.execute('''
+            UPDATE extraction_retries SET status = 'waiting', updated_at = ?
+            WHERE status = 'running'
+        ''', (datetime.now().isoformat(),))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+def list_retries(db_path, limit=100):
+    """List queued retry items, soonest first"""
+    conn = get_db_connection(db_path)
+    try:
+        rows = conn.execute('''
+            SELECT * FROM extraction_retries ORDER BY next_attempt_at LIMIT ?
+        ''', (limit,)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+def list_dead_letters(db_path, limit=100, offset=0):
+    """List dead-lettered extractions, newest first"""
+    conn = get_db_connection(db_path)
+    try:
+        rows = conn.execute('''
+            SELECT * FROM extraction_dead_letters
+            ORDER BY dead_lettered_at DESC, id DESC
+            LIMIT ? OFFSET ?
+        ''', (limit, offset)).fetchall()
+        total = conn.execute('SELECT COUNT(*) FROM extraction_dead_letters').fetchone()[0]
+        return [dict(row) for row in rows], total
+    finally:
+        conn.close()
+
+def redrive_dead_letters(db_path, dead_letter_ids=None):
+    """Move dead letters back into the retry queue for an immediate attempt
+
+    Args:
+        dead_letter_ids: IDs to redrive, or None for all dead letters
+
+    Returns:
+        list: New retry queue IDs
+    """
+    now = datetime.now().isoformat()
+    conn = get_db_connection(db_path)
+    try:
+        if dead_letter_ids is None:
+            rows = conn.execute('SELECT * FROM extraction_dead_letters').fetchall()
+        else:
+            placeholders = ','.join('?' for _ in dead_letter_ids)
+            rows = conn.execute(
+                f'SELECT * FROM extraction_dead_letters WHERE id IN ({placeholders})', list(dead_letter_ids)
+            ).fetchall()
+
+        retry_ids = []
+        for row in rows:
+            cursor = conn.execute('''
+                INSERT INTO extraction_retries (
+                    file_path, filename, source, batch_id, source_info, attempts, status,
+                    last_error, error_type, next_attempt_at, created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, 0, 'waiting', ?, ?, ?, ?, ?)
+            ''', (row['file_path'], row['filename'], row['source'], row['batch_id'], row['source_info'],
+                  row['error'], row['error_type'], now, now, now))
+            retry_ids.append(cursor.lastrowid)
+            conn.execute('DELETE FROM extraction_dead_letters WHERE id = ?', (row['id'],))
+        conn.commit()
+        log.info(f"Redrove {len(retry_ids)} dead-lettered extractions")
+        return retry_ids
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def delete_dead_letter(db_path, dead_letter_id):
+    """Discard a dead letter"""
+    conn = get_db_connection(db_path)
+    try:
+        cursor = conn.execute('DELETE FROM extraction_dead_letters WHERE id = ?', (dead_letter_id,))
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+class RetryWorker:
+    """Background thread that re-runs due retry items
+
+    `process_func(item)` receives the queue row as a dict and returns the
+    result of process_invoice_file. Rescheduling after another transient
+    failure is done by the processor itself (it is passed the retry id), so
+    the worker only removes items that no longer need a retry.
+    """
+
+    def __init__(self, db_path, process_func, poll_interval=10, batch_size=5,
+                 max_attempts=5, base_delay=30, max_delay=1800):
+        self.db_path = db_path
+        self.process_func = process_func
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread"""
+        reset = reset_running_retries(self.db_path)
+        if reset:
+            log.info(f"Re-queued {reset} retry items interrupted by a restart")
+        self._thread = threading.Thread(target=self._run, name='extraction-retry-worker', daemon=True)
+        self._thread.start()
+        return self
+
+    def wake(self):
+        """Check the queue now instead of waiting for the next poll"""
+        self._wake.set()
+
+    def stop(self):
+        """Stop the worker after the current item"""
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        """Worker loop"""
+        while not self._stop_event.is_set():
+            try:
+                items = claim_due_retries(self.db_path, self.batch_size)
+            except Exception as e:
+                log.error(f"Error reading retry queue: {str(e)}")
+                items = []
+
+            for item in items:
+                if self._stop_event.is_set():
+                    break
+                self._process(item)
+
+            if not items:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _process(self, item):
+        """Run one retry item"""
+        log.info(f"Retrying extraction of {item['filename']} (attempt {item['attempts'] + 1})")
+        try:
+            result = self.process_func(item)
+        except Exception as e:
+            log.error(f"Error retrying {item['filename']}: {str(e)}", exc_info=True)
+            schedule_retry(
+                self.db_path, item['file_path'], item['filename'], item['source'],
+                str(e), 'processing_error', batch_id=item['batch_id'], retry_id=item['id'],
+                max_attempts=self.max_attempts, base_delay=self.base_delay, max_delay=self.max_delay
+            )
+            return
+
+        if result.get('status') not in ('queued_for_retry', 'dead_lettered'):
+            complete_retry(self.db_path, item['id'])
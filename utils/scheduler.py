@@ -0,0 +1,201 @@
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future
+
+from utils.metrics import percentile
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Priority levels - lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BULK: 'bulk'
+}
+
+# Upload sources where a user is actively waiting for the result
+INTERACTIVE_SOURCES = {'single_upload', 'validate_upload'}
+
+def priority_for_source(source):
+    """Map an upload source to a scheduling priority"""
+    return PRIORITY_INTERACTIVE if source in INTERACTIVE_SOURCES else PRIORITY_BULK
+
+class ExtractionScheduler:
+    """Priority-aware scheduler for OCR and LLM extraction work
+
+    Interactive work (a user waiting on a single upload) is always taken from
+    the queue before bulk work (batch uploads, email imports). To keep bulk
+    imports from starving, bulk items are guaranteed at least `bulk_min_share`
+    of the recent dispatches whenever bulk work is waiting. Running items are
+    never interrupted - preemption happens at the queue.
+    """
+
+    def __init__(self, workers=2, bulk_min_share=0.2, window_size=10, sample_size=500):
+        self.workers = max(1, int(workers))
+        self.bulk_min_share = bulk_min_share
+        self._queues = {PRIORITY_INTERACTIVE: deque(), PRIORITY_BULK: deque()}
+        self._recent = deque(maxlen=window_size)
+        self._cond = threading.Condition()
+        self._threads = []
+        self._local = threading.local()
+        self._shutdown = False
+        self._stats = {
+            priority: {
+                'submitted': 0,
+                'completed': 0,
+                'failed': 0,
+                'running': 0,
+                'wait_times': deque(maxlen=sample_size),
+                'run_times': deque(maxlen=sample_size)
+            }
+            for priority in self._queues
+        }
+
+    def configure(self, workers=None, bulk_min_share=None):
+        """Update scheduler settings (worker count can only be raised while running)"""
+        with self._cond:
+            if workers is not None:
+                self.workers = max(1, int(workers))
+            if bulk_min_share is not None:
+                self.bulk_min_share = max(0.0, min(1.0, float(bulk_min_share)))
+            if self._threads:
+                self._start_workers()
+
+    def _start_workers(self):
+        """Start worker threads up to the configured count (caller holds the lock)"""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"extraction-worker-{len(self._threads) + 1}",
+                daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+            log.info(f"Started {thread.name}")
+
+    def submit(self, priority, func, *args, **kwargs):
+        """Queue a unit of extraction work and return a Future for its result"""
+        if priority not in self._queues:
+            priority = PRIORITY_BULK
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Extraction scheduler has been shut down")
+            if not self._threads:
+                self._start_workers()
+            self._queues[priority].append((time.monotonic(), future, func, args, kwargs))
+            self._stats[priority]['submitted'] += 1
+            self._cond.notify()
+        return future
+
+    def run(self, priority, func, *args, **kwargs):
+        """Run work through the scheduler and wait for its result
+
+        Calls made from inside a worker thread run inline, so nested
+        extraction steps can never deadlock waiting for a free worker.
+        """
+        if getattr(self._local, 'is_worker', False):
+            return func(*args, **kwargs)
+        return self.submit(priority, func, *args, **kwargs).result()
+
+    def _next_item(self):
+        """Pick the next queued item (caller holds the lock)"""
+        interactive = self._queues[PRIORITY_INTERACTIVE]
+        bulk = self._queues[PRIORITY_BULK]
+
+        if bulk and interactive:
+            # Guarantee bulk work a minimum share of recent dispatches
+            bulk_dispatched = sum(1 for p in self._recent if p == PRIORITY_BULK)
+            if self._recent and bulk_dispatched / len(self._recent) < self.bulk_min_share:
+                priority = PRIORITY_BULK
+            else:
+                priority = PRIORITY_INTERACTIVE
+        elif interactive:
+            priority = PRIORITY_INTERACTIVE
+        elif bulk:
+            priority = PRIORITY_BULK
+        else:
+            return None, None
+
+        self._recent.append(priority)
+        return priority, self._queues[priority].popleft()
+
+    def _worker_loop(self):
+        """Worker thread main loop"""
+        self._local.is_worker = True
+        while True:
+            with self._cond:
+                priority, item = self._next_item()
+                while item is None:
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                    priority, item = self._next_item()
+                stats = self._stats[priority]
+                stats['running'] += 1
+
+            queued_at, future, func, args, kwargs = item
+            started_at = time.monotonic()
+            failed = False
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as e:
+                    failed = True
+                    future.set_exception(e)
+
+            finished_at = time.monotonic()
+            with self._cond:
+                stats['running'] -= 1
+                stats['failed' if failed else 'completed'] += 1
+                stats['wait_times'].append(started_at - queued_at)
+                stats['run_times'].append(finished_at - started_at)
+
+    def get_stats(self):
+        """Return queue depth and latency figures per priority"""
+        with self._cond:
+            result = {
+                'workers': self.workers,
+                'bulk_min_share': self.bulk_min_share,
+                'priorities': {}
+            }
+            for priority, stats in self._stats.items():
+                wait_times = list(stats['wait_times'])
+                run_times = list(stats['run_times'])
+                result['priorities'][PRIORITY_NAMES[priority]] = {
+                    'queued': len(self._queues[priority]),
+                    'running': stats['running'],
+                    'submitted': stats['submitted'],
+                    'completed': stats['completed'],
+                    'failed': stats['failed'],
+                    'queue_latency': {
+                        'avg': sum(wait_times) / len(wait_times) if wait_times else 0.0,
+                        'p50': percentile(wait_times, 50),
+                        'p95': percentile(wait_times, 95),
+                        'max': max(wait_times) if wait_times else 0.0
+                    },
+                    'run_time': {
+                        'avg': sum(run_times) / len(run_times) if run_times else 0.0,
+                        'p95': percentile(run_times, 95)
+                    }
+                }
+            return result
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and let the workers exit once the queues are drained"""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+# Shared scheduler used by the web app and background importers
+extraction_scheduler = ExtractionScheduler()
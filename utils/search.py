@@ -0,0 +1,72 @@
+import re
+import logging
+
+from utils.database import get_db_connection
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# bm25 column weights: invoice_number, supplier_name, company_name, description, document_text
+FTS_WEIGHTS = (10.0, 5.0, 3.0, 2.0, 1.0)
+
+_TERM = re.compile(r'"[^"]+"|\S+')
+
+def build_fts_query(text):
+    """Turn free user input into a safe FTS5 MATCH expression
+
+    Every term is quoted so FTS5 operators and punctuation in the input
+    ("RE-2023/001", "AND", "a:b") cannot cause syntax errors; all terms must
+    match. Quoted phrases stay phrases and a trailing * keeps prefix search.
+
+    Returns:
+        str: MATCH expression, or None if the input has no searchable terms
+    """
+    terms = []
+    for term in _TERM.findall(text or ''):
+        prefix = term.endswith('*') and not term.startswith('"')
+        term = term.strip('"').rstrip('*').strip()
+        if not term:
+            continue
+        quoted = '"' + term.replace('"', '""') + '"'
+        terms.append(quoted + ('*' if prefix else ''))
+    return ' '.join(terms) if terms else None
+
+def search_invoices(db_path, text, limit=20, offset=0):
+    """Ranked full-text search over finalized invoices
+
+    Returns:
+        dict: 'total' matches and 'results' (invoice fields, rank and a
+              snippet with matches wrapped in <mark>)
+    """
+    match = build_fts_query(text)
+    if not match:
+        return {'total': 0, 'results': []}
+
+    conn = get_db_connection(db_path)
+    try:
+        total = conn.execute(
+            'SELECT COUNT(*) FROM invoice_fts WHERE invoice_fts MATCH ?', (match,)
+        ).fetchone()[0]
+
+        rows = conn.execute(f'''
+            SELECT i.id, i.invoice_number, i.invoice_date, i.amount_original, i.vat_amount_original,
+                   f.supplier_name, f.company_name, i.description, i.file_path,
+                   i.processed_at AS created_at,
+                   ranked.rank AS rank,
+                   snippet(invoice_fts, -1, '<mark>', '</mark>', '…', 12) AS snippet
+            FROM (
+                SELECT rowid, supplier_name, company_name, rank
+                FROM invoice_fts
+                WHERE invoice_fts MATCH ? AND rank MATCH 'bm25({", ".join(str(w) for w in FTS_WEIGHTS)})'
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            ) AS ranked
+            JOIN invoice_fts f ON f.rowid = ranked.rowid
+            JOIN invoices i ON i.id = ranked.rowid
+            WHERE f.invoice_fts MATCH ?
+            ORDER BY ranked.rank
+        ''', (match, limit, offset, match)).fetchall()
+
+        return {'total': total, 'results': [dict(row) for row in rows]}
+    finally:
+        conn.close()
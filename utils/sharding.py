@@ -0,0 +1,651 @@
+import os
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.database import get_db_connection, find_duplicate_invoice
+from utils.migrations import run_migrations
+from utils.finalize import finalize_validated_files, VALIDATED_FIELDS
+from utils.name_resolver import get_or_create_supplier_id, get_or_create_company_id
+from utils.search import search_invoices
+from utils.normalize import normalize_invoice_number
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+# Invoice IDs of shard n start at n << SHARD_ID_BITS, so an ID names its shard.
+# Shard 0 is the catalog database itself (invoices without a company and
+# everything finalized before sharding was switched on). 2^53 / 2^40 leaves
+# room for 8191 shards within JavaScript's exact integer range.
+SHARD_ID_BITS = 40
+
+def shard_of_invoice(invoice_id):
+    """Shard number an invoice ID belongs to"""
+    return int(invoice_id) >> SHARD_ID_BITS
+
+def _placeholders(values):
+    return ', '.join(['?'] * len(values))
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+
+def shard_database_paths(catalog_path, shard_dir):
+    """Shard database files listed in a catalog's company_shards, in shard order
+
+    For tools that work on the files without a ShardRouter (backups,
+    compaction from cli.py). A catalog that has shards needs shard_dir.
+    """
+    # Read-only and without the connection pragmas, so it also works on snapshots
+    conn = sqlite3.connect(f'file:{catalog_path}?mode=ro', uri=True)
+    try:
+        rows = conn.execute('SELECT db_file FROM company_shards ORDER BY shard_no').fetchall()
+    except sqlite3.OperationalError:
+        return []  # not migrated yet, so never sharded
+    finally:
+        conn.close()
+    if rows and not shard_dir:
+        raise ValueError(f"{catalog_path} has {len(rows)} per-company shards; their directory is required")
+    return [os.path.join(shard_dir, row[0]) for row in rows]
+
+class ShardRouter:
+    """Route finalized invoices to one SQLite file per company
+
+    The catalog (the main database) keeps the pending pipeline, batches and
+    the shared supplier/company lookups, plus company_shards mapping each
+    company to its shard file. Shards have the full schema, so invoice
+    queries, FTS and dashboard triggers work per shard unchanged; supplier
+    and company rows are mirrored into a shard with their catalog IDs.
+    Writes to different companies take different write locks, and
+    cross-company reads fan out over a thread pool and are merged.
+
+    Invoice numbers stay unique per supplier across all databases through
+    the catalog's invoice_number_registry: finalize reserves each number
+    there before writing to a shard, and edits and deletes keep it in step.
+    The raw invoice_number fallback of find_duplicate_invoice (rows whose
+    key was never backfilled) still only sees the database it runs on.
+    """
+
+    def __init__(self, catalog_path, shard_dir, max_workers=8):
+        self.catalog_path = catalog_path
+        self.shard_dir = shard_dir
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shard')
+        self._lock = threading.Lock()
+        self._paths = {0: catalog_path}  # shard_no -> database path
+        self._companies = {}             # company_id -> shard_no
+        os.makedirs(shard_dir, exist_ok=True)
+        self.refresh()
+
+    def refresh(self):
+        """Reload the routing table from the catalog"""
+        conn = get_db_connection(self.catalog_path)
+        try:
+            rows = conn.execute('SELECT company_id, shard_no, db_file FROM company_shards').fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            for row in rows:
+                self._companies[row['company_id']] = row['shard_no']
+                self._paths[row['shard_no']] = os.path.join(self.shard_dir, row['db_file'])
+
+    def migrate(self):
+        """Bring every shard's schema up to date (a no-op once current)
+
+        Shards whose invoices predate the invoice number registry are
+        registered in the catalog once.
+        """
+        with self._lock:
+            shards = sorted(self._paths.items())[1:]
+        for shard_no, path in shards:
+            run_migrations(path)
+            self._register_shard(shard_no, path)
+
+    def _register_shard(self, shard_no, path):
+        """Add a shard's invoice numbers to the catalog registry unless already there"""
+        catalog = get_db_connection(self.catalog_path)
+        try:
+            # A range seek on the invoice_id index: IDs name their shard
+            if catalog.execute(
+                'SELECT 1 FROM invoice_number_registry WHERE invoice_id BETWEEN ? AND ? LIMIT 1',
+                (shard_no << SHARD_ID_BITS, ((shard_no + 1) << SHARD_ID_BITS) - 1)
+            ).fetchone():
+                return
+            conn = get_db_connection(path)
+            try:
+                now = datetime.now().isoformat()
+                rows = [
+                    (row[0], row[1], shard_no, row[2], now) for row in conn.execute(
+                        'SELECT invoice_number_key, supplier_id, id FROM invoices WHERE invoice_number_key IS NOT NULL'
+                    ).fetchall()
+                ]
+            finally:
+                conn.close()
+            if not rows:
+                return
+            catalog.execute('BEGIN IMMEDIATE')
+            catalog.executemany('''
+                INSERT OR IGNORE INTO invoice_number_registry
+                    (invoice_number_key, supplier_id, shard_no, invoice_id, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            catalog.commit()
+            log.info(f"Registered {len(rows)} invoice numbers of shard {shard_no}")
+        finally:
+            catalog.close()
+
+    def shard_paths(self):
+        """Catalog followed by the shard databases"""
+        with self._lock:
+            return [self._paths[shard_no] for shard_no in sorted(self._paths)]
+
+    def path_for_invoice(self, invoice_id):
+        """Database holding an invoice ID, or None if its shard is unknown"""
+        shard_no = shard_of_invoice(invoice_id)
+        with self._lock:
+            path = self._paths.get(shard_no)
+        if path is None:
+            self.refresh()
+            with self._lock:
+                path = self._paths.get(shard_no)
+        return path
+
+    def resolve_name(self, conn, table, name):
+        """Catalog ID for a supplier/company name (created if new), mirrored into the shard behind conn"""
+        if not name:
+            return None
+        catalog = get_db_connection(self.catalog_path)
+        try:
+            row_id = (get_or_create_supplier_id if table == 'suppliers' else get_or_create_company_id)(catalog, name)
+            catalog.commit()
+        finally:
+            catalog.close()
+        if conn.db_path != self.catalog_path:
+            conn.execute(f'INSERT OR IGNORE INTO {table} (id, name) VALUES (?, ?)', (row_id, name))
+        return row_id
+
+    def map(self, func, sources):
+        """Run func over sources on the shard thread pool (like map)"""
+        return list(self._executor.map(func, sources))
+
+    def fan_out(self, func, *args):
+        """Call func(db_path, *args) for the catalog and every shard in parallel
+
+        Returns:
+            list: Results in shard order
+        """
+        return self.map(lambda path: func(path, *args), self.shard_paths())
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _shard_for_company(self, conn, company_id, new_routes):
+        """Shard number of a company, creating its database on first use
+
+        conn is a catalog connection inside a write transaction. A route
+        created here is only recorded in new_routes (company_id -> (shard_no,
+        path)); the caller passes it to _apply_routes once the transaction
+        has committed, so a rollback leaves no route behind in this process.
+        """
+        with self._lock:
+            shard_no = self._companies.get(company_id)
+        if shard_no is not None:
+            return shard_no
+        if company_id in new_routes:
+            return new_routes[company_id][0]
+        # Another process may have routed the company since the last refresh
+        row = conn.execute('SELECT shard_no, db_file FROM company_shards WHERE company_id = ?',
+                           (company_id,)).fetchone()
+        if row is not None:
+            self._apply_routes({company_id: (row['shard_no'], os.path.join(self.shard_dir, row['db_file']))})
+            return row['shard_no']
+
+        shard_no = conn.execute('SELECT COALESCE(MAX(shard_no), 0) + 1 FROM company_shards').fetchone()[0]
+        db_file = f'company-{company_id}.db'
+        path = os.path.join(self.shard_dir, db_file)
+        self._create_shard(path, shard_no)
+        conn.execute('INSERT INTO company_shards (company_id, shard_no, db_file, created_at) VALUES (?, ?, ?, ?)',
+                     (company_id, shard_no, db_file, datetime.now().isoformat()))
+        new_routes[company_id] = (shard_no, path)
+        log.info(f"Created shard {shard_no} for company {company_id}: {path}")
+        return shard_no
+
+    def _apply_routes(self, routes):
+        """Add committed company_id -> (shard_no, path) routes to the routing table"""
+        with self._lock:
+            for company_id, (shard_no, path) in routes.items():
+                self._companies[company_id] = shard_no
+                self._paths[shard_no] = path
+
+    def _create_shard(self, path, shard_no):
+        """Create a shard database and start its invoice IDs in the shard's range
+
+        The file may be left over from a finalize whose catalog transaction
+        rolled back; it never received invoices, so its IDs are simply
+        restarted in the new shard's range.
+        """
+        run_migrations(path)
+        conn = get_db_connection(path)
+        try:
+            first_id = shard_no << SHARD_ID_BITS
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('SELECT 1 FROM invoices LIMIT 1').fetchone():
+                conn.rollback()
+                raise RuntimeError(f"{path} holds invoices but is not listed in company_shards")
+            if conn.execute("SELECT 1 FROM sqlite_sequence WHERE name = 'invoices'").fetchone():
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'invoices'", (first_id,))
+            else:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('invoices', ?)", (first_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def finalize(self, batch_id, validated_files):
+        """Sharded counterpart of finalize_validated_files
+
+        1. Route each pending invoice by its (reviewer-corrected) company,
+           registering new suppliers/companies and shards in the catalog,
+           and reserve its invoice number in invoice_number_registry; a
+           number taken in any database is rejected as a duplicate here.
+        2. Per shard, in parallel: copy the pending rows, their text and the
+           names they use into the shard and run finalize_validated_files
+           there, so the invoice inserts, FTS and dashboard triggers only
+           lock that company's database.
+        3. Mark the finalized pending rows and batch_queue entries in the
+           catalog in one short transaction, recording the new invoice IDs
+           in the registry and releasing the numbers that did not finalize.
+
+        Step 3 runs after the shards commit; if it fails (or the process
+        dies in between) the invoices exist while their pending rows stay
+        open, and their numbers stay reserved, so finalizing them again is
+        rejected as a duplicate.
+
+        Returns:
+            dict: Same shape as finalize_validated_files
+        """
+        catalog = get_db_connection(self.catalog_path)
+        try:
+            ids = []
+            for file_data in validated_files:
+                try:
+                    ids.append(int(file_data.get('pending_id')))
+                except (TypeError, ValueError):
+                    pass
+            pending = {
+                row['id']: dict(row) for row in catalog.execute(
+                    f'SELECT * FROM pending_invoices WHERE id IN ({_placeholders(ids)})', ids
+                ).fetchall()
+            } if ids else {}
+
+            groups = {}  # shard_no -> [(index in validated_files, file_data)]
+            rejected = []
+            reserved = []  # pending IDs holding a registry reservation
+            new_routes = {}  # shards created in this transaction, cached once it commits
+            catalog.execute('BEGIN IMMEDIATE')
+            try:
+                # Reservations left behind by a finalize that died before step 3
+                catalog.execute(f'''
+                    DELETE FROM invoice_number_registry
+                    WHERE invoice_id IS NULL AND pending_id IN ({_placeholders(list(pending))})
+                ''', list(pending))
+                for index, file_data in enumerate(validated_files):
+                    row = pending.get(_pending_id(file_data))
+                    shard_no = 0
+                    if row is not None and not row['is_finalized']:
+                        company = file_data.get('company_name') or row['company_name']
+                        supplier = file_data.get('supplier_name') or row['supplier_name']
+                        invoice_number = file_data.get('invoice_number') or row['invoice_number']
+                        if company:
+                            get_or_create_supplier_id(catalog, supplier)
+                            shard_no = self._shard_for_company(
+                                catalog, get_or_create_company_id(catalog, company), new_routes
+                            )
+                        if not self._reserve_number(catalog, row['id'], shard_no, invoice_number, supplier):
+                            rejected.append({
+                                'index': index,
+                                'pending_id': row['id'],
+                                'file': row['file_path'],
+                                'error': f'Invoice number {invoice_number} already exists in database',
+                                'is_duplicate': True,
+                                'invoice_number': invoice_number
+                            })
+                            continue
+                        reserved.append(row['id'])
+                    groups.setdefault(shard_no, []).append((index, file_data))
+                catalog.commit()
+            except Exception:
+                catalog.rollback()
+                raise
+            self._apply_routes(new_routes)
+
+            shared = self._shared_rows(catalog, pending, groups)
+        finally:
+            catalog.close()
+
+        def run(item):
+            try:
+                return self._finalize_group(item[0], batch_id, item[1], pending, shared), None
+            except Exception as e:
+                return None, e
+
+        outcomes = self.map(run, list(groups.items()))
+
+        finalized, errors, pending_updates = [], rejected, []
+        failures = [failure for outcome, failure in outcomes if failure is not None]
+        for result, updates in (outcome for outcome, failure in outcomes if failure is None):
+            finalized += result['finalized']
+            errors += result['errors']
+            pending_updates += updates
+        invoice_ids = {item['pending_id']: item['invoice_id'] for item in finalized}
+        if reserved or pending_updates:
+            self._mark_finalized(
+                batch_id, pending_updates,
+                [(invoice_ids[pending_id], pending_id) for pending_id in reserved if pending_id in invoice_ids],
+                [pending_id for pending_id in reserved if pending_id not in invoice_ids]
+            )
+        if failures:
+            raise failures[0]
+
+        finalized.sort(key=lambda item: item['index'])
+        errors.sort(key=lambda error: error['index'])
+        log.info(f"Finalized {len(finalized)} invoices into {len(groups)} databases, {len(errors)} errors")
+        return {'finalized': finalized, 'errors': errors}
+
+    def _reserve_number(self, catalog, pending_id, shard_no, invoice_number, supplier_name):
+        """Reserve an invoice number for a pending invoice; False if any database has it
+
+        catalog is a catalog connection inside a write transaction, which
+        serialises reservations across processes.
+        """
+        key = normalize_invoice_number(invoice_number)
+        if not key:
+            return True
+        if find_duplicate_invoice(catalog, invoice_number, supplier_name) is not None:
+            return False
+        supplier_id = get_or_create_supplier_id(catalog, supplier_name) if supplier_name else None
+        try:
+            catalog.execute('''
+                INSERT INTO invoice_number_registry (invoice_number_key, supplier_id, shard_no, pending_id, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (key, supplier_id, shard_no, pending_id, datetime.now().isoformat()))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def register_invoice(self, invoice_id, invoice_number_key, supplier_id, conn=None):
+        """Move an edited invoice's registry entry to its new number/supplier
+
+        conn is the caller's connection; if it is on the catalog the change
+        joins its transaction, otherwise it is committed here.
+
+        Returns:
+            bool: False if another invoice in any database has the number
+        """
+        def register(catalog):
+            if invoice_number_key and (
+                catalog.execute(
+                    '''SELECT 1 FROM invoice_number_registry
+                       WHERE invoice_number_key = ? AND supplier_id IS ? AND invoice_id IS NOT ?''',
+                    (invoice_number_key, supplier_id, invoice_id)
+                ).fetchone()
+                or catalog.execute(
+                    'SELECT 1 FROM invoices WHERE invoice_number_key = ? AND supplier_id IS ? AND id != ?',
+                    (invoice_number_key, supplier_id, invoice_id)
+                ).fetchone()
+            ):
+                return False
+            catalog.execute('DELETE FROM invoice_number_registry WHERE invoice_id = ?', (invoice_id,))
+            if invoice_number_key:
+                catalog.execute('''
+                    INSERT INTO invoice_number_registry (invoice_number_key, supplier_id, shard_no, invoice_id, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (invoice_number_key, supplier_id, shard_of_invoice(invoice_id), invoice_id,
+                      datetime.now().isoformat()))
+            return True
+
+        return self._on_catalog(conn, register)
+
+    def forget_invoice(self, invoice_id, conn=None):
+        """Drop a deleted invoice's registry entry (see register_invoice for conn)"""
+        self._on_catalog(conn, lambda catalog: catalog.execute(
+            'DELETE FROM invoice_number_registry WHERE invoice_id = ?', (invoice_id,)
+        ))
+
+    def _on_catalog(self, conn, func):
+        """func(catalog connection) in conn's transaction if conn is on the catalog, else in its own"""
+        if conn is not None and conn.db_path == self.catalog_path:
+            return func(conn)
+        catalog = get_db_connection(self.catalog_path)
+        try:
+            catalog.execute('BEGIN IMMEDIATE')
+            result = func(catalog)
+            catalog.commit()
+            return result
+        except Exception:
+            catalog.rollback()
+            raise
+        finally:
+            catalog.close()
+
+    def _shared_rows(self, catalog, pending, groups):
+        """Blob rows, document texts and supplier/company rows the shard groups need"""
+        ids = [_pending_id(file_data) for shard_no, files in groups.items() if shard_no
+               for _, file_data in files if _pending_id(file_data) in pending]
+        if not ids:
+            return {'blobs': {}, 'texts': {}, 'suppliers': {}, 'companies': {}}
+        blobs = {
+            row['pending_id']: dict(row) for row in catalog.execute(
+                f'SELECT * FROM pending_invoice_blobs WHERE pending_id IN ({_placeholders(ids)})', ids
+            ).fetchall()
+        }
+        hashes = list({value for blob in blobs.values()
+                       for value in (blob['raw_text_hash'], blob['ocr_text_hash']) if value})
+        texts = {
+            row['hash']: tuple(row) for row in catalog.execute(
+                f'''SELECT hash, codec, data, raw_size, stored_size, created_at
+                    FROM document_texts WHERE hash IN ({_placeholders(hashes)})''', hashes
+            ).fetchall()
+        } if hashes else {}
+        names = {}
+        for table, field in (('suppliers', 'supplier_name'), ('companies', 'company_name')):
+            wanted = list({value for shard_no, files in groups.items() if shard_no for _, file_data in files
+                           for value in (file_data.get(field), pending.get(_pending_id(file_data), {}).get(field))
+                           if value})
+            names[table] = {
+                row['name']: row['id'] for row in catalog.execute(
+                    f'SELECT id, name FROM {table} WHERE name IN ({_placeholders(wanted)})', wanted
+                ).fetchall()
+            } if wanted else {}
+        return {'blobs': blobs, 'texts': texts, **names}
+
+    def _finalize_group(self, shard_no, batch_id, files, pending, shared):
+        """Finalize one shard's files; returns (result with request indexes, catalog pending updates)"""
+        validated = [file_data for _, file_data in files]
+        if shard_no == 0:
+            conn = get_db_connection(self.catalog_path)
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                result = finalize_validated_files(conn, batch_id, validated)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+            return _reindex(result, files), []
+
+        ids = [pending_id for pending_id in map(_pending_id, validated) if pending_id in pending]
+        conn = get_db_connection(self._paths[shard_no])
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for table in ('suppliers', 'companies'):
+                    conn.executemany(f'INSERT OR IGNORE INTO {table} (id, name) VALUES (?, ?)',
+                                     [(row_id, name) for name, row_id in shared[table].items()])
+                conn.executemany('''
+                    INSERT OR IGNORE INTO document_texts (hash, codec, data, raw_size, stored_size, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', list(shared['texts'].values()))
+
+                # The pending rows only pass through the shard so finalize_validated_files can run on it
+                columns = [column for column in _table_columns(conn, 'pending_invoices') if column in pending[ids[0]]]
+                conn.executemany(
+                    f'INSERT OR REPLACE INTO pending_invoices ({", ".join(columns)}) VALUES ({_placeholders(columns)})',
+                    [[pending[pending_id][column] for column in columns] for pending_id in ids]
+                )
+                blob_columns = ['pending_id', 'raw_text_hash', 'ocr_text_hash', 'extracted_data']
+                conn.executemany(
+                    f'INSERT OR REPLACE INTO pending_invoice_blobs ({", ".join(blob_columns)}) '
+                    f'VALUES ({_placeholders(blob_columns)})',
+                    [[shared['blobs'][pending_id][column] for column in blob_columns]
+                     for pending_id in ids if pending_id in shared['blobs']]
+                )
+
+                result = finalize_validated_files(conn, batch_id, validated)
+
+                done = [item['pending_id'] for item in result['finalized']]
+                updates = [
+                    tuple(row) for row in conn.execute(f'''
+                        SELECT {", ".join(VALIDATED_FIELDS)}, validated_at, finalized_at, id
+                        FROM pending_invoices WHERE id IN ({_placeholders(done)})
+                    ''', done).fetchall()
+                ] if done else []
+                conn.execute(f'DELETE FROM pending_invoices WHERE id IN ({_placeholders(ids)})', ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.close()
+        return _reindex(result, files), updates
+
+    def _mark_finalized(self, batch_id, updates, invoice_ids, released):
+        """Record shard-finalized pending invoices in the catalog
+
+        Args:
+            updates: Pending row values of the shard-finalized invoices
+            invoice_ids: (invoice_id, pending_id) of reserved numbers that finalized
+            released: Pending IDs whose reserved numbers did not finalize
+        """
+        assignments = ',\n                    '.join(f'{field} = ?' for field in VALIDATED_FIELDS)
+        conn = get_db_connection(self.catalog_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'UPDATE invoice_number_registry SET invoice_id = ? WHERE pending_id = ? AND invoice_id IS NULL',
+                invoice_ids
+            )
+            conn.execute(f'''
+                DELETE FROM invoice_number_registry
+                WHERE invoice_id IS NULL AND pending_id IN ({_placeholders(released)})
+            ''', released)
+            conn.executemany(f'''
+                UPDATE pending_invoices SET
+                    {assignments},
+                    is_validated = 1,
+                    validated_at = ?,
+                    validation_status = 'human_validated',
+                    is_finalized = 1,
+                    finalized_at = ?
+                WHERE id = ?
+            ''', updates)
+            ids = [update[-1] for update in updates]
+            conn.execute(f'''
+                UPDATE batch_queue SET status = 'processed'
+                WHERE batch_id = COALESCE(?, batch_id) AND pending_id IN ({_placeholders(ids)})
+            ''', [batch_id] + ids)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            log.error(f"Invoices were finalized in their shards but the catalog update failed: {str(e)}")
+            raise
+        finally:
+            conn.close()
+
+    def dashboard_totals(self, today, since=None):
+        """Invoice counts, amounts and upload histogram summed over all databases
+
+        Suppliers and companies are counted once even if several shards have
+        invoices from them (their IDs are the catalog's in every shard).
+        """
+        def read(path):
+            conn = get_db_connection(path)
+            try:
+                stats = conn.execute(
+                    'SELECT invoice_count, amount_cents_sum, amount_count FROM dashboard_stats WHERE id = 1'
+                ).fetchone()
+                days = conn.execute(
+                    'SELECT day, invoice_count FROM dashboard_daily_uploads WHERE day >= ?', (since or today,)
+                ).fetchall()
+                return (
+                    tuple(stats) if stats else (0, 0, 0),
+                    {row[0] for row in conn.execute('SELECT supplier_id FROM dashboard_supplier_invoices')},
+                    {row[0] for row in conn.execute('SELECT company_id FROM dashboard_company_invoices')},
+                    [tuple(row) for row in days]
+                )
+            finally:
+                conn.close()
+
+        totals = {'invoice_count': 0, 'amount_cents_sum': 0, 'amount_count': 0}
+        suppliers, companies, uploads_by_day = set(), set(), {}
+        for stats, shard_suppliers, shard_companies, days in self.fan_out(read):
+            for key, value in zip(('invoice_count', 'amount_cents_sum', 'amount_count'), stats):
+                totals[key] += value
+            suppliers |= shard_suppliers
+            companies |= shard_companies
+            for day, count in days:
+                uploads_by_day[day] = uploads_by_day.get(day, 0) + count
+        return {
+            **totals,
+            'supplier_count': len(suppliers),
+            'company_count': len(companies),
+            'recent_uploads': uploads_by_day.get(today, 0),
+            'uploads_by_day': dict(sorted(uploads_by_day.items())) if since else None
+        }
+
+    def search(self, text, limit=20, offset=0):
+        """search_invoices over all databases, merged by rank
+
+        bm25 statistics are per database, so ranks from different shards are
+        comparable only approximately.
+        """
+        found = self.fan_out(search_invoices, text, limit + offset, 0)
+        results = sorted((row for shard in found for row in shard['results']), key=lambda row: row['rank'])
+        return {'total': sum(shard['total'] for shard in found), 'results': results[offset:offset + limit]}
+
+    def list_shards(self):
+        """Routing table with each shard's invoice count"""
+        conn = get_db_connection(self.catalog_path)
+        try:
+            rows = [dict(row) for row in conn.execute('''
+                SELECT r.shard_no, r.company_id, c.name AS company_name, r.db_file, r.created_at
+                FROM company_shards r LEFT JOIN companies c ON c.id = r.company_id
+                ORDER BY r.shard_no
+            ''').fetchall()]
+        finally:
+            conn.close()
+
+        def count(path):
+            conn = get_db_connection(path)
+            try:
+                row = conn.execute('SELECT invoice_count FROM dashboard_stats WHERE id = 1').fetchone()
+                return row[0] if row else 0
+            finally:
+                conn.close()
+
+        counts = self.map(count, [self._paths[row['shard_no']] for row in rows])
+        for row, invoice_count in zip(rows, counts):
+            row['invoice_count'] = invoice_count
+        return rows
+
+def _pending_id(file_data):
+    try:
+        return int(file_data.get('pending_id'))
+    except (TypeError, ValueError):
+        return None
+
+def _reindex(result, files):
+    """Map a group's positions back to positions in the request"""
+    for entry in result['finalized'] + result['errors']:
+        entry['index'] = files[entry['index']][0]
+    return result
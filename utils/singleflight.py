@@ -0,0 +1,77 @@
+import threading
+import logging
+
+# Setup logging
+log = logging.getLogger(__name__)
+
+class _Call:
+    """An in-flight computation that followers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running wait and receive the same result, or
+    the same exception. Once the call finishes the key is forgotten, so later
+    calls run again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'executions': 0, 'shared': 0}
+
+    def do(self, key, func, *args, **kwargs):
+        """Run `func` for `key`, or wait for the in-flight run with the same key
+
+        Returns:
+            tuple: (result, shared) where shared is True for followers
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self._stats['shared'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executions'] += 1
+                leader = True
+
+        if not leader:
+            log.info(f"Joining in-flight work for {key[:12] if isinstance(key, str) else key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """Number of keys currently being computed"""
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self):
+        """Return execution and sharing counters"""
+        with self._lock:
+            return {**self._stats, 'in_flight': len(self._calls)}
+
+# Shared instance for invoice extraction, keyed by file content hash
+extraction_flight = SingleFlight()
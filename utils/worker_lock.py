@@ -0,0 +1,29 @@
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks
+    fcntl = None
+
+def worker_lock_path(db_path):
+    """Lock file held by the app process that runs the background jobs for db_path"""
+    return db_path + '.workers.lock'
+
+def try_worker_lock(db_path):
+    """Take the worker lock for db_path without waiting
+
+    The app process holding it runs the deployment-wide background jobs;
+    offline tools (restore) take it to make sure the app is stopped.
+    Without fcntl nothing is actually locked.
+
+    Returns:
+        file: The open lock file, held until it is closed; None if another
+              process holds the lock
+    """
+    lock_file = open(worker_lock_path(db_path), 'a')
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file